@@ -0,0 +1,116 @@
+"""Checkpoints of optimization runs, so a long run that dies can be resumed.
+
+A checkpoint holds everything an engine's search loop carries from one
+iteration to the next: the current and best layouts, scores, counters, stats
+and the state of both random number generators (Python's and NumPy's global
+ones, which the engines draw from). Resuming from it continues the run exactly
+as if it had never stopped, for runs bounded by iterations. Time-limited runs
+resume with the time they had left.
+
+Checkpoints use the project file container (see project.py) under their own
+magic: scalars go in the JSON header, layouts in packed arrays. Slots are
+stored as shapely ragged arrays, so holes and exact coordinates survive. A
+checkpoint is written to a temporary file that is then renamed over the old
+one, so the file on disk is always a complete checkpoint.
+"""
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+import numpy as np
+import shapely
+from project import save_container, load_arrays
+
+MAGIC = b"BFCK"
+VERSION = 1
+CHECKPOINT_INTERVAL = 5.0  # seconds between checkpoint writes
+
+@dataclass
+class Checkpoint:
+    engine: str
+    iteration: int  # next iteration to run
+    elapsed: float  # seconds the run had been going
+    state: dict = field(default_factory=dict)  # engine scalars and stats, JSON-serializable
+    arrays: Dict[str, np.ndarray] = field(default_factory=dict)
+    random_state: Optional[tuple] = None
+    numpy_state: Optional[tuple] = None
+
+    def capture_rng(self) -> "Checkpoint":
+        self.random_state = random.getstate()
+        self.numpy_state = np.random.get_state()
+        return self
+
+    def restore_rng(self):
+        random.setstate(self.random_state)
+        np.random.set_state(self.numpy_state)
+
+    def add_slots(self, name, slots):
+        """Store a list of polygons under name"""
+        _, coords, (rings, polygons) = shapely.to_ragged_array(np.array(slots, dtype=object))
+        self.arrays[f"{name}_coords"] = coords
+        self.arrays[f"{name}_rings"] = rings
+        self.arrays[f"{name}_polygons"] = polygons
+
+    def slots(self, name) -> List:
+        a = self.arrays
+        offsets = (a[f"{name}_rings"], a[f"{name}_polygons"])
+        return list(shapely.from_ragged_array(shapely.GeometryType.POLYGON, a[f"{name}_coords"], offsets))
+
+def save_checkpoint(path, checkpoint: Checkpoint):
+    """Atomically replace the checkpoint at path"""
+    generator, keys, position, has_gauss, cached_gaussian = checkpoint.numpy_state
+    header = {
+        "version": VERSION,
+        "engine": checkpoint.engine,
+        "iteration": checkpoint.iteration,
+        "elapsed": checkpoint.elapsed,
+        "state": checkpoint.state,
+        "random_state": checkpoint.random_state,
+        "numpy_state": [generator, position, has_gauss, cached_gaussian],
+    }
+    save_container(path, header, {**checkpoint.arrays, "numpy_keys": keys}, MAGIC)
+
+def load_checkpoint(path, engine) -> Checkpoint:
+    """Read a checkpoint written by the given engine"""
+    header, arrays = load_arrays(path, MAGIC, VERSION, "checkpoint")
+    if header["engine"] != engine:
+        raise ValueError(f"Checkpoint is from the {header['engine']} engine, not {engine}")
+    # Copy out of the memory map, the file may be replaced while we run
+    arrays = {name: np.array(array) for name, array in arrays.items()}
+    generator, position, has_gauss, cached_gaussian = header["numpy_state"]
+    # JSON turns the tuples of random.getstate() into lists
+    random_version, internal, gauss_next = header["random_state"]
+    return Checkpoint(
+        header["engine"], header["iteration"], header["elapsed"], header["state"], arrays,
+        (random_version, tuple(internal), gauss_next),
+        (generator, arrays.pop("numpy_keys"), position, has_gauss, cached_gaussian),
+    )
+
+def resume_from(path, resume, engine) -> Optional[Checkpoint]:
+    """The checkpoint to resume from: the one at path if resume is set and it
+    exists, else None to start afresh"""
+    if not (path and resume and os.path.exists(path)):
+        return None
+    return load_checkpoint(path, engine)
+
+def checkpointer_for(path, interval) -> Optional["Checkpointer"]:
+    return Checkpointer(path, interval) if path else None
+
+class Checkpointer:
+    """Writes a run's checkpoints to path at most every interval seconds"""
+
+    def __init__(self, path, interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.last = time.monotonic()
+
+    def maybe_save(self, make: Callable[[], Checkpoint]) -> bool:
+        """Save the checkpoint built by make if one is due. Building it is
+        skipped otherwise, so this is cheap to call every iteration."""
+        now = time.monotonic()
+        if now - self.last < self.interval:
+            return False
+        save_checkpoint(self.path, make().capture_rng())
+        self.last = now
+        return True
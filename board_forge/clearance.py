@@ -0,0 +1,275 @@
+"""Polygon clearance kernel over packed coordinate arrays.
+
+Usage: python clearance.py [--slots 200] [--repeat 5]
+
+Distances between many pairs of small polygons are computed in one call
+instead of one shapely call per pair. Two polygons are 0 apart if an edge of
+one properly crosses an edge of the other or one contains a vertex of the
+other (even-odd rule over all rings, so holes work); otherwise their distance
+is the smallest vertex-to-edge distance, using GEOS's point-to-segment formula
+so results match shapely's distance().
+
+The kernel is compiled with Numba (see clearance_jit.py) when it is
+installed. The pure NumPy version gives the same results but is slower than
+shapely's own vectorized distance(), so without Numba the "auto" backend uses
+that instead. Numba is only imported on first use, so it doesn't slow down
+startup. Run this file to benchmark the backends against shapely.
+"""
+import importlib.util
+import numpy as np
+import shapely
+
+NUMBA_AVAILABLE = importlib.util.find_spec("numba") is not None
+# Edge pairs handled per NumPy batch, bounding temporary memory
+BATCH_ROWS = 1 << 18
+
+class PackedPolygons:
+    """Ring coordinates of many polygons in flat arrays.
+
+    coords holds every ring (closed) of every polygon in order, polygon i's
+    coordinates being coords[coord_offsets[i]:coord_offsets[i + 1]]. Its edges
+    start at coords[seg_starts[seg_offsets[i]:seg_offsets[i + 1]]].
+    """
+
+    def __init__(self, geoms, coords, coord_offsets, seg_starts, seg_offsets):
+        self.geoms = geoms
+        self._moved = False  # geoms are stale after translate()
+        self.coords = coords
+        self.coord_offsets = coord_offsets
+        self.seg_starts = seg_starts
+        self.seg_offsets = seg_offsets
+
+    @classmethod
+    def from_slots(cls, slots) -> "PackedPolygons":
+        geoms = np.empty(len(slots), dtype=object)
+        geoms[:] = slots
+        coords = shapely.get_coordinates(geoms)
+        coord_offsets = np.zeros(len(geoms) + 1, dtype=np.int64)
+        np.cumsum(shapely.get_num_coordinates(geoms), out=coord_offsets[1:])
+        if np.any(shapely.get_num_interior_rings(geoms)):
+            ring_ends = np.cumsum(shapely.get_num_coordinates(shapely.get_rings(geoms))) - 1
+        else:
+            ring_ends = coord_offsets[1:] - 1  # building ring geometries is slow, skip it if we can
+        # Every coordinate starts an edge except each ring's closing point
+        is_start = np.ones(len(coords), dtype=bool)
+        is_start[ring_ends] = False
+        seg_starts = np.flatnonzero(is_start)
+        seg_offsets = np.searchsorted(seg_starts, coord_offsets)
+        return cls(geoms, coords, coord_offsets, seg_starts, seg_offsets)
+
+    def translate(self, i, dx, dy):
+        """Move polygon i in place"""
+        self.coords[self.coord_offsets[i]:self.coord_offsets[i + 1]] += (dx, dy)
+        self._moved = True
+
+    def current_geoms(self) -> np.ndarray:
+        if self._moved:
+            self.geoms = shapely.set_coordinates(self.geoms.copy(), self.coords)
+            self._moved = False
+        return self.geoms
+
+    def to_slots(self) -> list:
+        """Polygons with the current coordinates"""
+        return list(self.current_geoms())
+
+    def distances(self, first, second, backend="auto", stop_below=-np.inf) -> np.ndarray:
+        """Distance between polygons first[k] and second[k] for every k, with
+        backend "numba", "numpy", "shapely" or "auto" (Numba if installed, else
+        shapely). The Numba kernel may stop at the first distance below
+        stop_below, returning only the distances up to and including it."""
+        first = np.asarray(first, dtype=np.int64)
+        second = np.asarray(second, dtype=np.int64)
+        if backend == "auto":
+            backend = "numba" if NUMBA_AVAILABLE else "shapely"
+        if backend == "shapely":
+            geoms = self.current_geoms()
+            return shapely.distance(geoms[first], geoms[second])
+        if backend == "numba":
+            kernel = numba_kernel()
+            out = np.empty(len(first))
+            count = kernel(self.coords, self.coord_offsets, self.seg_starts, self.seg_offsets, first, second, out, stop_below)
+            return out[:count]
+        return numpy_distances(self.coords, self.coord_offsets, self.seg_starts, self.seg_offsets, first, second)
+
+    def distance(self, i, j) -> float:
+        """Distance between polygons i and j"""
+        return float(self.distances([i], [j])[0])
+
+def _sweep_pairs(lows, highs, max_distance):
+    """Index pairs (i, j), i != j, whose intervals [lows, highs] are closer
+    than max_distance, found by sorting on lows: each interval only needs
+    pairing with the ones starting before it ends (plus max_distance)"""
+    order = np.argsort(lows, kind="stable")
+    sorted_lows = lows[order]
+    ends = np.searchsorted(sorted_lows, highs[order] + max_distance, side="left")
+    counts = np.maximum(ends - np.arange(1, len(order) + 1), 0)
+    first = np.repeat(np.arange(len(order)), counts)
+    # Offset of each pair within its run of counts, added to the run's start + 1
+    second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return order[first], order[second]
+
+def candidate_pairs(bounds, max_distance):
+    """Index pairs (i < j) whose bounding boxes are closer than max_distance.
+    Box distance is a lower bound on polygon distance, so no other pair can be.
+    Pairs are found by sort-and-sweep along whichever axis the boxes overlap
+    least on, so the work grows with the number of nearby pairs, not n^2."""
+    if len(bounds) < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    spans = []
+    for axis in (0, 1):
+        lows = np.sort(bounds[:, axis])
+        ends = np.searchsorted(lows, np.sort(bounds[:, axis + 2]) + max_distance, side="left")
+        spans.append(ends.sum())
+    axis = int(np.argmin(spans))
+    i, j = _sweep_pairs(bounds[:, axis], bounds[:, axis + 2], max_distance)
+    gap_x = np.maximum(bounds[j, 0] - bounds[i, 2], bounds[i, 0] - bounds[j, 2])
+    gap_y = np.maximum(bounds[j, 1] - bounds[i, 3], bounds[i, 1] - bounds[j, 3])
+    close = np.hypot(np.maximum(gap_x, 0), np.maximum(gap_y, 0)) < max_distance
+    i, j = np.minimum(i[close], j[close]), np.maximum(i[close], j[close])
+    order = np.lexsort((j, i))
+    return i[order], j[order]
+
+def neighbour_pairs(bounds, idx, max_distance):
+    """Pairs (idx, j) whose bounding boxes are closer than max_distance"""
+    b = bounds[idx]
+    gap_x = np.maximum(bounds[:, 0] - b[2], b[0] - bounds[:, 2])
+    gap_y = np.maximum(bounds[:, 1] - b[3], b[1] - bounds[:, 3])
+    close = np.hypot(np.maximum(gap_x, 0), np.maximum(gap_y, 0)) < max_distance
+    close[idx] = False
+    second = np.flatnonzero(close)
+    return np.full(len(second), idx), second
+
+def point_segment_distance(px, py, ax, ay, bx, by):
+    """GEOS's Distance::pointToSegment, elementwise"""
+    dx, dy = bx - ax, by - ay
+    len2 = dx * dx + dy * dy
+    degenerate = len2 == 0
+    len2 = np.where(degenerate, 1.0, len2)
+    r = ((px - ax) * dx + (py - ay) * dy) / len2
+    s = ((ay - py) * dx - (ax - px) * dy) / len2
+    to_a = np.sqrt((px - ax) ** 2 + (py - ay) ** 2)
+    to_b = np.sqrt((px - bx) ** 2 + (py - by) ** 2)
+    return np.where(degenerate | (r <= 0), to_a, np.where(r >= 1, to_b, np.abs(s) * np.sqrt(len2)))
+
+def ray_crossings(px, py, ax, ay, bx, by):
+    """Whether edge a-b crosses the ray from p towards +x"""
+    straddles = (ay > py) != (by > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at = ax + (py - ay) * (bx - ax) / (by - ay)
+    return straddles & (px < x_at)
+
+def numpy_distances(coords, coord_offsets, seg_starts, seg_offsets, first, second) -> np.ndarray:
+    out = np.empty(len(first))
+    na = seg_offsets[first + 1] - seg_offsets[first]
+    nb = seg_offsets[second + 1] - seg_offsets[second]
+    rows = na * nb
+    ends = np.cumsum(rows)
+    start = 0
+    while start < len(first):
+        # Take pairs up to BATCH_ROWS edge pairs in all, and at least one
+        done = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, done + BATCH_ROWS, side="right")), start + 1)
+        batch = slice(start, stop)
+        out[batch] = _numpy_batch(coords, seg_starts, seg_offsets, first[batch], second[batch], nb[batch], rows[batch])
+        start = batch.stop
+    return out
+
+def _numpy_batch(coords, seg_starts, seg_offsets, first, second, nb, rows):
+    # One row per (edge k of a, edge j of b) of every pair
+    pair = np.repeat(np.arange(len(first)), rows)
+    row_starts = np.zeros(len(first), dtype=np.int64)
+    np.cumsum(rows[:-1], out=row_starts[1:])
+    local = np.arange(len(pair)) - row_starts[pair]
+    k, j = np.divmod(local, nb[pair])
+    sa = seg_starts[seg_offsets[first][pair] + k]
+    sb = seg_starts[seg_offsets[second][pair] + j]
+    a0x, a0y = coords[sa, 0], coords[sa, 1]
+    a1x, a1y = coords[sa + 1, 0], coords[sa + 1, 1]
+    b0x, b0y = coords[sb, 0], coords[sb, 1]
+    b1x, b1y = coords[sb + 1, 0], coords[sb + 1, 1]
+
+    # Each polygon's vertices are its edges' start points
+    d = np.minimum(point_segment_distance(b0x, b0y, a0x, a0y, a1x, a1y),
+                   point_segment_distance(a0x, a0y, b0x, b0y, b1x, b1y))
+    result = np.minimum.reduceat(d, row_starts)
+
+    # Proper crossings; touching and collinear overlaps already give distance 0
+    o1 = (b1x - b0x) * (a0y - b0y) - (b1y - b0y) * (a0x - b0x)
+    o2 = (b1x - b0x) * (a1y - b0y) - (b1y - b0y) * (a1x - b0x)
+    o3 = (a1x - a0x) * (b0y - a0y) - (a1y - a0y) * (b0x - a0x)
+    o4 = (a1x - a0x) * (b1y - a0y) - (a1y - a0y) * (b1x - a0x)
+    crossed = np.bincount(pair, weights=(o1 * o2 < 0) & (o3 * o4 < 0), minlength=len(first)) > 0
+
+    # Containment: first vertex of b against every edge of a (rows with j == 0),
+    # and first vertex of a against every edge of b (rows with k == 0)
+    m = j == 0
+    inside_a = np.bincount(pair[m], weights=ray_crossings(b0x[m], b0y[m], a0x[m], a0y[m], a1x[m], a1y[m]),
+                           minlength=len(first)) % 2 == 1
+    m = k == 0
+    inside_b = np.bincount(pair[m], weights=ray_crossings(a0x[m], a0y[m], b0x[m], b0y[m], b1x[m], b1y[m]),
+                           minlength=len(first)) % 2 == 1
+    result[crossed | inside_a | inside_b] = 0.0
+    return result
+
+def numba_kernel():
+    """The compiled kernel, imported on first use (compiled once, then loaded
+    from Numba's on-disk cache)"""
+    from board_forge.clearance_jit import distance_kernel
+    return distance_kernel
+
+def min_clearance_ok(slots, bounds, min_distance) -> bool:
+    """Whether every pair of slots is at least min_distance apart, checking only
+    pairs whose (n, 4) bounds are close enough to matter, in one kernel call"""
+    if len(slots) < 2:
+        return True
+    first, second = candidate_pairs(bounds, min_distance)
+    return pairs_clear(slots, first, second, min_distance)
+
+def pairs_clear(slots, first, second, min_distance) -> bool:
+    """Whether slots first[k] and second[k] are at least min_distance apart for
+    every k, packing only the slots that appear in a pair"""
+    if not len(first):
+        return True
+    involved, inverse = np.unique(np.concatenate([first, second]), return_inverse=True)
+    packed = PackedPolygons.from_slots([slots[i] for i in involved])
+    distances = packed.distances(inverse[:len(first)], inverse[len(first):], stop_below=min_distance)
+    return bool(np.all(distances >= min_distance))
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+    from shapely.affinity import translate
+    from data.sample_pieces import SAMPLE_PIECES, get_piece
+
+    ap = argparse.ArgumentParser(description="Benchmark the clearance kernel against shapely")
+    ap.add_argument("--slots", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    random.seed(0)
+    names = list(SAMPLE_PIECES)
+    side = 12 * args.slots ** 0.5
+    slots = [translate(get_piece(random.choice(names), 0.5), random.uniform(0, side), random.uniform(0, side))
+             for _ in range(args.slots)]
+    first, second = np.triu_indices(len(slots), k=1)
+    geoms = np.array(slots, dtype=object)
+    print(f"{args.slots} slots, {len(first)} pairs, numba {'available' if NUMBA_AVAILABLE else 'not installed'}")
+
+    def timed(fn):
+        fn()  # warm up (and compile)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            result = fn()
+        return result, (time.perf_counter() - start) / args.repeat
+
+    reference, t_loop = timed(lambda: np.array([slots[i].distance(slots[j]) for i, j in zip(first, second)]))
+    _, t_vector = timed(lambda: shapely.distance(geoms[first], geoms[second]))
+    print(f"{'shapely, per pair':<24}{t_loop * 1000:>10.1f} ms")
+    print(f"{'shapely, vectorized':<24}{t_vector * 1000:>10.1f} ms")
+    backends = ["numpy"] + (["numba"] if NUMBA_AVAILABLE else [])
+    for backend in backends:
+        result, t = timed(lambda: PackedPolygons.from_slots(slots).distances(first, second, backend))
+        error = np.abs(result - reference).max()
+        print(f"{backend + ' kernel':<24}{t * 1000:>10.1f} ms  {t_loop / t:>6.1f}x  max error {error:.1e} mm")
@@ -0,0 +1,107 @@
+"""Numba-compiled kernels for clearance.py and convex.py, kept in their own
+module so Numba is only imported when a kernel is first needed. Same
+arithmetic as their NumPy versions, one pair at a time."""
+import numba
+import numpy as np
+
+@numba.njit(cache=True, inline="always")
+def point_segment(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    len2 = dx * dx + dy * dy
+    if len2 == 0:
+        return np.sqrt((px - ax) ** 2 + (py - ay) ** 2)
+    r = ((px - ax) * dx + (py - ay) * dy) / len2
+    if r <= 0:
+        return np.sqrt((px - ax) ** 2 + (py - ay) ** 2)
+    if r >= 1:
+        return np.sqrt((px - bx) ** 2 + (py - by) ** 2)
+    s = ((ay - py) * dx - (ax - px) * dy) / len2
+    return abs(s) * np.sqrt(len2)
+
+@numba.njit(cache=True, inline="always")
+def crosses_ray(px, py, ax, ay, bx, by):
+    return (ay > py) != (by > py) and px < ax + (py - ay) * (bx - ax) / (by - ay)
+
+@numba.njit(cache=True)
+def distance_kernel(coords, coord_offsets, seg_starts, seg_offsets, first, second, out, stop_below):
+    """Fill out[p] with the distance between polygons first[p] and second[p].
+    Stops after the first pair closer than stop_below; returns the number of
+    pairs filled."""
+    for p in range(len(first)):
+        a, b = first[p], second[p]
+        best = np.inf
+        crossings_a = 0  # of b's first vertex with a's edges
+        crossings_b = 0
+        pax, pay = coords[coord_offsets[a], 0], coords[coord_offsets[a], 1]
+        pbx, pby = coords[coord_offsets[b], 0], coords[coord_offsets[b], 1]
+        for k in range(seg_offsets[a], seg_offsets[a + 1]):
+            s = seg_starts[k]
+            a0x, a0y, a1x, a1y = coords[s, 0], coords[s, 1], coords[s + 1, 0], coords[s + 1, 1]
+            if crosses_ray(pbx, pby, a0x, a0y, a1x, a1y):
+                crossings_a += 1
+            for t in range(seg_offsets[b], seg_offsets[b + 1]):
+                u = seg_starts[t]
+                b0x, b0y, b1x, b1y = coords[u, 0], coords[u, 1], coords[u + 1, 0], coords[u + 1, 1]
+                o1 = (b1x - b0x) * (a0y - b0y) - (b1y - b0y) * (a0x - b0x)
+                o2 = (b1x - b0x) * (a1y - b0y) - (b1y - b0y) * (a1x - b0x)
+                o3 = (a1x - a0x) * (b0y - a0y) - (a1y - a0y) * (b0x - a0x)
+                o4 = (a1x - a0x) * (b1y - a0y) - (a1y - a0y) * (b1x - a0x)
+                if o1 * o2 < 0 and o3 * o4 < 0:
+                    best = 0.0
+                    break
+                best = min(best, point_segment(b0x, b0y, a0x, a0y, a1x, a1y),
+                           point_segment(a0x, a0y, b0x, b0y, b1x, b1y))
+            if best == 0.0:
+                break
+        if best > 0.0:
+            for t in range(seg_offsets[b], seg_offsets[b + 1]):
+                u = seg_starts[t]
+                if crosses_ray(pax, pay, coords[u, 0], coords[u, 1], coords[u + 1, 0], coords[u + 1, 1]):
+                    crossings_b += 1
+            if crossings_a % 2 == 1 or crossings_b % 2 == 1:
+                best = 0.0
+        out[p] = best
+        if best < stop_below:
+            return p + 1
+    return len(first)
+
+@numba.njit(cache=True)
+def sat_kernel(vertices, normals, starts, first, second, min_distance):
+    """Index of the first convex part pair (first[p], second[p]) closer than
+    min_distance, or -1. See convex.ConvexParts for the layout."""
+    for p in range(len(first)):
+        a, b = first[p], second[p]
+        separation = -np.inf
+        for side in range(2):
+            owner = a if side == 0 else b
+            for k in range(starts[owner], starts[owner + 1]):
+                nx, ny = normals[k, 0], normals[k, 1]
+                min_a, max_a, min_b, max_b = np.inf, -np.inf, np.inf, -np.inf
+                for v in range(starts[a], starts[a + 1]):
+                    d = vertices[v, 0] * nx + vertices[v, 1] * ny
+                    min_a, max_a = min(min_a, d), max(max_a, d)
+                for v in range(starts[b], starts[b + 1]):
+                    d = vertices[v, 0] * nx + vertices[v, 1] * ny
+                    min_b, max_b = min(min_b, d), max(max_b, d)
+                separation = max(separation, min_b - max_a, min_a - max_b)
+                if separation >= min_distance:
+                    break
+            if separation >= min_distance:
+                break
+        if separation >= min_distance:
+            continue
+        if separation <= 0:
+            return p  # no separating axis: the parts overlap or touch
+        # Closest features are two vertices: measure vertex to edge
+        distance = np.inf
+        for side in range(2):
+            edge_owner, point_owner = (a, b) if side == 0 else (b, a)
+            first_vertex, last_vertex = starts[edge_owner], starts[edge_owner + 1] - 1
+            for k in range(first_vertex, last_vertex + 1):
+                nxt = k + 1 if k < last_vertex else first_vertex
+                for v in range(starts[point_owner], starts[point_owner + 1]):
+                    distance = min(distance, point_segment(vertices[v, 0], vertices[v, 1], vertices[k, 0],
+                                                           vertices[k, 1], vertices[nxt, 0], vertices[nxt, 1]))
+        if distance < min_distance:
+            return p
+    return -1
@@ -0,0 +1,270 @@
+"""Convex decomposition of slots and separating-axis clearance tests.
+
+Each distinct piece outline is split once into a few convex parts (ear
+clipping, then Hertel-Mehlhorn merging of the triangles). Parts are stored as
+vertex index lists, which don't change when a piece is moved or rotated, so
+they are cached under a key that doesn't either: the outline's sequence of
+edge lengths and turns. Every copy of a piece on the board shares one
+decomposition.
+
+Two convex parts are at least `d` apart when their projections onto one of
+their edge normals are separated by at least `d`. That settles nearly every
+pair. If no edge normal separates them they overlap. Otherwise the closest
+features are two vertices, and the exact distance is computed. Two slots are
+clear when all their part pairs are, and checking stops at the first
+violation.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import shapely
+from board_forge.clearance import NUMBA_AVAILABLE, candidate_pairs, neighbour_pairs, pairs_clear, point_segment_distance
+
+# Decompositions by outline key; bounded so pieces scaled to many sizes can't grow it forever
+PARTS_CACHE: Dict[bytes, Tuple[np.ndarray, np.ndarray]] = {}
+PARTS_CACHE_SIZE = 4096
+# Part pairs checked per NumPy batch between early-exit checks
+BATCH_PAIRS = 512
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+def _in_triangle(p, a, b, c):
+    return _cross(a, b, p) >= 0 and _cross(b, c, p) >= 0 and _cross(c, a, p) >= 0
+
+def triangulate(points: np.ndarray, eps=1e-9) -> List[List[int]]:
+    """Ear-clipping triangulation of a simple counter-clockwise polygon
+    without collinear vertices"""
+    remaining = list(range(len(points)))
+    triangles = []
+    while len(remaining) > 3:
+        n = len(remaining)
+        for k in range(n):
+            i, j, l = remaining[k - 1], remaining[k], remaining[(k + 1) % n]
+            a, b, c = points[i], points[j], points[l]
+            if _cross(a, b, c) <= eps:
+                continue  # reflex vertex
+            if any(_in_triangle(points[m], a, b, c) for m in remaining if m not in (i, j, l)):
+                continue
+            triangles.append([i, j, l])
+            del remaining[k]
+            break
+        else:
+            raise ValueError("polygon is not simple")
+    triangles.append(remaining)
+    return triangles
+
+def _is_convex(points, ring, eps=1e-9):
+    n = len(ring)
+    return all(_cross(points[ring[k - 1]], points[ring[k]], points[ring[(k + 1) % n]]) >= -eps for k in range(n))
+
+def convex_partition(points: np.ndarray) -> List[List[int]]:
+    """Hertel-Mehlhorn: triangulate, then remove diagonals while the two
+    parts they separate merge into a convex polygon"""
+    parts = triangulate(points)
+    merged = True
+    while merged:
+        merged = False
+        for p in range(len(parts)):
+            for q in range(p + 1, len(parts)):
+                a, b = parts[p], parts[q]
+                # A shared diagonal u-v runs u->v in one part and v->u in the other
+                edges_b = {(b[k], b[(k + 1) % len(b)]): k for k in range(len(b))}
+                for k in range(len(a)):
+                    u, v = a[k], a[(k + 1) % len(a)]
+                    if (v, u) not in edges_b:
+                        continue
+                    m = edges_b[(v, u)]
+                    # a up to u, then b from u round to v, then the rest of a from v
+                    b_path = [b[(m + 1 + t) % len(b)] for t in range(len(b) - 1)]
+                    ring = a[:k] + b_path + a[k + 1:]
+                    if _is_convex(points, ring):
+                        parts[p] = ring
+                        del parts[q]
+                        merged = True
+                    break
+                if merged:
+                    break
+            if merged:
+                break
+    return parts
+
+def outline_features(coords: np.ndarray, offsets: np.ndarray, decimals=4) -> np.ndarray:
+    """Squared length and turn (cross product with the next edge) of every
+    edge of the closed rings coords[offsets[s]:offsets[s + 1]], rounded. Ring
+    s's slice [offsets[s]:offsets[s + 1] - 1] is unchanged by translation and
+    rotation, so its bytes key the ring's shape."""
+    edges = np.diff(coords, axis=0, append=coords[:1])
+    following = np.arange(1, len(coords) + 1)
+    following[offsets[1:] - 2] = offsets[:-1]  # each ring's last edge turns into its first
+    lengths = np.einsum("ij,ij->i", edges, edges)
+    turns = edges[:, 0] * edges[following % len(coords), 1] - edges[:, 1] * edges[following % len(coords), 0]
+    return np.round(np.column_stack([lengths, turns]), decimals)
+
+def decompose(coords: np.ndarray) -> List[np.ndarray]:
+    """Convex parts of a closed ring as arrays of indices into it, each
+    counter-clockwise"""
+    ring = np.arange(len(coords) - 1)
+    points = coords[:-1]
+    if shapely.linearrings(coords).is_ccw is False:
+        ring = ring[::-1]
+    # Collinear vertices would make zero-area ears; they don't change the shape
+    prev, nxt = points[np.roll(ring, 1)], points[np.roll(ring, -1)]
+    here = points[ring]
+    turn = (here[:, 0] - prev[:, 0]) * (nxt[:, 1] - here[:, 1]) - (here[:, 1] - prev[:, 1]) * (nxt[:, 0] - here[:, 0])
+    ring = ring[np.abs(turn) > 1e-9 * np.hypot(*(here - prev).T) * np.hypot(*(nxt - here).T)]
+    parts = convex_partition(points[ring])
+    return [ring[part] for part in parts]
+
+def slot_parts(coords: np.ndarray, key: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """Cached convex parts of one slot's closed exterior ring, by outline key,
+    as the parts' vertex indices run together and the parts' sizes"""
+    parts = PARTS_CACHE.get(key)
+    if parts is None:
+        pieces = decompose(coords)
+        parts = np.concatenate(pieces), np.array([len(p) for p in pieces])
+        if len(PARTS_CACHE) >= PARTS_CACHE_SIZE:
+            PARTS_CACHE.pop(next(iter(PARTS_CACHE)))
+        PARTS_CACHE[key] = parts
+    return parts
+
+class ConvexParts:
+    """Convex parts of every slot in flat arrays.
+
+    Part p's vertices are vertices[starts[p]:starts[p + 1]], counter-clockwise,
+    with normals[k] the outward unit normal of the edge from vertex k to the
+    next one. Slot s owns parts slot_offsets[s]:slot_offsets[s + 1].
+    """
+
+    def __init__(self, vertices, normals, starts, slot_offsets, bounds):
+        self.vertices = vertices
+        self.normals = normals
+        self.starts = starts
+        self.slot_offsets = slot_offsets
+        self.bounds = bounds
+
+    @classmethod
+    def from_slots(cls, slots) -> Optional["ConvexParts"]:
+        """None if any slot has holes or isn't simple, which the decomposition
+        doesn't handle"""
+        geoms = np.empty(len(slots), dtype=object)
+        geoms[:] = slots
+        if np.any(shapely.get_num_interior_rings(geoms)):
+            return None
+        coords = shapely.get_coordinates(geoms)
+        offsets = np.zeros(len(geoms) + 1, dtype=np.int64)
+        np.cumsum(shapely.get_num_coordinates(geoms), out=offsets[1:])
+        features = outline_features(coords, offsets)
+        indices, part_sizes = [], []
+        try:
+            for s in range(len(geoms)):
+                start, end = offsets[s], offsets[s + 1]
+                index, sizes = slot_parts(coords[start:end], features[start:end - 1].tobytes())
+                indices.append(index + start)
+                part_sizes.append(sizes)
+        except ValueError:
+            return None
+        sizes = np.concatenate(part_sizes)
+        starts = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=starts[1:])
+        vertices = coords[np.concatenate(indices)]
+        # Next vertex within the same part, wrapping around
+        following = np.arange(1, len(vertices) + 1)
+        following[starts[1:] - 1] = starts[:-1]
+        edges = vertices[following] - vertices
+        normals = np.column_stack([edges[:, 1], -edges[:, 0]]) / np.hypot(edges[:, 0], edges[:, 1])[:, None]
+        slot_offsets = np.zeros(len(geoms) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in part_sizes], out=slot_offsets[1:])
+        bounds = np.hstack([np.minimum.reduceat(vertices, starts[:-1]), np.maximum.reduceat(vertices, starts[:-1])])
+        return cls(vertices, normals, starts, slot_offsets, bounds)
+
+    def part_pairs(self, first, second, min_distance) -> Tuple[np.ndarray, np.ndarray]:
+        """Part pairs of the given slot pairs whose boxes are closer than min_distance"""
+        counts_a = np.diff(self.slot_offsets)[first]
+        counts_b = np.diff(self.slot_offsets)[second]
+        rows = counts_a * counts_b
+        pair = np.repeat(np.arange(len(first)), rows)
+        row_starts = np.zeros(len(first), dtype=np.int64)
+        np.cumsum(rows[:-1], out=row_starts[1:])
+        k, j = np.divmod(np.arange(len(pair)) - row_starts[pair], counts_b[pair])
+        pa = self.slot_offsets[first][pair] + k
+        pb = self.slot_offsets[second][pair] + j
+        ba, bb = self.bounds[pa], self.bounds[pb]
+        gap_x = np.maximum(bb[:, 0] - ba[:, 2], ba[:, 0] - bb[:, 2])
+        gap_y = np.maximum(bb[:, 1] - ba[:, 3], ba[:, 1] - bb[:, 3])
+        close = np.hypot(np.maximum(gap_x, 0), np.maximum(gap_y, 0)) < min_distance
+        return pa[close], pb[close]
+
+    def padded(self, parts):
+        """(len(parts), m) vertex and normal arrays, short parts padded by
+        repeating their last vertex and normal, which changes no projection"""
+        sizes = self.starts[parts + 1] - self.starts[parts]
+        m = int(sizes.max())
+        index = self.starts[parts][:, None] + np.minimum(np.arange(m), sizes[:, None] - 1)
+        return self.vertices[index], self.normals[index]
+
+    def pairs_clear(self, pa, pb, min_distance) -> np.ndarray:
+        """Whether each convex part pair is at least min_distance apart"""
+        va, na = self.padded(pa)
+        vb, nb = self.padded(pb)
+        axes = np.concatenate([na, nb], axis=1)
+        proj_a = np.einsum("pvc,pac->pva", va, axes)
+        proj_b = np.einsum("pvc,pac->pva", vb, axes)
+        gaps = np.maximum(proj_b.min(axis=1) - proj_a.max(axis=1), proj_a.min(axis=1) - proj_b.max(axis=1))
+        separation = gaps.max(axis=1)
+        clear = separation >= min_distance
+        # Separated, but not by min_distance along any edge normal: the closest
+        # features are two vertices, so measure vertex to edge
+        close = (separation > 0) & ~clear
+        if close.any():
+            va, vb = va[close], vb[close]
+            # With the padding, rolling gives the real edges, the closing edge
+            # and zero-length edges at the repeated vertex
+            ea, eb = np.roll(va, -1, axis=1), np.roll(vb, -1, axis=1)
+            d_ab = point_segment_distance(vb[:, None, :, 0], vb[:, None, :, 1],
+                                          va[:, :, None, 0], va[:, :, None, 1], ea[:, :, None, 0], ea[:, :, None, 1])
+            d_ba = point_segment_distance(va[:, None, :, 0], va[:, None, :, 1],
+                                          vb[:, :, None, 0], vb[:, :, None, 1], eb[:, :, None, 0], eb[:, :, None, 1])
+            distance = np.minimum(d_ab.min(axis=(1, 2)), d_ba.min(axis=(1, 2)))
+            clear[close] = distance >= min_distance
+        return clear
+
+    def all_clear(self, first, second, min_distance) -> bool:
+        """Whether every slot pair (first[k], second[k]) is at least
+        min_distance apart, stopping at the first violation"""
+        pa, pb = self.part_pairs(first, second, min_distance)
+        if NUMBA_AVAILABLE:
+            from board_forge.clearance_jit import sat_kernel
+            return sat_kernel(self.vertices, self.normals, self.starts, pa, pb, min_distance) < 0
+        for start in range(0, len(pa), BATCH_PAIRS):
+            batch = slice(start, start + BATCH_PAIRS)
+            if not self.pairs_clear(pa[batch], pb[batch], min_distance).all():
+                return False
+        return True
+
+def clearance_ok(slots, bounds, min_distance, only: Optional[int] = None,
+                 halos: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> bool:
+    """Whether every pair of slots (or only every pair with slot `only`) is at
+    least min_distance apart: by SAT on convex parts, or with clearance's
+    distance kernel if a slot has holes.
+
+    halos, if given, maps slot indices to the slots' prepared min_distance / 2
+    buffers. They are only used when a slot has holes, where two intersecting
+    halos reject the design without computing any distance."""
+    if len(slots) < 2:
+        return True
+    if only is None:
+        first, second = candidate_pairs(bounds, min_distance)
+    else:
+        first, second = neighbour_pairs(bounds, only, min_distance)
+    if not len(first):
+        return True
+    # Only slots in some close pair need their parts
+    involved, inverse = np.unique(np.concatenate([first, second]), return_inverse=True)
+    parts = ConvexParts.from_slots([slots[i] for i in involved])
+    if parts is None:
+        # Buffers are polygons inscribed in the true offsets, so intersecting
+        # halos prove a pair too close, but disjoint ones don't prove it clear
+        if halos is not None and shapely.intersects(halos(first), halos(second)).any():
+            return False
+        return pairs_clear(slots, first, second, min_distance)
+    return parts.all_clear(inverse[:len(first)], inverse[len(first):], min_distance)
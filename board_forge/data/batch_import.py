@@ -0,0 +1,111 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+from shapely.geometry import Polygon, box
+from data.measure_cache import MeasurementCache
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+@dataclass
+class ImageResult:
+    path: str
+    shapes: List[Polygon] = field(default_factory=list)
+    seconds: float = 0.0
+    error: Optional[str] = None
+    cached: bool = False
+
+def image_files(folder):
+    """Return the image files directly inside folder, sorted by name"""
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+def measure_image(path, width, num_pieces, coarse=1, max_vertices=None, cache_dir=None) -> ImageResult:
+    """Worker entry point: measure one photo, never raising.
+    Pieces come back as rectangles, or as contour polygons with at most
+    max_vertices vertices when that is given. With a cache_dir, results are
+    looked up in / stored to a MeasurementCache there; a cache that can't be
+    created or written to is skipped rather than failing the import."""
+    # Imported here so the GUI process doesn't pay for OpenCV up front
+    from data.piece_dimensions import piece_dims, piece_polygons, CANNY_LOW, CANNY_HIGH, OUTLINE_VERSION
+    start = time.perf_counter()
+    try:
+        cache = key = None
+        if cache_dir:
+            try:
+                cache = MeasurementCache(cache_dir)
+            except OSError:
+                pass  # the cache is best-effort, measure without it
+        if cache is not None:
+            key = cache.key(path, width=width, num_pieces=num_pieces, coarse=coarse,
+                            mode="polygon" if max_vertices else "box", max_vertices=max_vertices,
+                            canny=[CANNY_LOW, CANNY_HIGH], outline=OUTLINE_VERSION if max_vertices else None)
+            shapes = cache.get(key)
+            if shapes is not None:
+                return ImageResult(path, shapes, time.perf_counter() - start, cached=True)
+        if max_vertices:
+            shapes = piece_polygons(path, width=width, num_pieces=num_pieces,
+                                    max_vertices=max_vertices, coarse=coarse)
+        else:
+            dims = piece_dims(path, width=width, num_pieces=num_pieces, coarse=coarse)
+            shapes = [box(0, 0, w, h) for w, h in dims]
+        if not shapes:
+            raise ValueError("no pieces found")
+        if cache is not None:
+            try:
+                cache.put(key, shapes)
+            except OSError:
+                pass
+        return ImageResult(path, shapes, time.perf_counter() - start)
+    except Exception as e:
+        return ImageResult(path, seconds=time.perf_counter() - start, error=str(e) or type(e).__name__)
+
+class BatchImport:
+    """Measure many photos in a process pool, handing back results as they finish.
+
+    The caller polls with `completed()` (e.g. from a Tk `after` callback), so the
+    UI thread never blocks on image decoding.
+    """
+
+    def __init__(self, paths, width, num_pieces, coarse=1, max_vertices=None, cache_dir=None, max_workers=None):
+        self.total = len(paths)
+        self.results: List[ImageResult] = []
+        self.start = time.perf_counter()
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        self._pending = {self._executor.submit(measure_image, p, width, num_pieces, coarse, max_vertices, cache_dir): p for p in paths}
+
+    @property
+    def done(self) -> bool:
+        return not self._pending
+
+    @property
+    def failures(self) -> List[ImageResult]:
+        return [r for r in self.results if r.error]
+
+    @property
+    def cache_hits(self) -> int:
+        return sum(r.cached for r in self.results)
+
+    def completed(self) -> List[ImageResult]:
+        """Return results that finished since the last call"""
+        finished = [f for f in self._pending if f.done()]
+        new_results = []
+        for future in finished:
+            path = self._pending.pop(future)
+            try:
+                new_results.append(future.result())
+            except Exception as e:  # worker process died
+                new_results.append(ImageResult(path, error=str(e) or type(e).__name__))
+        self.results.extend(new_results)
+        if self.done:
+            self._executor.shutdown(wait=False)
+        return new_results
+
+    def cancel(self):
+        for future in self._pending:
+            future.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._pending = {}
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import struct
+from typing import List, Optional
+import shapely
+from shapely.geometry import Polygon
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "board_forge", "measurements"
+)
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+ENTRY_SUFFIX = ".wkb"
+
+class MeasurementCache:
+    """On-disk cache of image measurements keyed by file content and parameters.
+
+    Each entry is one small file holding the pieces as length-prefixed WKB, so a
+    hit never decodes the image. Entries are evicted least recently used first
+    once the directory grows past max_bytes.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(image_file, **params) -> str:
+        """Hash the image bytes together with the measurement parameters"""
+        digest = hashlib.sha256()
+        with open(image_file, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key) -> Optional[List[Polygon]]:
+        """The cached shapes, or None on a miss. An entry that can't be decoded
+        (truncated by a crash, say) is deleted and counts as a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+        except OSError:
+            return None
+        try:
+            (count,) = struct.unpack_from("<I", data)
+            lengths = struct.unpack_from(f"<{count}I", data, 4)
+            offset = 4 + 4 * count
+            if offset + sum(lengths) != len(data):
+                raise ValueError("entry size doesn't match its header")
+            blobs = []
+            for length in lengths:
+                blobs.append(data[offset:offset + length])
+                offset += length
+            return list(shapely.from_wkb(blobs))
+        except Exception:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def put(self, key, shapes: List[Polygon]):
+        blobs = [bytes(b) for b in shapely.to_wkb(shapes)]
+        data = struct.pack(f"<I{len(blobs)}I", len(blobs), *map(len, blobs)) + b"".join(blobs)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Don't leave a partial temp file behind, evict() never sees those
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(ENTRY_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(ENTRY_SUFFIX):
+                os.remove(entry.path)
@@ -1,97 +1,267 @@
 # import the necessary packages
-from scipy.spatial import distance as dist
-from imutils import perspective
 from imutils import contours
 import numpy as np
 import argparse
 import imutils
+import time
+import os
 import cv2
+from shapely.affinity import translate
+from shapely.geometry import Polygon
 
 disp = False
 
+# Canny hysteresis thresholds used for edge detection
+CANNY_LOW = 50
+CANNY_HIGH = 100
+# Bumped when contour_polygon's output changes, so cached outlines are redone
+OUTLINE_VERSION = 2
+
 def midpoint(ptA, ptB):
     return ((ptA[0] + ptB[0]) * 0.5, (ptA[1] + ptB[1]) * 0.5)
 
-def piece_dims(image_file, width = 19.05, num_pieces=-1):
-    img = cv2.imread(image_file)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    gray = cv2.GaussianBlur(gray, (7, 7), 0)
-    edged = cv2.Canny(gray, 50, 100)
+def order_boxes(boxes):
+    """Vectorized perspective.order_points for an (N, 4, 2) array of box corners.
+    Returns the corners of every box as (tl, tr, br, bl)."""
+    n = len(boxes)
+    rows = np.arange(n)[:, None]
+    x_sorted = boxes[rows, np.argsort(boxes[:, :, 0], axis=1, kind="stable")]
+    left, right = x_sorted[:, :2], x_sorted[:, 2:]
+    left = left[rows, np.argsort(left[:, :, 1], axis=1, kind="stable")]
+    tl, bl = left[:, 0], left[:, 1]
+    # The right-most point furthest from tl is the bottom-right corner
+    d = np.linalg.norm(right - tl[:, None, :], axis=2)
+    right = right[rows, np.argsort(d, axis=1, kind="stable")[:, ::-1]]
+    br, tr = right[:, 0], right[:, 1]
+    return np.stack([tl, tr, br, bl], axis=1).astype("float32")
+
+def measure_contours(cnts):
+    """Fit a rotated rect to every contour once and measure it.
+    Returns the ordered box corners (N, 4, 2) and the pixel lengths dA, dB."""
+    rects = [cv2.minAreaRect(c) for c in cnts]
+    boxes = np.array([cv2.boxPoints(r) for r in rects]).astype("int")
+    boxes = order_boxes(boxes.reshape(-1, 4, 2))
+    tl, tr, br, bl = (boxes[:, k].astype("float64") for k in range(4))
+    dA = np.linalg.norm((tl + tr) * 0.5 - (bl + br) * 0.5, axis=1)
+    dB = np.linalg.norm((tl + bl) * 0.5 - (tr + br) * 0.5, axis=1)
+    return boxes, dA, dB
+
+# Downscale factors supported by the coarse-to-fine contour search
+COARSE_FACTORS = (2, 4, 8)
+
+def edge_map(gray, blur=7):
+    gray = cv2.GaussianBlur(gray, (blur, blur), 0)
+    edged = cv2.Canny(gray, CANNY_LOW, CANNY_HIGH)
     edged = cv2.dilate(edged, None, iterations=1)
-    edged = cv2.erode(edged, None, iterations=1)
-    if disp:
-        cv2.imshow("Image", edged)
-        cv2.waitKey(0)
-    cnts = cv2.findContours(edged.copy(), cv2.RETR_EXTERNAL,
-        cv2.CHAIN_APPROX_SIMPLE)
-    cnts = imutils.grab_contours(cnts)
-    (cnts, _) = contours.sort_contours(cnts)
-    pixelsPerMetric = None
-    dims = []
-    for c in sorted(cnts, key= lambda c: get_area(c), reverse=True)[:num_pieces]:
-        orig = img.copy()
-        box = cv2.minAreaRect(c)
-        box = cv2.cv.BoxPoints(box) if imutils.is_cv2() else cv2.boxPoints(box)
-        box = np.array(box, dtype="int")
-        box = perspective.order_points(box)
-        cv2.drawContours(orig, [box.astype("int")], -1, (0, 255, 0), 2)
-        for (x, y) in box:
-            cv2.circle(orig, (int(x), int(y)), 5, (0, 0, 255), -1)
-        (tl, tr, br, bl) = box
-        (tltrX, tltrY) = midpoint(tl, tr)
-        (blbrX, blbrY) = midpoint(bl, br)
-        (tlblX, tlblY) = midpoint(tl, bl)
-        (trbrX, trbrY) = midpoint(tr, br)
-        if disp:
-            cv2.circle(orig, (int(tltrX), int(tltrY)), 5, (255, 0, 0), -1)
-            cv2.circle(orig, (int(blbrX), int(blbrY)), 5, (255, 0, 0), -1)
-            cv2.circle(orig, (int(tlblX), int(tlblY)), 5, (255, 0, 0), -1)
-            cv2.circle(orig, (int(trbrX), int(trbrY)), 5, (255, 0, 0), -1)
-            # draw lines between the midpoints
-            cv2.line(orig, (int(tltrX), int(tltrY)), (int(blbrX), int(blbrY)),
-                (255, 0, 255), 2)
-            cv2.line(orig, (int(tlblX), int(tlblY)), (int(trbrX), int(trbrY)),
-                (255, 0, 255), 2)
-
-        dA = dist.euclidean((tltrX, tltrY), (blbrX, blbrY))
-        dB = dist.euclidean((tlblX, tlblY), (trbrX, trbrY))
-
-        if pixelsPerMetric is None:
-            pixelsPerMetric = dB / width
-        
-        dimA = dA / pixelsPerMetric
-        dimB = dB / pixelsPerMetric
-        dims.append((dimA, dimB))
+    return cv2.erode(edged, None, iterations=1)
+
+def find_contours(edged, offset=(0, 0)):
+    cnts = cv2.findContours(edged, cv2.RETR_EXTERNAL,
+        cv2.CHAIN_APPROX_SIMPLE, offset=offset)
+    return list(imutils.grab_contours(cnts))
+
+def coarse_to_fine_contours(gray, coarse, num_pieces):
+    """Find candidate pieces on a downscaled copy of the image, then re-run edge
+    detection at full resolution only inside each candidate's region"""
+    # The full image has to be decoded for refinement anyway, and an area
+    # resize of it is cheaper than a second IMREAD_REDUCED_* decode
+    small = cv2.resize(gray, None, fx=1 / coarse, fy=1 / coarse, interpolation=cv2.INTER_AREA)
+    candidates = find_contours(edge_map(small, blur=3))
+    if not candidates:
+        return []
+    _, dA, dB = measure_contours(candidates)
+    order = np.argsort(-(dA * dB), kind="stable")
+    if num_pieces > 0:
+        # Spare candidates in case some of them are noise at full resolution
+        order = order[:2 * num_pieces]
+
+    height, width = gray.shape
+    pad = 4 * coarse + 8
+    refined = []
+    for i in order:
+        x, y, w, h = cv2.boundingRect(candidates[i])
+        x0, y0 = max(x * coarse - pad, 0), max(y * coarse - pad, 0)
+        x1, y1 = min((x + w) * coarse + pad, width), min((y + h) * coarse + pad, height)
+        cnts = find_contours(edge_map(gray[y0:y1, x0:x1]), offset=(x0, y0))
+        # Keep the largest contour centred inside the candidate, not a clipped neighbour
+        cx, cy = (x + w / 2) * coarse, (y + h / 2) * coarse
+        best, best_area = None, 0
+        for c in cnts:
+            bx, by, bw, bh = cv2.boundingRect(c)
+            if bx <= cx <= bx + bw and by <= cy <= by + bh and bw * bh > best_area:
+                best, best_area = c, bw * bh
+        if best is not None:
+            refined.append(best)
+    return refined
 
+def detect_pieces(image_file, width, num_pieces, coarse=1):
+    """Find and measure the largest contours in a photo.
+    Returns the contours, their ordered boxes, pixel lengths dA/dB, the indices
+    of the kept pieces (largest first) and the pixels-per-mm scale, which is
+    set so the largest piece's second dimension is `width` mm."""
+    if coarse != 1 and coarse not in COARSE_FACTORS:
+        raise ValueError(f"coarse must be one of 1, {', '.join(map(str, COARSE_FACTORS))}")
+    img = cv2.imread(image_file)
+    if img is None:
+        raise FileNotFoundError(f"Could not read image {image_file}")
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if not disp:
+        # Only the debug overlays need the colour image
+        img = None
+    if coarse > 1:
+        cnts = coarse_to_fine_contours(gray, coarse, num_pieces)
+    else:
+        edged = edge_map(gray)
         if disp:
-            cv2.putText(orig, "{:.1f}mm".format(dimA),
-        (int(tltrX - 15), int(tltrY - 10)), cv2.FONT_HERSHEY_SIMPLEX,
-        0.65, (255, 255, 255), 2)
-            cv2.putText(orig, "{:.1f}mm".format(dimB),
-                (int(trbrX + 10), int(trbrY)), cv2.FONT_HERSHEY_SIMPLEX,
-                0.65, (255, 255, 255), 2)
-            cv2.imshow("Image", orig)
+            cv2.imshow("Image", edged)
             cv2.waitKey(0)
+        cnts = find_contours(edged)
+    if not cnts:
+        return img, [], None, None, None, [], None
+    (cnts, _) = contours.sort_contours(cnts)
+    boxes, dA, dB = measure_contours(cnts)
+    # Stable sort keeps the left-to-right order for equal areas
+    order = np.argsort(-(dA * dB), kind="stable")[:num_pieces]
+    pixelsPerMetric = dB[order[0]] / width if len(order) else None
+    return img, cnts, boxes, dA, dB, order, pixelsPerMetric
+
+def piece_dims(image_file, width = 19.05, num_pieces=-1, coarse=1):
+    """Measure the pieces in a photo, returning (dimA, dimB) in mm, largest first.
+    The largest piece's second dimension is taken to be `width` mm.
+    With coarse=2, 4 or 8 the contours are located on a downscaled image and
+    only refined at full resolution around each piece."""
+    img, _, boxes, dA, dB, order, pixelsPerMetric = detect_pieces(image_file, width, num_pieces, coarse)
+    dims = [(float(dA[i] / pixelsPerMetric), float(dB[i] / pixelsPerMetric)) for i in order]
+
+    if disp:
+        for i in order:
+            draw_measurement(img, boxes[i], dA[i] / pixelsPerMetric, dB[i] / pixelsPerMetric)
     return dims
 
-def get_area(c):
-    box = cv2.minAreaRect(c)
-    box = cv2.cv.BoxPoints(box) if imutils.is_cv2() else cv2.boxPoints(box)
-    box = np.array(box, dtype="int")
-    box = perspective.order_points(box)
+def simplify_contour(c, max_vertices):
+    """Douglas-Peucker simplify a contour to at most max_vertices points.
+    Binary searches for the smallest tolerance that meets the budget and returns
+    the simplified points with that tolerance in pixels."""
+    lo, hi = 0.0, cv2.arcLength(c, True) / 4
+    best = cv2.approxPolyDP(c, hi, True)
+    best_eps = hi
+    for _ in range(20):
+        eps = (lo + hi) / 2
+        approx = cv2.approxPolyDP(c, eps, True)
+        if len(approx) <= max_vertices:
+            best, best_eps, hi = approx, eps, eps
+        else:
+            lo = eps
+    return best.reshape(-1, 2), best_eps
+
+def contour_polygon(c, rect, pixelsPerMetric, max_vertices):
+    """Convert a pixel contour into a simplified Polygon in mm with its bounds at the origin.
+    The polygon has at most max_vertices vertices and contains the contour, so
+    the piece fits a slot cut to it. Falls back to the contour's rotated rect
+    (`rect`, box corners in pixels) when no such polygon beats it, which has 4
+    vertices even if max_vertices is 3."""
+    max_vertices = max(max_vertices, 3)
+    hull = cv2.convexHull(c)
+    # Edges that don't close around the piece give a contour with almost no
+    # area (it traces both sides of the edge); fall back to its convex hull
+    outline = c if cv2.contourArea(c) >= 0.5 * cv2.contourArea(hull) else hull
+    piece = Polygon(outline.reshape(-1, 2) / pixelsPerMetric)
+    if not piece.is_valid:
+        piece = Polygon(hull.reshape(-1, 2) / pixelsPerMetric)
+    # Room for float error in the containment test, far below a pixel
+    fits = piece.buffer(-1e-6)
+    shape = Polygon(rect / pixelsPerMetric)
+    # Growing the simplified outline back out can add vertices at sharp
+    # corners, so fewer are tried until the grown polygon fits the budget
+    for budget in range(max_vertices, 2, -1):
+        points, eps = simplify_contour(outline, budget)
+        if len(points) < 3 or not Polygon(points).is_valid:
+            points, eps = simplify_contour(hull, budget)
+        if len(points) < 3:
+            continue
+        simplified = Polygon(points / pixelsPerMetric)
+        # Simplification can cut up to eps inside the outline; grow the slot back
+        # out by that much (mitred, so corners stay corners) so the piece still fits
+        for candidate in (simplified, simplified.buffer(eps / pixelsPerMetric, join_style="mitre")):
+            if (isinstance(candidate, Polygon) and candidate.is_valid
+                    and len(candidate.exterior.coords) - 1 <= max_vertices and candidate.covers(fits)):
+                if candidate.area < shape.area:
+                    shape = candidate
+                min_x, min_y, _, _ = shape.bounds
+                return translate(shape, -min_x, -min_y)
+    min_x, min_y, _, _ = shape.bounds
+    return translate(shape, -min_x, -min_y)
+
+def piece_polygons(image_file, width = 19.05, num_pieces=-1, max_vertices=12, coarse=1):
+    """Like piece_dims but return each piece's outline as a Polygon in mm,
+    simplified to at most max_vertices vertices"""
+    _, cnts, boxes, _, _, order, pixelsPerMetric = detect_pieces(image_file, width, num_pieces, coarse)
+    return [contour_polygon(cnts[i], boxes[i], pixelsPerMetric, max_vertices) for i in order]
+
+def draw_measurement(img, box, dimA, dimB):
+    orig = img.copy()
+    cv2.drawContours(orig, [box.astype("int")], -1, (0, 255, 0), 2)
+    for (x, y) in box:
+        cv2.circle(orig, (int(x), int(y)), 5, (0, 0, 255), -1)
     (tl, tr, br, bl) = box
     (tltrX, tltrY) = midpoint(tl, tr)
     (blbrX, blbrY) = midpoint(bl, br)
     (tlblX, tlblY) = midpoint(tl, bl)
     (trbrX, trbrY) = midpoint(tr, br)
-    dA = dist.euclidean((tltrX, tltrY), (blbrX, blbrY))
-    dB = dist.euclidean((tlblX, tlblY), (trbrX, trbrY))
-    return dA * dB
+    cv2.circle(orig, (int(tltrX), int(tltrY)), 5, (255, 0, 0), -1)
+    cv2.circle(orig, (int(blbrX), int(blbrY)), 5, (255, 0, 0), -1)
+    cv2.circle(orig, (int(tlblX), int(tlblY)), 5, (255, 0, 0), -1)
+    cv2.circle(orig, (int(trbrX), int(trbrY)), 5, (255, 0, 0), -1)
+    # draw lines between the midpoints
+    cv2.line(orig, (int(tltrX), int(tltrY)), (int(blbrX), int(blbrY)),
+        (255, 0, 255), 2)
+    cv2.line(orig, (int(tlblX), int(tlblY)), (int(trbrX), int(trbrY)),
+        (255, 0, 255), 2)
+    cv2.putText(orig, "{:.1f}mm".format(dimA),
+        (int(tltrX - 15), int(tltrY - 10)), cv2.FONT_HERSHEY_SIMPLEX,
+        0.65, (255, 255, 255), 2)
+    cv2.putText(orig, "{:.1f}mm".format(dimB),
+        (int(trbrX + 10), int(trbrY)), cv2.FONT_HERSHEY_SIMPLEX,
+        0.65, (255, 255, 255), 2)
+    cv2.imshow("Image", orig)
+    cv2.waitKey(0)
+
+def get_area(c):
+    _, dA, dB = measure_contours([c])
+    return dA[0] * dB[0]
             
             
-if __name__ == "__main__":
-    #FOR TESTING
-    file_name = "/Users/idoavnon/Documents/Programming/UW/556/board-forge/board_forge/data/sample_images/IMG_5004.JPG"
-    print(piece_dims(file_name, 76, 4))
-    
+def compare_modes(image_files, width, num_pieces, coarse=4):
+    """Time the full-resolution and coarse-to-fine paths on the same images and
+    report the largest dimension difference between them"""
+    for image_file in image_files:
+        start = time.perf_counter()
+        full = piece_dims(image_file, width, num_pieces)
+        full_time = time.perf_counter() - start
+        start = time.perf_counter()
+        fast = piece_dims(image_file, width, num_pieces, coarse=coarse)
+        fast_time = time.perf_counter() - start
+        if len(full) == len(fast):
+            error = max((max(abs(a1 - a2), abs(b1 - b2)) for (a1, b1), (a2, b2) in zip(full, fast)), default=0.0)
+            accuracy = f"max diff {error:.2f}mm"
+        else:
+            accuracy = f"piece count differs ({len(full)} vs {len(fast)})"
+        print(f"{os.path.basename(image_file)}: full {full_time:.3f}s, "
+              f"coarse x{coarse} {fast_time:.3f}s, {accuracy}")
 
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Measure game pieces in photos")
+    ap.add_argument("images", nargs="*", help="defaults to the bundled sample images")
+    ap.add_argument("--width", type=float, default=76, help="width of the largest piece in mm")
+    ap.add_argument("--num-pieces", type=int, default=4)
+    ap.add_argument("--coarse", type=int, default=1, choices=[1, *COARSE_FACTORS])
+    ap.add_argument("--compare", action="store_true",
+        help="compare the full-resolution and coarse-to-fine paths")
+    args = ap.parse_args()
+    sample_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_images")
+    images = args.images or [os.path.join(sample_dir, f) for f in sorted(os.listdir(sample_dir))]
+    if args.compare:
+        compare_modes(images, args.width, args.num_pieces, args.coarse if args.coarse > 1 else 4)
+    else:
+        for image_file in images:
+            print(image_file, piece_dims(image_file, args.width, args.num_pieces, args.coarse))
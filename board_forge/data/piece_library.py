@@ -0,0 +1,114 @@
+import json
+import os
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+import shapely
+from shapely.geometry import Polygon, box
+
+PIECE_DIMENSIONS_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "piece_dimensions.json")
+
+def scale_polygon(polygon, factor):
+    """Scale polygon about the origin in one vectorized coordinate transform"""
+    if factor == 1.0:
+        return polygon
+    return shapely.transform(polygon, lambda coords: coords * factor)
+
+def load_json_pieces(path=PIECE_DIMENSIONS_JSON) -> Dict[str, Polygon]:
+    """Load rectangular pieces given as {"name", "width", "height"} records"""
+    with open(path) as f:
+        records = json.load(f)
+    return {r["name"]: box(0, 0, r["width"], r["height"]) for r in records}
+
+class PieceLibrary:
+    """Name and tag index over several piece collections.
+
+    Collections are registered as loader callables returning {name: Polygon}
+    and are only loaded when a lookup needs them. If several collections define
+    the same name, the one registered first wins. Scaled variants are memoized
+    with LRU eviction.
+    """
+
+    def __init__(self, cache_size=1024):
+        self.cache_size = cache_size
+        self._loaders: "OrderedDict[str, tuple]" = OrderedDict()
+        self._pieces: Dict[str, Polygon] = {}
+        self._tags: Dict[str, set] = {}
+        self._scaled: "OrderedDict[tuple, Polygon]" = OrderedDict()
+
+    def register_collection(self, collection: str, loader: Callable[[], Dict[str, Polygon]], tags: Iterable[str] = ()):
+        """Register a lazily loaded collection; its pieces are tagged with the
+        collection name and any extra tags"""
+        self._loaders[collection] = (loader, (collection, *tags))
+
+    def add_piece(self, name: str, shape: Polygon, tags: Iterable[str] = ("user",)):
+        """Add or replace a single piece, e.g. one defined in the GUI. A
+        replaced piece keeps none of its old tags."""
+        for names in self._tags.values():
+            names.discard(name)
+        self._pieces[name] = shape
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(name)
+        self._drop_scaled(name)
+
+    def _drop_scaled(self, name):
+        for key in [k for k in self._scaled if k[0] == name]:
+            del self._scaled[key]
+
+    def _load(self, collection):
+        loader, tags = self._loaders.pop(collection)
+        for name, shape in loader().items():
+            if name in self._pieces:
+                continue
+            self._pieces[name] = shape
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(name)
+
+    def _load_all(self):
+        for collection in list(self._loaders):
+            self._load(collection)
+
+    def _find(self, name) -> Optional[Polygon]:
+        # Load pending collections in order only until the name turns up
+        while name not in self._pieces and self._loaders:
+            self._load(next(iter(self._loaders)))
+        return self._pieces.get(name)
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def get(self, name: str, scale: float = 1.0) -> Optional[Polygon]:
+        """Return the piece scaled by `scale`, or None if it is not in the library"""
+        key = (name, scale)
+        shape = self._scaled.get(key)
+        if shape is not None:
+            self._scaled.move_to_end(key)
+            return shape
+        base = self._find(name)
+        if base is None:
+            return None
+        shape = scale_polygon(base, scale)
+        self._scaled[key] = shape
+        if len(self._scaled) > self.cache_size:
+            self._scaled.popitem(last=False)
+        return shape
+
+    def names(self, tag: Optional[str] = None) -> List[str]:
+        """All piece names, or those with the given tag, sorted"""
+        self._load_all()
+        if tag is None:
+            return sorted(self._pieces)
+        return sorted(self._tags.get(tag, ()))
+
+    def tags(self) -> List[str]:
+        self._load_all()
+        return sorted(self._tags)
+
+def default_library() -> PieceLibrary:
+    """Library over the bundled collections, in get_piece's historical lookup order"""
+    from data import sample_pieces
+    library = PieceLibrary()
+    library.register_collection("sample", lambda: sample_pieces.SAMPLE_PIECES)
+    library.register_collection("catan", lambda: sample_pieces.CATAN_PIECES, tags=("game",))
+    library.register_collection("chess", lambda: sample_pieces.CHESS_PIECES, tags=("game",))
+    library.register_collection("json", load_json_pieces, tags=("rectangle",))
+    return library
@@ -1,4 +1,5 @@
 from shapely.geometry import Polygon
+from data.piece_library import default_library, scale_polygon
 
 SAMPLE_PIECES = {
     "meeple": Polygon([
@@ -52,15 +53,17 @@ CHESS_PIECES = {
     "king": Polygon([(10, 0), (20, 0), (25, 10), (20, 20), (25, 30), (20, 35), (10, 35), (5, 30), (10, 20), (5, 10)])
 }
 
-def scale_polygon(polygon, factor):
-    return Polygon([(x * factor, y * factor) for x, y in polygon.exterior.coords])
+_library = None
+
+def piece_library():
+    """The shared default PieceLibrary, created on first use"""
+    global _library
+    if _library is None:
+        _library = default_library()
+    return _library
 
 def get_piece(piece_name, scale=1.0):
-    if piece_name in SAMPLE_PIECES:
-        return scale_polygon(SAMPLE_PIECES[piece_name], scale)
-    
-    for collection in [CATAN_PIECES, CHESS_PIECES]:
-        if piece_name in collection:
-            return scale_polygon(collection[piece_name], scale)
-    
-    return scale_polygon(SAMPLE_PIECES["cube"], scale)
\ No newline at end of file
+    """Look up a piece in the default PieceLibrary, falling back to a cube"""
+    library = piece_library()
+    piece = library.get(piece_name, scale)
+    return piece if piece is not None else library.get("cube", scale)
@@ -1,46 +1,160 @@
-from dataclasses import dataclass
-from typing import List
-from shapely import unary_union
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple, TYPE_CHECKING
+import numpy as np
+import shapely
 from shapely.geometry import Polygon, box
-from svgwrite import Drawing
 from piece import Piece
+from board_forge.convex import clearance_ok
+
+if TYPE_CHECKING:
+    from svgwrite import Drawing
 
 PADDING = 10
 SLOT_PADDING = 1  # 1mm padding for slots
+MIN_CLEARANCE = 10.0  # minimum distance between slots
+
+def _halo(slot: Polygon) -> Polygon:
+    halo = slot.buffer(MIN_CLEARANCE / 2)
+    shapely.prepare(halo)
+    return halo
+
+def _update_derived(derived, slots, build):
+    """Bring (source slots, derived) lists up to date with slots, rebuilding
+    only the entries whose slot changed"""
+    if derived is None or len(derived[0]) != len(slots):
+        derived = [None] * len(slots), [None] * len(slots)
+    sources, values = derived
+    for i, slot in enumerate(slots):
+        if sources[i] is not slot:
+            sources[i], values[i] = slot, build(slot)
+    return derived
 
 @dataclass
 class Design:
     slots: List[Polygon]
+    # Per-slot bounds and overall extents, valid while the slots are the exact
+    # objects in _extent_key. Polygons are immutable, so identity is enough to
+    # detect in-place edits of the slots list. Checking that is still an O(n)
+    # pass over the slots, but a C-level identity scan with no geometry work.
+    _slot_bounds: Optional[np.ndarray] = field(default=None, init=False, repr=False, compare=False)
+    _extent: Optional[Tuple[float, float, float, float]] = field(default=None, init=False, repr=False, compare=False)
+    _extent_key: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
+    # Index of the slot last replaced by with_slot, so objectives can score
+    # the design incrementally against the one it was derived from
+    _edited: Optional[int] = field(default=None, init=False, repr=False, compare=False)
+    # Result of the last clearance check and the slots it was made for, and the
+    # slots of a valid design this one differs from only in slot _edited, so
+    # is_valid need only check that slot against the rest
+    _valid: Optional[bool] = field(default=None, init=False, repr=False, compare=False)
+    _valid_key: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
+    _valid_base: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
+    # Geometry derived from each slot, as (source slots, derived) lists. An entry
+    # is rebuilt only when its slot is no longer the object it was built from.
+    _padded: Optional[Tuple[list, list]] = field(default=None, init=False, repr=False, compare=False)
+    _halos: Optional[Tuple[list, list]] = field(default=None, init=False, repr=False, compare=False)
+    # State objectives derive from the slots, by objective, so moves of this
+    # design can be scored without deriving it again (see objectives.py)
+    _objective_state: dict = field(default_factory=dict, init=False, repr=False, compare=False)
 
     def get_padded_slots(self) -> List[Piece]:
         """Return slots with added padding of SLOT_PADDING mm on each side"""
-        return [s.buffer(SLOT_PADDING) for s in self.slots]
+        self._padded = _update_derived(self._padded, self.slots, lambda s: s.buffer(SLOT_PADDING))
+        return list(self._padded[1])
+
+    def slot_halos(self) -> List[Polygon]:
+        """Each slot buffered by half of MIN_CLEARANCE and prepared, so two
+        slots are too close where their halos intersect"""
+        self._halos = _update_derived(self._halos, self.slots, _halo)
+        return self._halos[1]
+
+    def _set_extents(self, slot_bounds, extent, key):
+        self._slot_bounds, self._extent, self._extent_key = slot_bounds, extent, key
+
+    def slot_bounds(self) -> np.ndarray:
+        """(n, 4) array of each slot's (min_x, min_y, max_x, max_y)"""
+        key = tuple(self.slots)
+        if self._extent_key != key:
+            slot_bounds = shapely.bounds(np.array(key, dtype=object)).reshape(-1, 4)
+            extent = (tuple(slot_bounds[:, :2].min(axis=0)) + tuple(slot_bounds[:, 2:].max(axis=0))
+                      if len(key) else (np.nan,) * 4)
+            self._set_extents(slot_bounds, extent, key)
+        return self._slot_bounds
+
+    @property
+    def bounds(self):
+        """(min_x, min_y, max_x, max_y) of the slots, without padding"""
+        # The bounds of the union are the union of the bounds, so there is no
+        # need to build the union geometry itself
+        self.slot_bounds()
+        return self._extent
+
+    def with_slot(self, idx, slot: Polygon) -> "Design":
+        """Return a copy of the design with slot idx replaced, updating the
+        tracked extents incrementally instead of recomputing them. Copying the
+        slot list and bounds array is O(n), but only the new slot's bounds are
+        computed, and the extents are only rescanned if the old slot defined an edge."""
+        slots = self.slots[:idx] + [slot] + self.slots[idx + 1:]
+        slot_bounds = self.slot_bounds().copy()
+        old = slot_bounds[idx].copy()
+        new = np.array(slot.bounds)
+        slot_bounds[idx] = new
+        min_x, min_y, max_x, max_y = self._extent
+        if old[0] > min_x and old[1] > min_y and old[2] < max_x and old[3] < max_y:
+            # The old slot didn't define any edge, so only the new one can extend them
+            extent = (min(min_x, new[0]), min(min_y, new[1]), max(max_x, new[2]), max(max_y, new[3]))
+        else:
+            extent = tuple(slot_bounds[:, :2].min(axis=0)) + tuple(slot_bounds[:, 2:].max(axis=0))
+        result = Design(slots)
+        result._set_extents(slot_bounds, extent, tuple(slots))
+        result._edited = idx
+        # Copies, so entries rebuilt for the new slot don't evict ours
+        for name in ("_padded", "_halos"):
+            derived = getattr(self, name)
+            if derived is not None:
+                setattr(result, name, (list(derived[0]), list(derived[1])))
+        if self._valid and self._valid_key == tuple(self.slots):
+            result._valid_base = self._valid_key
+        elif self._edited == idx:
+            # Repeated edits of one slot (e.g. clamping after a move) keep the base
+            result._valid_base = self._valid_base
+        return result
+
+    def edited_slot(self, base: "Design") -> Optional[int]:
+        """Index of the only slot that differs from base, if this design was
+        derived from base by with_slot edits of that one slot, else None"""
+        idx = self._edited
+        if idx is None or len(self.slots) != len(base.slots):
+            return None
+        # List comparison checks identity first, so this is a fast C-level scan
+        if self.slots[:idx] == base.slots[:idx] and self.slots[idx + 1:] == base.slots[idx + 1:]:
+            return idx
+        return None
 
     @property
     def bounding_box(self) -> Polygon:
-        # Use padded slots to calculate the bounding box
-        padded_slots = self.get_padded_slots()
-        # Extract the shape objects from the Piece objects
-        slot_shapes = [slot for slot in padded_slots]
-        if not slot_shapes:  # Handle empty case
+        if not self.slots:  # Handle empty case
             return box(0, 0, 10, 10)  # Default small box
-        unified = unary_union(slot_shapes)
-        unified = unary_union(self.slots)
-        min_x, min_y, max_x, max_y = unified.bounds
+        min_x, min_y, max_x, max_y = self.bounds
         return box(min_x - PADDING, min_y - PADDING, max_x + PADDING, max_y + PADDING)
 
     @property
     def is_valid(self) -> bool:
         """Check if all slots maintain a minimum distance from each other,
         taking into account the SLOT_PADDING applied to each slot"""
-        min_distance = 10.0
-        for i in range(len(self.slots)):
-            for j in range(i + 1, len(self.slots)):
-                if self.slots[i].distance(self.slots[j]) < min_distance:
-                    return False
-        return True
-
-    def to_svg(self) -> Drawing:
+        key = tuple(self.slots)
+        if self._valid_key != key:
+            base, idx = self._valid_base, self._edited
+            only = None
+            if base is not None and len(base) == len(key) and key[:idx] == base[:idx] and key[idx + 1:] == base[idx + 1:]:
+                only = idx
+            halos = lambda indices: np.array(self.slot_halos(), dtype=object)[indices]
+            self._valid = clearance_ok(key, self.slot_bounds(), MIN_CLEARANCE, only, halos)
+            self._valid_key = key
+        return self._valid
+
+    def to_svg(self) -> "Drawing":
+        # svgwrite is only needed for export, so keep it off the startup path
+        from svgwrite import Drawing
         stroke_width = 0.05
 
         # Get padded slots for display
@@ -85,4 +199,48 @@ class Design:
             stroke_width=stroke_width
         ))
 
-        return dwg
\ No newline at end of file
+        return dwg
+
+    def write_svg(self, file, precision=3, merge_paths=False):
+        """Stream the design as SVG to a path or text file in a single pass.
+
+        Coordinates are rounded to `precision` decimal places (mm). With
+        merge_paths all slots are written as one <path> element instead of
+        one <polygon> per slot, which is smaller and cuts in one job.
+        """
+        if isinstance(file, str):
+            with open(file, "w") as f:
+                return self.write_svg(f, precision, merge_paths)
+
+        def num(v):
+            text = f"{v:.{precision}f}"
+            if "." in text:
+                text = text.rstrip("0").rstrip(".")
+            return "0" if text == "-0" else text
+
+        stroke = 'fill="none" stroke="black" stroke-width="0.05"'
+        min_x, min_y, max_x, max_y = self.bounding_box.bounds
+        width, height = max_x - min_x, max_y - min_y
+        write = file.write
+        write('<?xml version="1.0" encoding="utf-8" ?>\n')
+        write(f'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+              f'width="{num(width)}mm" height="{num(height * 2)}mm" '
+              f'viewBox="{num(min_x)} {num(min_y)} {num(width)} {num(height * 2)}">\n')
+        # Top piece with the slots cut out of it
+        write(f'<rect x="{num(min_x)}" y="{num(min_y)}" width="{num(width)}" height="{num(height)}" '
+              f'rx="{PADDING}" ry="{PADDING}" {stroke} />\n')
+        if merge_paths:
+            write('<path d="')
+        for slot in self.slots:
+            coords = shapely.get_coordinates(slot.exterior)[:-1]
+            points = " ".join(f"{num(x)},{num(y)}" for x, y in coords)
+            if merge_paths:
+                write(f"M{points}Z")
+            else:
+                write(f'<polygon points="{points}" {stroke} />\n')
+        if merge_paths:
+            write(f'" {stroke} />\n')
+        # Bottom piece
+        write(f'<rect x="{num(min_x)}" y="{num(max_y)}" width="{num(width)}" height="{num(height)}" '
+              f'rx="{PADDING}" ry="{PADDING}" {stroke} />\n')
+        write('</svg>\n')
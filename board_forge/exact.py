@@ -0,0 +1,216 @@
+"""Exact branch-and-bound packing for small all-rectangle designs.
+
+Slots must be axis-aligned rectangles (as produced by photo imports). Each can
+be placed at 0 or 90 degrees, and every pair is kept at least `spacing` apart
+along x or y, which is modelled by inflating each rectangle by `spacing` and
+packing the inflated rectangles without overlap.
+
+The search places one rectangle per level at a corner point of the staircase
+envelope of the pieces already placed (Martello & Vigo's corner points). In 2D
+every packing can be pushed down and left into one that is built this way,
+without growing its bounding box, so exhausting the search proves optimality.
+Identical rectangles are interchangeable (only the first unplaced copy is
+branched on), one piece keeps its orientation to rule out mirrored packings,
+states reached again in a different order are skipped, and branches are cut
+with an area lower bound that counts the space the envelope has already
+wasted.
+
+The search is exponential: with a one second limit it proves about 6
+rectangles optimal, and beyond that returns a good packing whose reported gap
+(against the plain area bound) is a few percent at 8 to 16 rectangles.
+optimize_rectangles() runs it on small designs, seeded with the annealed
+layout. Optimal means optimal for inflated rectangles; the annealer measures
+clearance diagonally too, so it can occasionally beat that.
+"""
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import numpy as np
+from shapely.geometry import box
+from board_forge.design import Design, PADDING
+from board_forge.optimize import MIN_SPACING, CANVAS_MARGIN, CANVAS_WIDTH, CANVAS_HEIGHT
+
+@dataclass
+class ExactResult:
+    design: Design
+    area: float  # bounding box area of design, as scored by evaluate()
+    lower_bound: float
+    optimal: bool
+    nodes: int
+    seconds: float
+
+    @property
+    def gap(self) -> float:
+        """Relative optimality gap, 0 when proven optimal"""
+        return 0.0 if self.optimal else (self.area - self.lower_bound) / self.area
+
+def rectangle_dims(slot) -> Optional[Tuple[float, float]]:
+    """(width, height) if slot is an axis-aligned rectangle, else None"""
+    min_x, min_y, max_x, max_y = slot.bounds
+    w, h = max_x - min_x, max_y - min_y
+    if w <= 0 or h <= 0 or len(slot.interiors) or abs(slot.area - w * h) > 1e-6 * w * h:
+        return None
+    return w, h
+
+def is_rectangle_design(design: Design) -> bool:
+    return bool(design.slots) and all(rectangle_dims(s) is not None for s in design.slots)
+
+def board_area(width, height, spacing):
+    """Bounding box area of a packing of inflated rectangles spanning width x height"""
+    return (width - spacing + 2 * PADDING) * (height - spacing + 2 * PADDING)
+
+def area_lower_bound(width, height, total_area, spacing):
+    """Smallest board area for a container at least width x height that holds
+    total_area of inflated rectangles"""
+    c = 2 * PADDING - spacing
+    best = board_area(max(width, total_area / max(height, 1e-9)), height, spacing)
+    # Containers with W * H = total_area and H >= height are the other candidates;
+    # (W + c)(A / W + c) is convex with its minimum at W = sqrt(A)
+    upper = total_area / max(height, 1e-9)
+    if width <= upper:
+        w = min(max(np.sqrt(total_area), width), upper)
+        best = min(best, (w + c) * (total_area / w + c))
+    return best
+
+def corner_points(placed):
+    """Corner points of the staircase envelope of the placed (i, x, y, w, h)
+    rectangles, i.e. the region left of and below any of their top-right corners"""
+    if not placed:
+        return [(0.0, 0.0)]
+    # Pareto-maximal top-right corners, by increasing x (so decreasing y)
+    tops = sorted({(x + w, y + h) for _, x, y, w, h in placed}, key=lambda p: (-p[1], -p[0]))
+    steps = []
+    for right, top in tops:
+        if not steps or right > steps[-1][0]:
+            steps.append((right, top))
+    points = [(0.0, steps[0][1])]
+    for (right, _), (_, next_top) in zip(steps, steps[1:]):
+        points.append((right, next_top))
+    points.append((steps[-1][0], 0.0))
+    return points
+
+def envelope_area(placed):
+    """Area of the staircase envelope of the placed (i, x, y, w, h) rectangles"""
+    area = 0.0
+    left = 0.0
+    for right, top in sorted({(x + w, y + h) for _, x, y, w, h in placed}, key=lambda p: (-p[1], -p[0])):
+        if right > left:
+            area += (right - left) * top
+            left = right
+    return area
+
+def solve_rectangles(design: Design, time_limit=1.0, spacing=MIN_SPACING, allow_rotation=True,
+                     canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT, incumbent: Optional[Design] = None) -> ExactResult:
+    """Pack the design's rectangles into the smallest bounding box that fits
+    the canvas. Only packings smaller than incumbent (a valid layout of the
+    same rectangles, e.g. from annealing) are searched for, and incumbent is
+    returned if none is found.
+    Returns a proven optimum, or the best packing found within time_limit
+    seconds along with its optimality gap. In practice proofs within a second
+    are only reached for about 6 rectangles; larger designs time out."""
+    start = time.perf_counter()
+    dims = [rectangle_dims(s) for s in design.slots]
+    if not dims or any(d is None for d in dims):
+        raise ValueError("solve_rectangles requires a non-empty design of axis-aligned rectangles")
+    n = len(dims)
+    # A hair of extra clearance keeps rounding from putting pieces 9.99999mm apart
+    clearance = spacing + 1e-6
+    sizes = [(w + clearance, h + clearance) for w, h in dims]
+    total_area = sum(w * h for w, h in sizes)
+
+    # Identical rectangles share a type; only the first unplaced one of a type is branched on
+    types = {}
+    type_of = [types.setdefault(tuple(sorted(np.round(s, 6))), len(types)) for s in sizes]
+    # Place big pieces first, they constrain the layout the most
+    order = sorted(range(n), key=lambda i: -sizes[i][0] * sizes[i][1])
+    # Inflated extent that still fits inside the canvas margins
+    max_width = canvas_width - 2 * (CANVAS_MARGIN + PADDING) + clearance
+    max_height = canvas_height - 2 * (CANVAS_MARGIN + PADDING) + clearance
+
+    # Mirroring a packing in its diagonal keeps the area and rotates every piece,
+    # so one non-square piece without identical copies can be kept unrotated.
+    # The mirror swaps width and height, so this needs a square canvas, or one
+    # that no packing can reach: each side is at most the sum of the long sides.
+    fixed = None
+    if abs(max_width - max_height) < 1e-9 or sum(max(s) for s in sizes) <= min(max_width, max_height):
+        counts = np.bincount(type_of)
+        fixed = next((i for i in order if counts[type_of[i]] == 1 and abs(sizes[i][0] - sizes[i][1]) > 1e-9), None)
+
+    best_area = incumbent.bounding_box.area if incumbent is not None else float("inf")
+    best_layout = None
+    nodes = 0
+    seen = set()
+    timed_out = False
+    root_bound = area_lower_bound(max(min(s) for s in sizes), max(min(s) for s in sizes), total_area, spacing)
+
+    placed: List[Tuple[int, float, float, float, float]] = []  # (index, x, y, w, h)
+
+    def search(remaining, width, height, placed_area):
+        nonlocal best_area, best_layout, nodes, timed_out
+        nodes += 1
+        if nodes % 256 == 0 and (best_layout is not None or incumbent is not None) and time.perf_counter() - start > time_limit:
+            timed_out = True
+        if timed_out:
+            return
+        if not remaining:
+            area = board_area(width, height, spacing)
+            if area < best_area:
+                best_area = area
+                best_layout = list(placed)
+            return
+        key = frozenset((type_of[i], round(x, 6), round(y, 6), round(w, 6)) for i, x, y, w, _ in placed)
+        if key in seen:
+            return
+        seen.add(key)
+
+        points = corner_points(placed)
+        candidates = []
+        branched_types = set()
+        for i in remaining:
+            if type_of[i] in branched_types:
+                continue
+            branched_types.add(type_of[i])
+            w0, h0 = sizes[i]
+            orientations = [(w0, h0)]
+            if allow_rotation and abs(w0 - h0) > 1e-9 and i != fixed:
+                orientations.append((h0, w0))
+            for w, h in orientations:
+                # Corner points lie outside the envelope, so nothing placed can overlap
+                for x, y in points:
+                    new_w, new_h = max(width, x + w), max(height, y + h)
+                    if new_w > max_width + 1e-9 or new_h > max_height + 1e-9:
+                        continue
+                    # Later pieces go outside the envelope too, so whatever it
+                    # leaves uncovered is wasted and the board needs that much more
+                    waste = envelope_area(placed + [(i, x, y, w, h)]) - placed_area - w * h
+                    bound = area_lower_bound(new_w, new_h, total_area + waste, spacing)
+                    if bound < best_area - 1e-9:
+                        candidates.append((board_area(new_w, new_h, spacing), bound, i, x, y, w, h))
+        # Most promising first so good incumbents are found early
+        candidates.sort(key=lambda c: (c[0], c[1]))
+        for _, bound, i, x, y, w, h in candidates:
+            if bound >= best_area - 1e-9:
+                continue
+            placed.append((i, x, y, w, h))
+            search([r for r in remaining if r != i], max(width, x + w), max(height, y + h), placed_area + w * h)
+            placed.pop()
+            if timed_out:
+                return
+
+    search(order, 0.0, 0.0, 0.0)
+
+    if best_layout is None:
+        if incumbent is None:
+            raise ValueError("The rectangles don't fit on the canvas")
+        result = incumbent
+    else:
+        slots = list(design.slots)
+        offset = CANVAS_MARGIN + PADDING
+        for i, x, y, w, h in best_layout:
+            # Undo the inflation: each rectangle sits in the lower-left of its cell
+            slots[i] = box(offset + x, offset + y, offset + x + w - clearance, offset + y + h - clearance)
+        result = Design(slots)
+    area = result.bounding_box.area
+    optimal = not timed_out
+    lower_bound = area if optimal else min(root_bound, area)
+    return ExactResult(result, area, lower_bound, optimal, nodes, time.perf_counter() - start)
@@ -0,0 +1,257 @@
+"""Genetic algorithm engine, an alternative to optimize()'s annealing.
+
+An individual is a placement order, a quarter-turn orientation per piece and
+a strip width. It is decoded by a constructive placer: each piece, rotated to
+its orientation, is placed by bottom-left skyline packing of its bounding box
+(plus MIN_SPACING) into a strip of that width, so every decoded design is
+valid. Because whole layouts are rebuilt, the search isn't tied to the layout
+it started from the way one-slot-at-a-time annealing is.
+
+Fitness is the objective's score of the decoded design, computed in a process
+pool for larger designs.
+"""
+import itertools
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import numpy as np
+import shapely
+from shapely.affinity import rotate
+from board_forge.checkpoint import CHECKPOINT_INTERVAL, Checkpoint, checkpointer_for, resume_from
+from board_forge.design import Design, PADDING
+from board_forge.objectives import Objective, get_objective
+from board_forge.optimize import Budget, MIN_SPACING, CANVAS_MARGIN, CANVAS_WIDTH, CANVAS_HEIGHT, constrain_to_canvas, slot_array, translate_slots
+from board_forge.rect_engine import skyline_pack
+
+ORIENTATIONS = (0, 90, 180, 270)
+# Below this many slots a decode takes well under a millisecond and sending
+# individuals to worker processes costs more than it saves
+POOL_MIN_SLOTS = 50
+
+@dataclass
+class Individual:
+    order: np.ndarray  # placement order of slot indices
+    orientation: np.ndarray  # index into ORIENTATIONS per slot
+    strip: float  # packing strip width
+    score: Optional[float] = None
+
+    def genes(self):
+        return self.order, self.orientation, self.strip
+
+def stack_individuals(individuals: List[Individual]) -> dict:
+    """Individuals as arrays for a checkpoint"""
+    return {
+        "order": np.stack([ind.order for ind in individuals]),
+        "orientation": np.stack([ind.orientation for ind in individuals]),
+        "strip": np.array([ind.strip for ind in individuals]),
+        "score": np.array([ind.score for ind in individuals], dtype=float),
+    }
+
+def unstack_individuals(arrays: dict) -> List[Individual]:
+    return [Individual(order, orientation, float(strip), float(score))
+            for order, orientation, strip, score in zip(arrays["order"], arrays["orientation"], arrays["strip"], arrays["score"])]
+
+class Decoder:
+    """Turns genes into designs. Each slot's rotated variants are computed once,
+    with their lower-left bounding box corner at the origin."""
+
+    def __init__(self, slots, allow_rotation=True, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT):
+        self.n = len(slots)
+        self.turns = len(ORIENTATIONS) if allow_rotation else 1
+        variants = [
+            rotate(slot, angle, origin="centroid") if angle else slot
+            for slot in slots for angle in ORIENTATIONS[:self.turns]
+        ]
+        bounds = shapely.bounds(slot_array(variants))
+        self.variants = translate_slots(variants, -bounds[:, :2])
+        self.sizes = (bounds[:, 2:] - bounds[:, :2]).reshape(self.n, self.turns, 2)
+        self.origin = CANVAS_MARGIN + PADDING
+        self.max_strip = max(canvas_width - 2 * self.origin, self.sizes.min(axis=(1, 2)).max())
+
+    def decode(self, order, orientation, strip) -> Design:
+        sizes = self.sizes[order, orientation[order]]
+        xs, ys, _ = skyline_pack(sizes[:, 0], sizes[:, 1], strip, allow_rotation=False)
+        offsets = np.empty((self.n, 2))
+        offsets[order] = np.column_stack([xs, ys]) + self.origin
+        return Design(translate_slots([self.variants[i * self.turns + orientation[i]] for i in range(self.n)], offsets))
+
+# Per-process state for pool workers, set once by _init_worker
+_worker = {}
+
+def _init_worker(decoder: Decoder, objective: Objective):
+    _worker["decoder"] = decoder
+    _worker["objective"] = objective
+
+def _fitness(genes) -> float:
+    return _worker["objective"].evaluate(_worker["decoder"].decode(*genes))
+
+def order_crossover(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """OX: keep a random slice of a, fill the rest in b's order"""
+    n = len(a)
+    i, j = sorted(random.sample(range(n + 1), 2))
+    child = np.empty(n, dtype=a.dtype)
+    child[i:j] = a[i:j]
+    kept = np.zeros(n, dtype=bool)
+    kept[a[i:j]] = True
+    rest = b[~kept[b]]
+    child[:i] = rest[:i]
+    child[j:] = rest[i:]
+    return child
+
+class GeneticOptimizer:
+    """Generational GA with tournament selection, order crossover, elitism and
+    a stagnation stop"""
+
+    def __init__(self, design: Design, objective=None, allow_rotation=True, population_size=40,
+                 elite=2, mutation_rate=0.2, tournament=3, patience=25, workers=None,
+                 canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT):
+        self.design = design
+        self.objective = get_objective(objective)
+        self.decoder = Decoder(design.slots, allow_rotation, canvas_width, canvas_height)
+        self.population_size = max(population_size, elite + 2)
+        self.elite = elite
+        self.mutation_rate = mutation_rate
+        self.tournament = tournament
+        self.patience = patience
+        self.workers = os.cpu_count() if workers is None else workers
+        self.min_strip = self.decoder.sizes.min(axis=(1, 2)).max()
+        self.generations_run = 0
+
+    def seed_population(self) -> List[Individual]:
+        """Greedy orders (largest first by area, height and width) with a few
+        strip widths, topped up with random individuals"""
+        d = self.decoder
+        sizes = d.sizes[:, 0]
+        area = sizes.prod(axis=1)
+        total = (sizes + MIN_SPACING).prod(axis=1).sum()
+        orders = [np.argsort(-area, kind="stable"), np.argsort(-sizes[:, 1], kind="stable"), np.argsort(-sizes[:, 0], kind="stable")]
+        population = []
+        for factor in (1.0, 1.3):
+            for order in orders:
+                orientation = np.zeros(d.n, dtype=np.int64)
+                population.append(Individual(order, orientation, self.clip_strip(math.sqrt(total) * factor)))
+        while len(population) < self.population_size:
+            population.append(Individual(
+                np.random.permutation(d.n),
+                np.random.randint(d.turns, size=d.n),
+                random.uniform(self.min_strip, d.max_strip),
+            ))
+        return population[:self.population_size]
+
+    def clip_strip(self, strip):
+        return min(max(strip, self.min_strip), self.decoder.max_strip)
+
+    def evaluate(self, population: List[Individual], executor=None):
+        pending = [ind for ind in population if ind.score is None]
+        if not pending:
+            return
+        genes = [ind.genes() for ind in pending]
+        if executor is None:
+            scores = [self.objective.evaluate(self.decoder.decode(*g)) for g in genes]
+        else:
+            chunksize = max(1, len(genes) // (4 * self.workers))
+            scores = list(executor.map(_fitness, genes, chunksize=chunksize))
+        for ind, score in zip(pending, scores):
+            ind.score = score
+
+    def select(self, population) -> Individual:
+        return min(random.sample(population, self.tournament), key=lambda ind: ind.score)
+
+    def crossover(self, a: Individual, b: Individual) -> Individual:
+        order = order_crossover(a.order, b.order)
+        orientation = np.where(np.random.random(len(order)) < 0.5, a.orientation, b.orientation)
+        strip = self.clip_strip(random.uniform(min(a.strip, b.strip), max(a.strip, b.strip)))
+        return Individual(order, orientation, strip)
+
+    def mutate(self, ind: Individual) -> Individual:
+        n = len(ind.order)
+        order, orientation, strip = ind.order.copy(), ind.orientation.copy(), ind.strip
+        if n > 1 and random.random() < self.mutation_rate:
+            i, j = random.sample(range(n), 2)
+            order[[i, j]] = order[[j, i]]
+        if n > 2 and random.random() < self.mutation_rate:
+            i, j = sorted(random.sample(range(n + 1), 2))
+            order[i:j] = order[i:j][::-1]
+        if self.decoder.turns > 1 and random.random() < self.mutation_rate:
+            orientation[random.randrange(n)] = random.randrange(self.decoder.turns)
+        if random.random() < self.mutation_rate:
+            strip = self.clip_strip(strip * random.uniform(0.9, 1.1))
+        return Individual(order, orientation, strip)
+
+    def run(self, generations=100, time_limit=None, target_score=None, checkpoint=None, resume=False,
+            checkpoint_interval=CHECKPOINT_INTERVAL) -> Tuple[Design, float]:
+        """Evolve for up to generations (or until time_limit seconds have
+        passed), returning the best design and its score. Checkpoints are
+        taken between generations, see optimize()."""
+        saved = resume_from(checkpoint, resume, "genetic")
+        checkpointer = checkpointer_for(checkpoint, checkpoint_interval)
+        budget = Budget(generations, time_limit, target_score, saved.elapsed if saved else 0.0)
+        executor = None
+        if self.workers > 1 and self.decoder.n >= POOL_MIN_SLOTS:
+            executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                           initargs=(self.decoder, self.objective))
+        try:
+            if saved is None:
+                population = self.seed_population()
+                self.evaluate(population, executor)
+                best = min(population, key=lambda ind: ind.score)
+                stale = 0
+                start = 0
+            else:
+                arrays = saved.arrays
+                population = unstack_individuals({k: arrays[k] for k in ("order", "orientation", "strip", "score")})
+                if population[0].order.shape != (self.decoder.n,):
+                    raise ValueError(f"Checkpoint has {len(population[0].order)} slots, the design has {self.decoder.n}")
+                best = unstack_individuals({k: arrays[f"best_{k}"][None] for k in ("order", "orientation", "strip", "score")})[0]
+                stale = saved.state["stale"]
+                start = saved.iteration
+                saved.restore_rng()
+
+            def make_checkpoint():
+                arrays = stack_individuals(population)
+                arrays.update({f"best_{k}": v[0] for k, v in stack_individuals([best]).items()})
+                return Checkpoint("genetic", generation, budget.elapsed(),
+                                  {"stale": stale, "best_score": best.score}, arrays)
+
+            for generation in itertools.count(start):
+                if not budget.running(generation, best.score):
+                    break
+                if not budget.timed and stale >= self.patience:
+                    break
+                if checkpointer is not None:
+                    checkpointer.maybe_save(make_checkpoint)
+                population.sort(key=lambda ind: ind.score)
+                children = population[:self.elite]
+                while len(children) < self.population_size:
+                    child = self.crossover(self.select(population), self.select(population))
+                    children.append(self.mutate(child))
+                self.evaluate(children, executor)
+                population = children
+                self.generations_run = generation + 1
+                leader = min(population, key=lambda ind: ind.score)
+                if leader.score < best.score:
+                    best, stale = leader, 0
+                else:
+                    stale += 1
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self.decoder.decode(*best.genes()), best.score
+
+def optimize_genetic(initial_design: Design, iterations=10000, allow_rotation=True, canvas_width=CANVAS_WIDTH,
+                     canvas_height=CANVAS_HEIGHT, objective=None, population_size=40, workers=None,
+                     time_limit=None, target_score=None, checkpoint=None, resume=False,
+                     checkpoint_interval=CHECKPOINT_INTERVAL) -> Design:
+    """GA counterpart of optimize(): iterations is the budget of fitness
+    evaluations, so the two engines cost about the same per iteration, unless
+    time_limit is given"""
+    if not initial_design.slots:
+        return initial_design
+    optimizer = GeneticOptimizer(initial_design, objective, allow_rotation, population_size,
+                                 workers=workers, canvas_width=canvas_width, canvas_height=canvas_height)
+    generations = max(1, iterations // optimizer.population_size)
+    design, _ = optimizer.run(generations, time_limit, target_score, checkpoint, resume, checkpoint_interval)
+    return constrain_to_canvas(design, canvas_width, canvas_height)
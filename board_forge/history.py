@@ -0,0 +1,82 @@
+from typing import List, Optional, Tuple
+from shapely.geometry import Polygon
+
+CHUNK_SIZE = 32
+
+class SlotSnapshot:
+    """Immutable list of slots stored as a tuple of fixed-size chunks.
+
+    Building a snapshot from the previous one reuses every chunk whose slots
+    are unchanged, so consecutive snapshots only store the chunks that were
+    edited plus one small tuple of chunk references.
+    """
+
+    __slots__ = ("chunks", "length")
+
+    def __init__(self, chunks: Tuple[tuple, ...], length: int):
+        self.chunks = chunks
+        self.length = length
+
+    @classmethod
+    def from_slots(cls, slots: List[Polygon], base: Optional["SlotSnapshot"] = None) -> "SlotSnapshot":
+        base_chunks = base.chunks if base is not None else ()
+        chunks = []
+        for n, start in enumerate(range(0, len(slots), CHUNK_SIZE)):
+            chunk = tuple(slots[start:start + CHUNK_SIZE])
+            # Tuple comparison checks identity first, so unchanged chunks are cheap to spot
+            if n < len(base_chunks) and base_chunks[n] == chunk:
+                chunk = base_chunks[n]
+            chunks.append(chunk)
+        return cls(tuple(chunks), len(slots))
+
+    def to_list(self) -> List[Polygon]:
+        return [slot for chunk in self.chunks for slot in chunk]
+
+    def __len__(self):
+        return self.length
+
+class History:
+    """Linear undo/redo history of board states"""
+
+    def __init__(self, slots: Optional[List[Polygon]] = None, limit=1000):
+        self.limit = limit
+        self._states = [SlotSnapshot.from_slots(slots or [])]
+        self._index = 0
+
+    @property
+    def can_undo(self) -> bool:
+        return self._index > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return self._index < len(self._states) - 1
+
+    def record(self, slots: List[Polygon]):
+        """Record the board state after an edit, discarding any redo states"""
+        current = self._states[self._index]
+        snapshot = SlotSnapshot.from_slots(slots, base=current)
+        if snapshot.chunks == current.chunks:
+            return  # nothing changed
+        del self._states[self._index + 1:]
+        self._states.append(snapshot)
+        if len(self._states) > self.limit:
+            del self._states[0]
+        self._index = len(self._states) - 1
+
+    def undo(self) -> Optional[List[Polygon]]:
+        """Step back and return the previous slots, or None if there is nothing to undo"""
+        if not self.can_undo:
+            return None
+        self._index -= 1
+        return self._states[self._index].to_list()
+
+    def redo(self) -> Optional[List[Polygon]]:
+        if not self.can_redo:
+            return None
+        self._index += 1
+        return self._states[self._index].to_list()
+
+    def reset(self, slots: List[Polygon]):
+        """Start a fresh history, e.g. after opening a project"""
+        self._states = [SlotSnapshot.from_slots(slots)]
+        self._index = 0
@@ -0,0 +1,316 @@
+"""Lattice tiling of groups of identical pieces.
+
+Boards often hold many copies of one piece (roads, cubes, tokens). Rather than
+annealing each copy, every group of at least LATTICE_MIN_COPIES identical
+slots is packed once into a dense periodic block, and the optimizer moves the
+block's convex hull as one rigid meta-piece. Anything clear of the hull is
+clear of the pieces in it, so the block's pieces only need MIN_SPACING among
+themselves, which the tiling guarantees.
+
+A block repeats a motif, either one piece or a piece paired with a copy
+turned 180 degrees (which interlocks triangles, meeples and the like), at
+either orientation when rotation is allowed. Motifs are spaced as closely as
+MIN_SPACING allows along rows, and rows are stacked either straight or offset
+by a shift on alternate rows (a brick pattern), whichever is densest. Gaps are
+found by scanning a translation down from where the shapes are certainly clear
+in steps of at most SCAN_RESOLUTION, then rescanning REFINE_ROUNDS times in
+REFINE_STEPS finer steps between the last clear step and the first close one.
+Every step is tested, so concave pieces are handled too.
+"""
+import math
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+import shapely
+from shapely.affinity import affine_transform, rotate, translate
+from shapely.geometry import MultiPolygon, Polygon
+from shapely.geometry.polygon import orient
+from board_forge.checkpoint import resume_from
+from board_forge.convex import outline_features
+from board_forge.design import Design, PADDING
+from board_forge.objectives import AspectRatioArea, BoundingBoxArea
+from board_forge.optimize import MIN_SPACING, CANVAS_MARGIN, CANVAS_WIDTH, CANVAS_HEIGHT
+
+LATTICE_MIN_COPIES = 6  # smallest group of identical pieces worth tiling
+# A hair of extra clearance so rotating a block can't put pieces 9.99999mm apart
+CLEARANCE_EPS = 1e-6
+ROW_SHIFTS = 12  # row offsets tried per motif
+SQUARENESS_SLACK = 0.1  # extra block area allowed for a squarer block
+# Translations scanned before refining the closest clear one: at least
+# SCAN_STEPS, at most SCAN_RESOLUTION mm apart, as a piece can slip past
+# another through a gap narrower than a step
+SCAN_STEPS = 48
+SCAN_RESOLUTION = 0.5
+# The closest clear translation is then narrowed down by rescanning between
+# the last clear step and the first close one
+REFINE_STEPS = 32
+REFINE_ROUNDS = 3
+# Objectives that only depend on the board's extents, which a hull preserves
+TILING_OBJECTIVES = (BoundingBoxArea, AspectRatioArea)
+TILE_CACHE_SIZE = 64  # blocks kept by cached_tile, and pieces' lattices by motif_lattices
+# With a time limit, tiling may take this share of it. Groups not tiled by
+# then are optimized piece by piece (and tiled from the cache next time).
+TILING_TIME_SHARE = 0.5
+# The run on the tiled design checkpoints next to the caller's checkpoint
+TILED_CHECKPOINT_SUFFIX = ".tiled"
+
+# Caches, least recently used first
+_tiles = {}  # cached_tile's blocks
+_lattices = {}  # motif_lattices' motifs and the lattices found for them so far
+
+def _remember(cache, key, value):
+    cache.pop(key, None)
+    cache[key] = value
+    if len(cache) > TILE_CACHE_SIZE:
+        del cache[next(iter(cache))]
+    return value
+
+def shape_key(slot: Polygon, allow_rotation=True) -> bytes:
+    """Key equal for slots that are copies of one piece: moved copies, and
+    also rotated copies when allow_rotation"""
+    coords = shapely.get_coordinates(orient(slot, 1.0).exterior)
+    if not allow_rotation:
+        # The same vertices relative to the bounding box, whatever the start vertex
+        points = np.round(coords[:-1] - coords.min(axis=0), 4)
+        return points[np.lexsort(points.T[::-1])].tobytes()
+    features = outline_features(coords, np.array([0, len(coords)]))[:-1]
+    # Edge lengths and turns don't change with rotation, only the start vertex does
+    return min(np.roll(features, -k, axis=0).tobytes() for k in range(len(features)))
+
+def identical_groups(slots, allow_rotation=True, min_copies=LATTICE_MIN_COPIES) -> List[List[int]]:
+    """Indices of each group of at least min_copies identical slots without holes"""
+    groups = {}
+    for i, slot in enumerate(slots):
+        if not slot.interiors:
+            groups.setdefault(shape_key(slot, allow_rotation), []).append(i)
+    return [group for group in groups.values() if len(group) >= min_copies]
+
+def translated(geom, offsets) -> np.ndarray:
+    """Copies of geom translated by each row of the (k, 2) offsets, in one call"""
+    copies = np.empty(len(offsets), dtype=object)
+    copies[:] = [geom] * len(offsets)
+    per_copy = shapely.get_num_coordinates(geom)
+    return shapely.transform(copies, lambda coords: coords + np.repeat(offsets, per_copy, axis=0))
+
+def min_shift(fixed, moving, direction, clearance) -> float:
+    """Smallest t >= 0 such that moving, translated by t * direction, is at
+    least clearance from fixed there and at every larger t (to within
+    SCAN_RESOLUTION / REFINE_STEPS ** REFINE_ROUNDS, always on the clear side)"""
+    u = np.asarray(direction, dtype=float)
+    # From hi on the shapes' projections onto direction are more than clearance apart
+    hi = (shapely.get_coordinates(fixed) @ u).max() - (shapely.get_coordinates(moving) @ u).min() + clearance + 1.0
+    ts = np.linspace(max(hi, 0.0), 0.0, max(SCAN_STEPS, math.ceil(hi / SCAN_RESOLUTION)) + 1)
+    for round in range(REFINE_ROUNDS + 1):
+        if round:
+            # Rescan between the last clear step and the first close one
+            ts = np.linspace(good, bad, REFINE_STEPS + 1)
+        close = np.flatnonzero(shapely.distance(fixed, translated(moving, ts[:, None] * u)) < clearance)
+        if not len(close):
+            return ts[-1]
+        if close[0] == 0:
+            return ts[0]
+        good, bad = ts[close[0] - 1], ts[close[0]]
+    return good
+
+def motifs(piece: Polygon, allow_rotation, clearance) -> List[List[Polygon]]:
+    """Candidate motifs for tiling piece: single pieces and, with rotation,
+    pairs with a copy turned 180 degrees beside or above"""
+    result = []
+    for angle in ((0, 90) if allow_rotation else (0,)):
+        p = rotate(piece, angle, origin="centroid") if angle else piece
+        result.append([p])
+        if not allow_rotation:
+            continue
+        q = rotate(p, 180, origin="centroid")
+        min_x, min_y, max_x, max_y = p.bounds
+        for direction, offsets in (((1, 0), np.linspace(-(max_y - min_y), max_y - min_y, 9)),
+                                   ((0, 1), np.linspace(-(max_x - min_x), max_x - min_x, 9))):
+            best = None
+            for offset in offsets:
+                start = translate(q, *(offset * np.array(direction[::-1])))
+                t = min_shift(p, start, direction, clearance)
+                pair = [p, translate(start, *(t * np.array(direction)))]
+                area = shapely.area(shapely.envelope(MultiPolygon(pair)))
+                if best is None or area < best[0] - 1e-9:
+                    best = area, pair
+            result.append(best[1])
+    return result
+
+def row_lattice(motif: List[Polygon], clearance) -> Tuple[float, float, float]:
+    """(dx, shift, dy) of the densest arrangement of motif in rows dx apart,
+    with rows dy apart and every other row shifted right by shift"""
+    block = MultiPolygon(motif)
+    dx = min_shift(block, block, (1, 0), clearance)
+    min_x, _, max_x, _ = block.bounds
+    # Enough of a row to reach anything near a copy of block shifted along it by up to dx
+    reach = math.ceil((max_x - min_x + clearance) / dx) + 1
+    row = MultiPolygon([p for k in range(-reach, reach + 1) for p in translate(block, k * dx, 0).geoms])
+    straight = min_shift(row, block, (0, 1), clearance)
+    best = dx * straight, 0.0, straight
+    for shift in np.linspace(0, dx, ROW_SHIFTS, endpoint=False)[1:]:
+        # Row 1 sits shift right of row 0, row 2 shift left of row 1, so both must clear
+        dy = max(min_shift(row, translate(block, shift, 0), (0, 1), clearance),
+                 min_shift(row, translate(block, shift - dx, 0), (0, 1), clearance),
+                 straight / 2)  # rows two apart are straight above each other
+        if dx * dy < best[0] - 1e-9:
+            best = dx * dy, shift, dy
+    return dx, best[1], best[2]
+
+def motif_lattices(piece: Polygon, allow_rotation=True, clearance=MIN_SPACING + CLEARANCE_EPS,
+                   deadline=None) -> Optional[List[tuple]]:
+    """(motif, dx, shift, dy) for each of piece's motifs (see row_lattice), or
+    None if time.monotonic() passes deadline first. Lattices are remembered
+    per piece shape as they are found, so a call cut short carries on from
+    there next time."""
+    key = (shape_key(piece, allow_rotation), allow_rotation, clearance)
+    pending, found = _lattices.get(key) or (motifs(piece, allow_rotation, clearance), [])
+    _remember(_lattices, key, (pending, found))
+    while len(found) < len(pending):
+        if deadline is not None and time.monotonic() > deadline:
+            return None
+        motif = pending[len(found)]
+        found.append((motif,) + row_lattice(motif, clearance))
+    return found
+
+def tile(piece: Polygon, count, allow_rotation=True, clearance=MIN_SPACING + CLEARANCE_EPS,
+         max_width=math.inf, max_height=math.inf, deadline=None) -> Optional[List[Polygon]]:
+    """count copies of piece packed into the block with the smallest bounding
+    box that fits max_width x max_height (if any does), lower-left at the origin.
+    Of blocks within SQUARENESS_SLACK of the smallest, the squarest is taken,
+    as a long strip is hard to fit among the other pieces. None if no block
+    passes the final clearance check, or if time.monotonic() passes deadline."""
+    lattices = motif_lattices(piece, allow_rotation, clearance, deadline)
+    if lattices is None:
+        return None
+    candidates = []
+    for motif, dx, shift, dy in lattices:
+        motif_bounds = shapely.bounds(MultiPolygon(motif))
+        motif_w, motif_h = motif_bounds[2] - motif_bounds[0], motif_bounds[3] - motif_bounds[1]
+        slots_needed = math.ceil(count / len(motif))
+        for cols in range(1, slots_needed + 1):
+            rows = math.ceil(slots_needed / cols)
+            width = (cols - 1) * dx + (shift if rows > 1 else 0) + motif_w
+            height = (rows - 1) * dy + motif_h
+            fits = width <= max_width and height <= max_height
+            # Half the spacing around the block belongs to it
+            area = (width + clearance) * (height + clearance)
+            candidates.append((not fits, area, max(width / height, height / width), motif, dx, shift, dy, cols))
+    misfit = min(c[0] for c in candidates)
+    smallest = min(c[1] for c in candidates if c[0] == misfit)
+    candidates = [c for c in candidates if c[0] == misfit and c[1] <= smallest * (1 + SQUARENESS_SLACK)]
+    for _, _, _, motif, dx, shift, dy, cols in sorted(candidates, key=lambda c: c[2]):
+        members = []
+        for k in range(math.ceil(count / len(motif))):
+            row, col = divmod(k, cols)
+            offset = (col * dx + (shift if row % 2 else 0), row * dy)
+            members.extend(translate(p, *offset) for p in motif)
+        members = members[:count]
+        # The scans can still miss a gap too narrow to see, so check the block
+        if Design(members).is_valid:
+            min_x, min_y, _, _ = shapely.bounds(MultiPolygon(members))
+            return [translate(p, -min_x, -min_y) for p in members]
+    return None
+
+def cached_tile(piece: Polygon, count, allow_rotation=True, clearance=MIN_SPACING + CLEARANCE_EPS,
+                max_width=math.inf, max_height=math.inf, deadline=None) -> Optional[List[Polygon]]:
+    """tile(), remembering the last TILE_CACHE_SIZE blocks by piece shape and
+    parameters. A block cut short by deadline isn't remembered."""
+    key = (shape_key(piece, allow_rotation), count, allow_rotation, clearance, max_width, max_height)
+    if key in _tiles:
+        return _remember(_tiles, key, _tiles[key])
+    members = tile(piece, count, allow_rotation, clearance, max_width, max_height, deadline)
+    if members is not None or deadline is None or time.monotonic() <= deadline:
+        _remember(_tiles, key, members)
+    return members
+
+def rigid_transform(before: Polygon, after: Polygon) -> Optional[List[float]]:
+    """Affine matrix (for shapely's affine_transform) of the rotation and
+    translation taking before to after, with their vertices matched in order,
+    or None if after isn't a rigid motion of before"""
+    a = shapely.get_coordinates(before)
+    b = shapely.get_coordinates(after)
+    if a.shape != b.shape:
+        return None
+    ca, cb = a.mean(axis=0), b.mean(axis=0)
+    # Kabsch: the rotation best aligning the centred point sets
+    h = (a - ca).T @ (b - cb)
+    u, _, vt = np.linalg.svd(h)
+    r = (u @ vt).T
+    if np.linalg.det(r) < 0:
+        return None
+    t = cb - r @ ca
+    if np.abs(a @ r.T + t - b).max() > 1e-6:
+        return None
+    return [r[0, 0], r[0, 1], r[1, 0], r[1, 1], t[0], t[1]]
+
+def optimize_tiled(initial_design: Design, iterations=10000, alpha=None, allow_rotation=True,
+                   canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT, objective=None,
+                   time_limit=None, checkpoint=None, resume=False, **kwargs) -> Optional[Design]:
+    """optimize() with each large group of identical slots tiled into a block
+    and moved as one piece. Returns None straight away if there is no such
+    group, so the caller can optimize slot by slot. If tiling doesn't finish
+    within TILING_TIME_SHARE of time_limit, or the tiled result isn't valid,
+    the time left goes to optimizing slot by slot here. The tiled design's
+    run checkpoints to checkpoint + TILED_CHECKPOINT_SUFFIX."""
+    # Imported here, optimize() imports this module lazily too
+    from board_forge.optimize import optimize
+    start = time.monotonic()
+    deadline = start + TILING_TIME_SHARE * time_limit if time_limit is not None else None
+    slots = initial_design.slots
+    groups = identical_groups(slots, allow_rotation)
+    if not groups:
+        return None
+    clearance = MIN_SPACING + CLEARANCE_EPS
+    margin = 2 * (CANVAS_MARGIN + PADDING)
+    blocks = []
+    for group in groups:
+        members = cached_tile(slots[group[0]], len(group), allow_rotation, clearance,
+                              canvas_width - margin, canvas_height - margin, deadline)
+        if members is None:
+            continue
+        # Start the block where its group's pieces were
+        corner = shapely.bounds(MultiPolygon([slots[i] for i in group]))[:2]
+        members = [translate(p, *corner) for p in members]
+        blocks.append((group, members, shapely.convex_hull(MultiPolygon(members))))
+
+    def time_left():
+        return None if time_limit is None else max(0.0, time_limit - (time.monotonic() - start))
+
+    def optimize_slots():
+        # The caller has already tried the rectangle engine
+        return optimize(initial_design, iterations, alpha, allow_rotation, canvas_width, canvas_height, objective,
+                        fast_rectangles=False, tiling=False, time_limit=time_left(), checkpoint=checkpoint,
+                        resume=resume, **kwargs)
+
+    if not blocks:
+        return optimize_slots()
+    tiled = {i for group, _, _ in blocks for i in group}
+    singles = [i for i in range(len(slots)) if i not in tiled]
+    reduced = Design([slots[i] for i in singles] + [hull for _, _, hull in blocks])
+    tiled_checkpoint = checkpoint + TILED_CHECKPOINT_SUFFIX if checkpoint else None
+    # The rectangle engine rebuilds its boxes, losing the vertex order the hulls' transforms are recovered from
+    result = optimize(reduced, iterations, alpha, allow_rotation, canvas_width, canvas_height, objective,
+                      fast_rectangles=False, tiling=False, time_limit=time_left(), checkpoint=tiled_checkpoint,
+                      resume=resume and checkpoint_fits(tiled_checkpoint, len(reduced.slots)), **kwargs)
+
+    placed = list(slots)
+    for k, i in enumerate(singles):
+        placed[i] = result.slots[k]
+    for k, (group, members, hull) in enumerate(blocks):
+        matrix = rigid_transform(hull, result.slots[len(singles) + k])
+        if matrix is None:
+            break
+        for i, member in zip(group, members):
+            placed[i] = affine_transform(member, matrix)
+    else:
+        design = Design(placed)
+        if design.is_valid:
+            return design
+    return optimize_slots()
+
+def checkpoint_fits(path, slot_count) -> bool:
+    """Whether the anneal checkpoint at path (if any) is of a design with
+    slot_count slots. Tiling can come out differently from one call to the
+    next, for instance when a time limit cuts it short."""
+    saved = resume_from(path, True, "anneal")
+    return saved is None or len(saved.slots("current")) == slot_count
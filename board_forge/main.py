@@ -3,16 +3,62 @@ from tkinter import ttk, messagebox, simpledialog, filedialog, Menu
 import os
 import sys
 import math
+import time
+import importlib
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Optional, TYPE_CHECKING
 from shapely.affinity import rotate as shapely_rotate
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from ui.board_view import BoardCanvas
+from ui.board_view import BoardCanvas, ZOOM_STEP
 from design import Design
-from data.sample_pieces import SAMPLE_PIECES, get_piece
+from data.sample_pieces import get_piece, piece_library
 from shapely.geometry import Polygon, box
 from piece import Piece
-from data.piece_dimensions import piece_dims
+from history import History
+
+if TYPE_CHECKING:
+    from multiprocessing.pool import AsyncResult, Pool
+
+# Checkpoint of GUI optimize runs for projects that haven't been saved yet
+UNSAVED_CHECKPOINT = os.path.join(tempfile.gettempdir(), "board_forge-unsaved.checkpoint")
+
+# Heavy modules that are only needed once a feature is used. They are imported
+# lazily by those features, and optionally preloaded in the background once the
+# window is up so the first optimize/export/import doesn't stall.
+PRELOAD_MODULES = [
+    "board_forge.optimize",
+    "svgwrite",
+    "data.batch_import",
+    "data.piece_dimensions",
+]
+
+def preload_modules(modules=PRELOAD_MODULES):
+    """Import the given modules, ignoring any that fail (they fail again, with a
+    proper error, when the feature that needs them is used)"""
+    start = time.perf_counter()
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"Preloading {name} failed: {e}")
+    print(f"Preloaded {len(modules)} modules in {time.perf_counter() - start:.2f}s")
+
+def optimize_in_worker(options):
+    """Worker process entry point for the GUI's optimize runs"""
+    from board_forge.optimize import optimize
+    return optimize(**options)
+
+@dataclass
+class OptimizationRun:
+    pool: "Pool"
+    result: "AsyncResult"
+    start: float
+    time_limit: Optional[float]
+    allow_rotation: bool
 
 class GamePieceOrganizerApp:
     def __init__(self, root):
@@ -23,6 +69,9 @@ class GamePieceOrganizerApp:
         # Load and set the logo/icon
         self.design = Design(slots=[])
         self.pieces = []
+        self.history = History()
+        self.project_path = None
+        self.optimization: Optional[OptimizationRun] = None
 
         self.board_width = 300
         self.board_height = 400
@@ -70,6 +119,7 @@ class GamePieceOrganizerApp:
         self.board.set_app(self)
         
         # Create controls
+        self.create_menu_bar()
         self.context_menu = Menu(root, tearoff=0)
         self.piece_list = self.create_piece_display()
         
@@ -87,6 +137,116 @@ class GamePieceOrganizerApp:
         )
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
+    def create_menu_bar(self):
+        menu_bar = Menu(self.root)
+        file_menu = Menu(menu_bar, tearoff=0)
+        file_menu.add_command(label="Open Project...", command=self.open_project)
+        file_menu.add_command(label="Save Project...", command=self.save_project)
+        menu_bar.add_cascade(label="File", menu=file_menu)
+        edit_menu = Menu(menu_bar, tearoff=0)
+        edit_menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self.undo)
+        edit_menu.add_command(label="Redo", accelerator="Ctrl+Y", command=self.redo)
+        menu_bar.add_cascade(label="Edit", menu=edit_menu)
+        view_menu = Menu(menu_bar, tearoff=0)
+        view_menu.add_command(label="Zoom In", accelerator="Wheel up",
+                              command=lambda: self.board.zoom(ZOOM_STEP, self.board.winfo_width() / 2,
+                                                              self.board.winfo_height() / 2))
+        view_menu.add_command(label="Zoom Out", accelerator="Wheel down",
+                              command=lambda: self.board.zoom(1 / ZOOM_STEP, self.board.winfo_width() / 2,
+                                                              self.board.winfo_height() / 2))
+        view_menu.add_command(label="Fit Board", accelerator="F", command=self.board.fit_view)
+        view_menu.add_command(label="Actual Size", accelerator="0", command=self.board.reset_view)
+        menu_bar.add_cascade(label="View", menu=view_menu)
+        self.root.config(menu=menu_bar)
+        self.root.bind("<Control-z>", lambda event: self.undo())
+        self.root.bind("<Control-y>", lambda event: self.redo())
+        self.root.bind("<Control-Shift-Z>", lambda event: self.redo())
+
+    def record_history(self):
+        """Record the board after an edit so it can be undone"""
+        self.history.record(self.design.slots)
+
+    def restore_slots(self, slots, action):
+        self.design.slots = slots
+        self.board.selected_slot = None
+        self.board.update_view()
+        self.status_var.set(action)
+
+    def undo(self):
+        slots = self.history.undo()
+        if slots is None:
+            self.status_var.set("Nothing to undo")
+        else:
+            self.restore_slots(slots, "Undid last change")
+
+    def redo(self):
+        slots = self.history.redo()
+        if slots is None:
+            self.status_var.set("Nothing to redo")
+        else:
+            self.restore_slots(slots, "Redid last change")
+
+    def save_project(self):
+        """Save the piece library, slots and optimizer settings to a project file"""
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".bfp",
+            filetypes=[("Board Forge projects", "*.bfp"), ("All files", "*.*")],
+            title="Save Project"
+        )
+        if not file_path:
+            return
+        try:
+            from project import Project, save_project
+            settings = {
+                "allow_rotation": self.allow_rotation_var.get(),
+                "rotation_step": self.rotation_var.get(),
+                "scale": self.scale_var.get(),
+                "engine": self.engine_var.get(),
+                "time_limit": self.time_limit_var.get(),
+            }
+            save_project(file_path, Project(self.pieces, self.design, settings))
+            self.project_path = file_path
+            self.status_var.set(f"Saved project to {file_path}")
+        except Exception as e:
+            messagebox.showerror("Save Error", f"Failed to save project: {e}")
+
+    def open_project(self):
+        """Replace the current pieces and board with those from a project file"""
+        file_path = filedialog.askopenfilename(
+            filetypes=[("Board Forge projects", "*.bfp"), ("All files", "*.*")],
+            title="Open Project"
+        )
+        if not file_path:
+            return
+        try:
+            from project import load_project
+            project = load_project(file_path)
+        except Exception as e:
+            messagebox.showerror("Open Error", f"Failed to open project: {e}")
+            return
+        self.project_path = file_path
+        self.pieces = project.pieces
+        self.piece_list.delete(0, tk.END)
+        for piece in self.pieces:
+            self.piece_list.insert(tk.END, piece.name)
+        self.design = project.design
+        self.board.design = self.design
+        self.board.selected_slot = None
+        self.history.reset(self.design.slots)
+        settings = project.settings
+        if "allow_rotation" in settings:
+            self.allow_rotation_var.set(settings["allow_rotation"])
+        if "rotation_step" in settings:
+            self.rotation_var.set(settings["rotation_step"])
+        if "scale" in settings:
+            self.scale_var.set(settings["scale"])
+        if "engine" in settings:
+            self.engine_var.set(settings["engine"])
+        if "time_limit" in settings:
+            self.time_limit_var.set(settings["time_limit"])
+        self.board.update_view()
+        self.status_var.set(f"Opened {file_path}: {len(self.pieces)} pieces, {len(self.design.slots)} slots")
+
     def create_piece_display(self):
         display_frame = ttk.LabelFrame(self.right_frame, text="Piece List")
 
@@ -101,6 +261,27 @@ class GamePieceOrganizerApp:
 
         self.add_image_button = tk.Button(display_frame, text="Add from File", command=self.add_from_image)
         self.add_image_button.pack(pady=5)
+        self.add_folder_button = tk.Button(display_frame, text="Add from Folder", command=self.add_from_folder)
+        self.add_folder_button.pack(pady=5)
+        self.batch = None
+
+        contour_frame = ttk.Frame(display_frame)
+        contour_frame.pack(pady=(0, 5))
+        self.import_contours_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            contour_frame,
+            text="Import outlines, max vertices:",
+            variable=self.import_contours_var
+        ).pack(side=tk.LEFT)
+        self.max_vertices_var = tk.IntVar(value=12)
+        ttk.Spinbox(
+            contour_frame,
+            from_=3,
+            to=64,
+            increment=1,
+            textvariable=self.max_vertices_var,
+            width=4
+        ).pack(side=tk.LEFT, padx=(5, 0))
         
         self.context_menu.add_command(label="Rename", command=self.rename_piece)
         self.context_menu.add_command(label="Delete", command=self.delete_selected)
@@ -118,16 +299,70 @@ class GamePieceOrganizerApp:
             pass
     
     def add_from_image(self):
-        file_path = filedialog.askopenfilename(filetypes=[("Image Files", "*.png *.jpg")])
-        num_pieces = simpledialog.askinteger("Number of Piece Selection", "How many pieces in your image?")
+        file_paths = filedialog.askopenfilenames(filetypes=[("Image Files", "*.png *.jpg *.jpeg *.JPG")])
+        if file_paths:
+            self.start_batch_import(list(file_paths))
+
+    def add_from_folder(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            from data.batch_import import image_files
+            file_paths = image_files(folder)
+            if not file_paths:
+                messagebox.showinfo("Error", f"No images found in {folder}")
+                return
+            self.start_batch_import(file_paths)
+
+    def start_batch_import(self, file_paths):
+        """Measure the photos in a worker pool and add pieces as each one finishes"""
+        if self.batch is not None and not self.batch.done:
+            messagebox.showinfo("Error", "An import is already running")
+            return
+        num_pieces = simpledialog.askinteger("Number of Piece Selection", "How many pieces in each image?")
         width = simpledialog.askfloat("Index Piece Size", "What is the width in milimeters of your largest object?")
-        if file_path:
-            name = file_path.split("/")[-1]  # Extracts filename
-            dims = piece_dims(file_path, width=width, num_pieces=num_pieces)
-            for i, (width,height) in enumerate(dims):
-                piece = Piece(f'{name} {i}', box(0, 0, width, height))
+        if num_pieces is None or width is None:
+            return
+        from data.batch_import import BatchImport
+        from data.measure_cache import DEFAULT_CACHE_DIR
+        max_vertices = self.max_vertices_var.get() if self.import_contours_var.get() else None
+        self.batch = BatchImport(file_paths, width, num_pieces, max_vertices=max_vertices,
+                                 cache_dir=DEFAULT_CACHE_DIR)
+        self.add_image_button.config(state=tk.DISABLED)
+        self.add_folder_button.config(state=tk.DISABLED)
+        self.status_var.set(f"Importing {len(file_paths)} image(s)...")
+        self.root.after(100, self.poll_batch_import)
+
+    def poll_batch_import(self):
+        batch = self.batch
+        for result in batch.completed():
+            name = os.path.basename(result.path)
+            if result.error:
+                print(f"Import failed for {name} after {result.seconds:.2f}s: {result.error}")
+                continue
+            for i, shape in enumerate(result.shapes):
+                piece = Piece(f'{name} {i}', shape)
                 self.pieces.append(piece)
                 self.piece_list.insert(tk.END, piece.name)
+            source = "cache hit" if result.cached else "cache miss"
+            print(f"Imported {name}: {len(result.shapes)} piece(s) in {result.seconds:.2f}s ({source})")
+            self.status_var.set(f"Imported {len(batch.results)}/{batch.total}: {name} ({result.seconds:.2f}s, {source})")
+
+        if not batch.done:
+            self.root.after(100, self.poll_batch_import)
+            return
+
+        self.add_image_button.config(state=tk.NORMAL)
+        self.add_folder_button.config(state=tk.NORMAL)
+        elapsed = time.perf_counter() - batch.start
+        failures = batch.failures
+        self.status_var.set(
+            f"Imported {batch.total - len(failures)}/{batch.total} image(s) in {elapsed:.1f}s"
+            + f" ({batch.cache_hits} cache hits, {batch.total - batch.cache_hits} misses)"
+            + (f", {len(failures)} failed" if failures else "")
+        )
+        if failures:
+            details = "\n".join(f"{os.path.basename(r.path)}: {r.error}" for r in failures)
+            messagebox.showerror("Import Errors", f"Some images could not be measured:\n{details}")
     
     def add_selected(self):
         selected_index = self.piece_list.curselection()
@@ -200,6 +435,42 @@ class GamePieceOrganizerApp:
             command=self.add_custom_polygon
         )
         add_btn.pack(fill=tk.X, padx=5, pady=5)
+
+        # Pieces from the library, filtered by tag. The lists are filled when
+        # opened, so the library's collections aren't loaded at startup.
+        ttk.Label(piece_frame, text="Or pick a library piece:").pack(padx=5, pady=(5, 0))
+        library_frame = ttk.Frame(piece_frame)
+        library_frame.pack(fill=tk.X, padx=5, pady=5)
+        self.tag_var = tk.StringVar(value="all")
+        self.tag_combo = ttk.Combobox(
+            library_frame,
+            textvariable=self.tag_var,
+            values=["all"],
+            postcommand=lambda: self.tag_combo.configure(values=["all"] + piece_library().tags()),
+            state="readonly",
+            width=10
+        )
+        self.tag_combo.pack(side=tk.LEFT)
+        self.tag_combo.bind("<<ComboboxSelected>>", lambda event: self.piece_var.set(""))
+        self.piece_var = tk.StringVar()
+        self.piece_combo = ttk.Combobox(
+            library_frame,
+            textvariable=self.piece_var,
+            postcommand=self.update_piece_choices,
+            state="readonly",
+            width=14
+        )
+        self.piece_combo.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        ttk.Button(
+            piece_frame,
+            text="Add Library Piece",
+            command=self.add_piece_to_board
+        ).pack(fill=tk.X, padx=5, pady=5)
+
+    def update_piece_choices(self):
+        """Fill the piece list with the library pieces of the selected tag"""
+        tag = self.tag_var.get()
+        self.piece_combo.configure(values=piece_library().names(None if tag == "all" else tag))
         
     def add_custom_polygon(self, custom=True, polygon=None):
         """Add a custom polygon to the board based on user input"""
@@ -258,6 +529,7 @@ class GamePieceOrganizerApp:
                 self.pieces.append(piece)
                 self.piece_list.insert(tk.END, piece.name)
             self.design.slots.append(polygon)
+            self.record_history()
             self.board.update_view()
             self.status_var.set(f"Added custom polygon with {len(polygon.exterior.coords)} points")
         except Exception as e:
@@ -336,13 +608,51 @@ class GamePieceOrganizerApp:
         )
         rotation_check.pack(fill=tk.X, padx=5, pady=5)
         
+        objective_frame = ttk.Frame(opt_frame)
+        objective_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(objective_frame, text="Minimize:").pack(side=tk.LEFT)
+        self.objective_var = tk.StringVar(value="area")
+        ttk.Combobox(
+            objective_frame,
+            textvariable=self.objective_var,
+            values=["area", "aspect", "cut_length", "adjacency"],
+            state="readonly",
+            width=12
+        ).pack(side=tk.LEFT, padx=(5, 0))
+        
+        engine_frame = ttk.Frame(opt_frame)
+        engine_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(engine_frame, text="Engine:").pack(side=tk.LEFT)
+        self.engine_var = tk.StringVar(value="anneal")
+        ttk.Combobox(
+            engine_frame,
+            textvariable=self.engine_var,
+            values=["anneal", "genetic"],
+            state="readonly",
+            width=12
+        ).pack(side=tk.LEFT, padx=(5, 0))
+        
+        # Seconds to optimize for, 0 to run a fixed number of iterations instead
+        time_frame = ttk.Frame(opt_frame)
+        time_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(time_frame, text="Time limit (s):").pack(side=tk.LEFT)
+        self.time_limit_var = tk.DoubleVar(value=0)
+        ttk.Spinbox(
+            time_frame,
+            from_=0,
+            to=600,
+            increment=5,
+            textvariable=self.time_limit_var,
+            width=5
+        ).pack(side=tk.LEFT, padx=(5, 0))
+        
         # Button to run optimization
-        optimize_btn = ttk.Button(
+        self.optimize_button = ttk.Button(
             opt_frame,
             text="Optimize Slot Placement",
             command=self.run_optimization
         )
-        optimize_btn.pack(fill=tk.X, padx=5, pady=5)
+        self.optimize_button.pack(fill=tk.X, padx=5, pady=5)
         
         # Export buttons
         export_frame = ttk.Frame(opt_frame)
@@ -376,6 +686,7 @@ class GamePieceOrganizerApp:
             
             # Add it to the design and update the view
             self.design.slots.append(piece)
+            self.record_history()
             self.board.update_view()
             self.status_var.set(f"Added {piece_name} (scale: {scale})")
         except Exception as e:
@@ -395,6 +706,7 @@ class GamePieceOrganizerApp:
             index = self.board.selected_slot
             if 0 <= index < len(self.design.slots):
                 self.design.slots.pop(index)
+                self.record_history()
                 self.board.selected_slot = None
                 self.board.update_view()
                 self.status_var.set("Removed selected slot")
@@ -403,6 +715,7 @@ class GamePieceOrganizerApp:
         """Remove all slots from the design"""
         if messagebox.askyesno("Confirm", "Are you sure you want to remove all slots?"):
             self.design.slots = []
+            self.record_history()
             if hasattr(self.board, 'selected_slot'):
                 self.board.selected_slot = None
             self.board.update_view()
@@ -420,71 +733,109 @@ class GamePieceOrganizerApp:
         
         self.board.rotate_selected_slot(angle=angle)
     
+    def checkpoint_paths(self):
+        """Where optimize runs of this project checkpoint to, and the reduced
+        run of a tiled design checkpoints beside it"""
+        from board_forge.lattice import TILED_CHECKPOINT_SUFFIX
+        path = self.project_path + ".checkpoint" if self.project_path else UNSAVED_CHECKPOINT
+        return path, path + TILED_CHECKPOINT_SUFFIX
+
+    def discard_checkpoint(self):
+        """Delete this project's checkpoints, so a later run can't resume a finished or abandoned one"""
+        for path in self.checkpoint_paths():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
     def run_optimization(self):
-        """Run the optimization algorithm on the current slots"""
+        """Optimize the current slots in a worker process, or stop the run in progress"""
+        if self.optimization is not None:
+            self.stop_optimization()
+            return
         if not self.design.slots:
             messagebox.showinfo("Error", "No slots to optimize")
             return
-    
-        try:
-            # Import optimization module
-            import board_forge.optimize as optimize_module
-            print(f"Optimize module: {optimize_module}")
-            print(f"Optimize module dir: {dir(optimize_module)}")
-            
-            # Update status
-            self.status_var.set("Running optimization... Please wait.")
-            self.root.update()
-            
-            # Get the optimize function - make sure we're accessing the function correctly
-            optimize_func = optimize_module.optimize
-            print(f"Optimize function: {optimize_func}")
-            
-            # Make a copy of the current design
-            current_design = self.design
-            print(f"Current design: {current_design}, slots: {len(current_design.slots)}")
 
-            # Get rotation preference
-            allow_rotation = self.allow_rotation_var.get()
-            
-            # Run the optimization with explicit arguments
-            optimized_design = optimize_func(
-                initial_design=current_design, 
-                iterations=1000,  # Reduced iterations for testing
-                alpha=0.99,
-                allow_rotation=allow_rotation  # Pass the rotation preference
-            )
-            
-            print(f"Optimization completed, result: {optimized_design}")
-            
-            # Update the design with the optimized one
-            self.design = optimized_design
-            
-            # Update the board view
-            self.board.design = self.design
-            self.board.update_view()
-            
-            # Reset any selection state
-            if hasattr(self.board, 'selected_slot'):
-                self.board.selected_slot = None
-            
-            rotation_status = "with" if allow_rotation else "without"
-            self.status_var.set(f"Optimization complete {rotation_status} rotation! Area minimized.")
-        except ImportError as e:
-            error_msg = f"Import error: {e}"
-            print(error_msg)
-            messagebox.showerror("Optimization Error", error_msg)
-        except AttributeError as e:
-            error_msg = f"Attribute error: {e}"
-            print(error_msg)
-            messagebox.showerror("Optimization Error", error_msg)
+        # Get rotation preference
+        allow_rotation = self.allow_rotation_var.get()
+        time_limit = self.time_limit_var.get() or None
+
+        # A run that was cut short (stopped, or the app closed or crashed) left its checkpoint behind
+        checkpoint = self.checkpoint_paths()[0]
+        resume = False
+        if any(os.path.exists(path) for path in self.checkpoint_paths()):
+            resume = messagebox.askyesno("Resume Optimization",
+                                         "An unfinished optimization run of this board was saved. Resume it?")
+            if not resume:
+                self.discard_checkpoint()
+
+        options = dict(
+            initial_design=self.design,
+            iterations=1000,  # Reduced iterations for testing
+            allow_rotation=allow_rotation,  # Pass the rotation preference
+            objective=self.objective_var.get(),
+            engine=self.engine_var.get(),
+            time_limit=time_limit,
+            checkpoint=checkpoint,
+            resume=resume
+        )
+        # A process rather than a thread: the search holds the GIL, and a
+        # process can be stopped at any point
+        from multiprocessing import Pool
+        pool = Pool(1)
+        self.optimization = OptimizationRun(pool, pool.apply_async(optimize_in_worker, (options,)),
+                                            time.perf_counter(), time_limit, allow_rotation)
+        self.optimize_button.config(text="Stop Optimization")
+        self.status_var.set("Running optimization...")
+        self.root.after(200, self.poll_optimization)
+
+    def finish_optimization(self):
+        run, self.optimization = self.optimization, None
+        run.pool.terminate()
+        self.optimize_button.config(text="Optimize Slot Placement")
+        return run
+
+    def stop_optimization(self):
+        self.finish_optimization()
+        self.status_var.set("Optimization stopped. If it had saved a checkpoint, optimizing again offers to resume it.")
+
+    def poll_optimization(self):
+        run = self.optimization
+        if run is None:  # stopped
+            return
+        if not run.result.ready():
+            elapsed = time.perf_counter() - run.start
+            limit = f" of {run.time_limit:.0f}s" if run.time_limit else ""
+            self.status_var.set(f"Running optimization... {elapsed:.0f}s{limit}")
+            self.root.after(200, self.poll_optimization)
+            return
+        self.finish_optimization()
+        try:
+            optimized_design = run.result.get()
         except Exception as e:
             error_msg = f"Error running optimization: {e}\nType: {type(e)}"
             print(error_msg)
-            import traceback
-            traceback.print_exc()
             messagebox.showerror("Optimization Error", error_msg)
-        
+            return
+        self.discard_checkpoint()
+        print(f"Optimization completed in {time.perf_counter() - run.start:.1f}s, {len(optimized_design.slots)} slots")
+
+        # Update the design with the optimized one
+        self.design = optimized_design
+        self.record_history()
+
+        # Update the board view
+        self.board.design = self.design
+        self.board.update_view()
+
+        # Reset any selection state
+        if hasattr(self.board, 'selected_slot'):
+            self.board.selected_slot = None
+
+        rotation_status = "with" if run.allow_rotation else "without"
+        self.status_var.set(f"Optimization complete {rotation_status} rotation! Area minimized.")
+
     def export_svg(self):
         """Export the current design as SVG files"""
         if not self.design.slots:
@@ -506,22 +857,9 @@ class GamePieceOrganizerApp:
                 return
                 
             print(f"Attempting to save SVG to: {file_path}")
-            svg_drawing = self.design.to_svg()
-            
-            # Save the SVG file
-            svg_drawing.save(pretty=True)
-            with open(file_path,'w') as f:
-                f.write(svg_drawing.tostring())
-            
-            # TODO: DEBUGGING
-            import os
-            if os.path.exists(file_path):
-                print(f"SUCCESS: File exists at {file_path}")
-                print(f"File size: {os.path.getsize(file_path)} bytes")
-            else:
-                print(f"ERROR: File does not exist at {file_path} after save operation")
+            self.design.write_svg(file_path)
 
-            self.status_var.set(f"SVG exported to {file_path}")
+            self.status_var.set(f"SVG exported to {file_path} ({os.path.getsize(file_path)} bytes)")
             messagebox.showinfo("Export Complete", f"SVG successfully saved to:\n{file_path}")
             
         except ImportError as e:
@@ -546,7 +884,17 @@ class GamePieceOrganizerApp:
         except Exception as e:
             messagebox.showerror("Validation Error", str(e))
 
+    def on_close(self):
+        if self.batch is not None and not self.batch.done:
+            self.batch.cancel()
+        if self.optimization is not None:
+            self.finish_optimization()
+        self.root.destroy()
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = GamePieceOrganizerApp(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_close)
+    if os.environ.get("BOARD_FORGE_PRELOAD", "1") != "0":
+        root.after(500, lambda: threading.Thread(target=preload_modules, daemon=True).start())
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""Objective functions for the optimizer.
+
+An objective scores a design (lower is better) with `evaluate`. It may also
+provide `delta`, the change in score when a single slot of a design has been
+replaced, which the optimizer uses instead of a full evaluation for
+single-slot moves. `delta` returns None when it can't do better than a full
+evaluation, and objectives that don't override it always fall back.
+"""
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+import shapely
+from board_forge.design import Design, PADDING
+
+OBJECTIVES: Dict[str, type] = {}
+
+def register_objective(name):
+    """Class decorator adding an objective to the registry under name"""
+    def decorator(cls):
+        cls.name = name
+        OBJECTIVES[name] = cls
+        return cls
+    return decorator
+
+class Objective:
+    name = "objective"
+
+    def evaluate(self, design: Design) -> float:
+        raise NotImplementedError
+
+    def delta(self, old: Design, new: Design, idx: int) -> Optional[float]:
+        """Score of new minus score of old, where new differs only in slot idx"""
+        return None
+
+    def score_move(self, old: Design, old_score: float, new: Design) -> float:
+        """Score new, incrementally from old's score when possible"""
+        idx = new.edited_slot(old)
+        if idx is not None:
+            change = self.delta(old, new, idx)
+            if change is not None:
+                return old_score + change
+        return self.evaluate(new)
+
+def padded_extent(design: Design):
+    min_x, min_y, max_x, max_y = design.bounds
+    return max_x - min_x + 2 * PADDING, max_y - min_y + 2 * PADDING
+
+@register_objective("area")
+class BoundingBoxArea(Objective):
+    """Area of the board's padded bounding box"""
+
+    def evaluate(self, design):
+        return design.bounding_box.area
+
+    def delta(self, old, new, idx):
+        # Extents are tracked incrementally by with_slot, so no bounds are recomputed here
+        if not old.slots:
+            return None
+        old_w, old_h = padded_extent(old)
+        new_w, new_h = padded_extent(new)
+        return new_w * new_h - old_w * old_h
+
+@register_objective("aspect")
+class AspectRatioArea(Objective):
+    """Area of the smallest board with a fixed width:height ratio that holds
+    the design, for fitting a given box or sheet shape"""
+
+    def __init__(self, ratio=4 / 3):
+        self.ratio = ratio
+
+    def area(self, design):
+        if not design.slots:
+            return 0.0
+        w, h = padded_extent(design)
+        w, h = max(w, h * self.ratio), max(h, w / self.ratio)
+        return w * h
+
+    def evaluate(self, design):
+        return self.area(design)
+
+    def delta(self, old, new, idx):
+        return self.area(new) - self.area(old)
+
+@register_objective("cut_length")
+class CutLength(Objective):
+    """Total laser path: every slot outline plus both board outlines"""
+
+    def evaluate(self, design):
+        if not design.slots:
+            return 0.0
+        w, h = padded_extent(design)
+        slots = np.array(design.slots, dtype=object)
+        return float(shapely.length(slots).sum()) + 2 * 2 * (w + h)
+
+    def delta(self, old, new, idx):
+        if not old.slots:
+            return None
+        old_w, old_h = padded_extent(old)
+        new_w, new_h = padded_extent(new)
+        slot_change = new.slots[idx].length - old.slots[idx].length
+        return slot_change + 4 * ((new_w + new_h) - (old_w + old_h))
+
+@register_objective("adjacency")
+class SameTypeAdjacency(Objective):
+    """Sum over groups of identical pieces of each piece's distance to its
+    group's centre, so copies of the same piece end up together"""
+
+    def __init__(self, precision=3):
+        self.precision = precision
+
+    def _groups(self, design) -> tuple:
+        """(slots, keys, labels, members, centroids) of design: each slot's type
+        key and label, and by label the slot indices of that type and their
+        centroids. Cached on the design for the slots it was derived from."""
+        state = design._objective_state.get((self.name, self.precision))
+        slots = tuple(design.slots)
+        if state is None or state[0] != slots:
+            geoms = np.array(slots, dtype=object)
+            # Area and perimeter identify a piece type regardless of position and rotation
+            keys = np.round(np.column_stack([shapely.area(geoms), shapely.length(geoms)]), self.precision)
+            _, labels = np.unique(keys, axis=0, return_inverse=True)
+            labels = labels.reshape(-1)
+            order = np.argsort(labels, kind="stable")
+            members = np.split(order, np.cumsum(np.bincount(labels))[:-1])
+            centroids = shapely.get_coordinates(shapely.centroid(geoms))
+            state = slots, keys, labels, members, [centroids[m] for m in members]
+            design._objective_state[(self.name, self.precision)] = state
+        return state
+
+    @staticmethod
+    def _group_cost(points):
+        return float(np.hypot(*(points - points.mean(axis=0)).T).sum())
+
+    def evaluate(self, design):
+        if not design.slots:
+            return 0.0
+        return sum(self._group_cost(points) for points in self._groups(design)[4])
+
+    def delta(self, old, new, idx):
+        _, keys, labels, members, centroids = self._groups(old)
+        slot = new.slots[idx]
+        if not np.array_equal(np.round([slot.area, slot.length], self.precision), keys[idx]):
+            return None  # no longer the same type of piece
+        # Only the moved piece's group changes
+        group = labels[idx]
+        before = centroids[group]
+        after = before.copy()
+        after[np.searchsorted(members[group], idx)] = slot.centroid.coords[0]
+        # Hand the groups on, so if new is accepted its moves start from them
+        new_centroids = list(centroids)
+        new_centroids[group] = after
+        new._objective_state[(self.name, self.precision)] = (tuple(new.slots), keys, labels, members, new_centroids)
+        return self._group_cost(after) - self._group_cost(before)
+
+class WeightedObjective(Objective):
+    """Weighted sum of objectives. Terms without a delta are evaluated in full
+    for single-slot moves while the others still use their fast path."""
+
+    name = "weighted"
+
+    def __init__(self, terms: List[Tuple[Objective, float]]):
+        self.terms = terms
+
+    def evaluate(self, design):
+        return sum(weight * objective.evaluate(design) for objective, weight in self.terms)
+
+    def delta(self, old, new, idx):
+        total = 0.0
+        for objective, weight in self.terms:
+            change = objective.delta(old, new, idx)
+            if change is None:
+                change = objective.evaluate(new) - objective.evaluate(old)
+            total += weight * change
+        return total
+
+def get_objective(spec: Union[None, str, Objective, Dict[str, float]]) -> Objective:
+    """Resolve an objective from a registered name, an instance, or a
+    {name: weight} mapping for a weighted combination (default: area)"""
+    if spec is None:
+        return BoundingBoxArea()
+    if isinstance(spec, Objective):
+        return spec
+    if isinstance(spec, str):
+        if spec not in OBJECTIVES:
+            raise ValueError(f"Unknown objective '{spec}', expected one of {', '.join(OBJECTIVES)}")
+        return OBJECTIVES[spec]()
+    return WeightedObjective([(get_objective(name), weight) for name, weight in spec.items()])
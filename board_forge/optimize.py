@@ -1,7 +1,17 @@
+import itertools
+import json
+import os
 import random
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import Optional, Tuple
 import numpy as np
+import shapely
 from shapely.affinity import translate, rotate
-from board_forge.design import Design
+from board_forge.design import Design, PADDING
+from board_forge.objectives import get_objective, BoundingBoxArea
+from board_forge.clearance import NUMBA_AVAILABLE, PackedPolygons
+from board_forge.checkpoint import CHECKPOINT_INTERVAL, Checkpoint, checkpointer_for, resume_from
 from shapely.geometry import Polygon
 
 # Define constants for minimum spacing and other parameters
@@ -11,6 +21,228 @@ GROUP_THRESHOLD = 0.1  # Threshold for grouping similar shapes
 CANVAS_MARGIN = 20  # Margin from canvas edges
 CANVAS_WIDTH = 600  # Default canvas width
 CANVAS_HEIGHT = 450  # Default canvas height
+ENGINES = ("anneal", "genetic")  # Search engines selectable in optimize()
+# Tuned AnnealParams by board class, written by tune.py
+PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "anneal_profiles.json")
+COUNT_CLASSES = (10, 30, 100)  # Upper piece counts of all but the largest board class
+
+@dataclass(frozen=True)
+class AnnealParams:
+    """Tunable settings of the annealer. The defaults are the hand-picked
+    values it has always used; tune.py searches for better ones."""
+    alpha: float = 0.99  # Cooling factor per iteration
+    explore_fraction: float = 0.7  # Share of the run spent exploring before refining
+    stagnation_fraction: float = 0.3  # Stop after this share of iterations without improvement
+    translate_amount: float = 15  # Largest random move while exploring
+    rotate_amount: float = 1.5  # Largest random rotation (radians) while exploring
+    refine_translate_amount: float = 1.5
+    refine_rotate_amount: float = 0.5
+    regrid_chance: float = 0.05  # Chance of a full compact-grid reorganization per move
+    outlier_distance: float = 200  # Pieces further than this from the rest are pulled in
+    # Action probabilities while exploring: random translation, directed
+    # translation, compaction, small rotation, quarter-turn rotation
+    explore_weights: Tuple[float, ...] = (0.3, 0.3, 0.1, 0.15, 0.15)
+    # While refining: small translation, directed translation, small rotation
+    refine_weights: Tuple[float, ...] = (0.6, 0.2, 0.2)
+    # Without rotation: random translation, directed translation, compaction, alignment
+    fixed_weights: Tuple[float, ...] = (0.4, 0.3, 0.2, 0.1)
+    # Learn which actions pay off during the run (see OperatorBandit), with the
+    # weights above as priors
+    adaptive_operators: bool = True
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "AnnealParams":
+        """Params from a profile, ignoring keys this version doesn't know"""
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: tuple(v) if isinstance(v, list) else v for k, v in values.items() if k in known})
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+DEFAULT_PARAMS = AnnealParams()
+
+def shape_mix(slots) -> str:
+    """Shape mix class of the slots: "rect" if every slot is a (possibly
+    rotated) rectangle, "convex" if every slot is convex, else "mixed"."""
+    geoms = slot_array(slots)
+    area = shapely.area(geoms)
+    if np.allclose(shapely.area(shapely.oriented_envelope(geoms)), area, rtol=1e-6):
+        return "rect"
+    if np.allclose(shapely.area(shapely.convex_hull(geoms)), area, rtol=1e-6):
+        return "convex"
+    return "mixed"
+
+def board_class(slots) -> str:
+    """Profile key of a board: its shape mix and piece-count class, e.g. "mixed-30"
+    for 11 to 30 pieces that aren't all convex, or "rect-100+" for over 100 rectangles"""
+    n = len(slots)
+    count = next((f"{c}" for c in COUNT_CLASSES if n <= c), f"{COUNT_CLASSES[-1]}+")
+    return f"{shape_mix(slots)}-{count}"
+
+_profiles_cache = {}
+
+def load_profiles(path=PROFILES_PATH) -> dict:
+    """Tuned profiles from path by board class, re-read only when the file changes"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    cached = _profiles_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path) as f:
+            cached = mtime, json.load(f).get("profiles", {})
+        _profiles_cache[path] = cached
+    return cached[1]
+
+def load_params(design: Design, path=PROFILES_PATH) -> AnnealParams:
+    """The tuned params for design's board class, or the defaults"""
+    if not design.slots:
+        return DEFAULT_PARAMS
+    profile = load_profiles(path).get(board_class(design.slots))
+    return AnnealParams.from_dict(profile["params"]) if profile and "params" in profile else DEFAULT_PARAMS
+
+# Action names of each apply_random_action context, in weight order
+ACTIONS = {
+    "explore": ("translate", "directed", "compact", "rotate", "quarter_turn"),
+    "refine": ("nudge", "directed", "small_rotate"),
+    "fixed": ("translate", "directed", "compact", "align"),
+}
+
+def choose(weights) -> int:
+    """Index drawn with probability proportional to weights"""
+    r = random.random() * sum(weights)
+    total = 0.0
+    for k, weight in enumerate(weights):
+        total += weight
+        if r < total:
+            return k
+    return len(weights) - 1
+
+class OperatorBandit:
+    """Adaptive operator selection for apply_random_action.
+
+    Each context (explore, refine, or fixed when rotation is off) starts from
+    its AnnealParams weights as priors. A proposal's credit is 1 if it was
+    accepted with a better score, plus 2 if it is the best so far. Merely
+    accepted moves earn nothing, or the moves the annealer takes at high
+    temperature would look productive. Each action keeps an exponentially
+    decaying average of credit per unit of work spent making and checking its
+    proposals (see proposal_cost). Work is counted rather than timed, so runs
+    stay reproducible from a seed. Actions are drawn from the priors
+    reweighted by a softmax of those rates relative to their mean, and never
+    below floor, so actions that keep producing rejected or costly moves fade
+    but aren't starved of the samples that would let them recover.
+    """
+
+    def __init__(self, params: AnnealParams = DEFAULT_PARAMS, decay=0.05, temperature=1.0, floor=0.02):
+        weights = {"explore": params.explore_weights, "refine": params.refine_weights, "fixed": params.fixed_weights}
+        self.priors = {context: np.asarray(w, dtype=float) / sum(w) for context, w in weights.items()}
+        self.rates = {context: np.full(len(w), np.nan) for context, w in weights.items()}
+        self.counts = {context: np.zeros(len(w), dtype=np.int64) for context, w in weights.items()}
+        self.decay = decay
+        self.temperature = temperature
+        self.floor = floor
+        self.last = None  # (context, action) awaiting its reward
+
+    def probabilities(self, context) -> np.ndarray:
+        prior, rates = self.priors[context], self.rates[context]
+        sampled = ~np.isnan(rates)
+        if not sampled.any():
+            return prior
+        # Untried actions count as average
+        rates = np.where(sampled, rates, rates[sampled].mean())
+        scale = rates.mean() * self.temperature
+        if scale <= 0:  # Nothing has paid off yet
+            return prior
+        z = rates / scale
+        p = prior * np.exp(z - z.max())
+        p /= p.sum()
+        return self.floor + (1 - len(p) * self.floor) * p
+
+    def choose(self, context) -> int:
+        action = choose(self.probabilities(context))
+        self.last = context, action
+        return action
+
+    def reward(self, credit, cost):
+        """Credit the last chosen action, if the last proposal came from one"""
+        if self.last is None:
+            return
+        context, action = self.last
+        self.last = None
+        rate = credit / max(cost, 1)
+        rates = self.rates[context]
+        rates[action] = rate if np.isnan(rates[action]) else rates[action] + self.decay * (rate - rates[action])
+        self.counts[context][action] += 1
+
+    def report(self) -> dict:
+        """Per context and action: current probability, credit rate per unit of work and times chosen"""
+        return {
+            context: {
+                name: {"probability": float(p), "rate": None if np.isnan(r) else float(r), "count": int(c)}
+                for name, p, r, c in zip(names, self.probabilities(context), self.rates[context], self.counts[context])
+            }
+            for context, names in ACTIONS.items()
+        }
+
+    def to_arrays(self) -> dict:
+        arrays = {f"bandit_{context}_rates": self.rates[context] for context in ACTIONS}
+        arrays.update({f"bandit_{context}_counts": self.counts[context] for context in ACTIONS})
+        return arrays
+
+    def load_arrays(self, arrays):
+        for context in ACTIONS:
+            self.rates[context] = np.array(arrays[f"bandit_{context}_rates"], dtype=float)
+            self.counts[context] = np.array(arrays[f"bandit_{context}_counts"], dtype=np.int64)
+
+def proposal_cost(old: Design, new: Design, vertices) -> int:
+    """Work a proposal took, for the bandit: the vertices of the slots it
+    changed, which its validity check and scoring have to test. vertices holds
+    each slot's vertex count, which moves don't change."""
+    idx = new.edited_slot(old)
+    return int(vertices[idx] if idx is not None else vertices.sum())
+
+class Budget:
+    """When a search loop stops and how far through it is.
+
+    Without a time limit, progress is the fraction of the iterations run. With
+    one, it is the fraction of the time elapsed on the monotonic clock, the loop
+    runs until the deadline, and iterations only sets the length of the cooling
+    schedule, which is stretched to fit the time. Either way the loop also stops
+    once the best score reaches target_score. elapsed is the time already spent
+    by a resumed run.
+    """
+
+    def __init__(self, iterations, time_limit=None, target_score=None, elapsed=0.0):
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.target_score = target_score
+        self.start = time.monotonic() - elapsed
+        self.progress = 0.0
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    @property
+    def timed(self) -> bool:
+        return self.time_limit is not None
+
+    def running(self, i, best_score) -> bool:
+        """Whether to run iteration i, updating progress"""
+        if self.target_score is not None and best_score <= self.target_score:
+            return False
+        if self.time_limit is None:
+            self.progress = i / self.iterations if self.iterations else 1.0
+            return i < self.iterations
+        # One clock read per iteration, far cheaper than any iteration
+        elapsed = time.monotonic() - self.start
+        self.progress = min(elapsed / self.time_limit, 1.0) if self.time_limit > 0 else 1.0
+        return elapsed < self.time_limit
+
+    def temperature(self, alpha) -> float:
+        """Temperature of a schedule starting at 1 and multiplied by alpha every
+        iteration, at the current progress"""
+        return alpha ** (self.iterations * self.progress)
 
 def get_shape_signature(polygon):
     """Get a simple signature of a shape based on its area and perimeter ratio"""
@@ -41,13 +273,58 @@ def group_similar_shapes(slots):
     
     return list(groups.values())
 
+def slot_array(slots) -> np.ndarray:
+    """Slots as a 1-D object array for shapely's vectorized functions"""
+    geoms = np.empty(len(slots), dtype=object)
+    geoms[:] = slots
+    return geoms
+
+def slot_centroids(slots) -> np.ndarray:
+    """(n, 2) array of slot centroids, computed in one call"""
+    return shapely.get_coordinates(shapely.centroid(slot_array(slots)))
+
+def translate_slots(slots, offsets) -> list:
+    """Translate every slot by its row of the (n, 2) offsets (or all by one
+    (dx, dy)) with a single coordinate update instead of n translate() calls"""
+    geoms = slot_array(slots)
+    coords = shapely.get_coordinates(geoms)
+    offsets = np.broadcast_to(np.asarray(offsets, dtype=float), (len(geoms), 2))
+    coords += np.repeat(offsets, shapely.get_num_coordinates(geoms), axis=0)
+    # set_coordinates swaps in new geometries; the input polygons are untouched
+    return list(shapely.set_coordinates(geoms, coords))
+
+def inside_canvas(design: Design, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT) -> bool:
+    """Whether the padded design lies within the canvas margins. Uses the
+    design's tracked extents, so for designs built with with_slot this only
+    costs the identity check of the slots, without computing any bounds"""
+    min_x, min_y, max_x, max_y = design.bounds
+    return (min_x - PADDING >= CANVAS_MARGIN and max_x + PADDING <= canvas_width - CANVAS_MARGIN and
+            min_y - PADDING >= CANVAS_MARGIN and max_y + PADDING <= canvas_height - CANVAS_MARGIN)
+
+def constrain_moved_slot(design: Design, idx, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT) -> Design:
+    """Keep the design on the canvas after slot idx alone has moved.
+
+    In-bounds moves (the common case) compute no bounds. Otherwise only the moved slot
+    is clamped back inside; the whole design is only shifted, as in
+    constrain_to_canvas, if it was off the canvas for other reasons.
+    """
+    if inside_canvas(design, canvas_width, canvas_height):
+        return design
+    min_x, min_y, max_x, max_y = design.slot_bounds()[idx]
+    low, high_x, high_y = CANVAS_MARGIN + PADDING, canvas_width - CANVAS_MARGIN - PADDING, canvas_height - CANVAS_MARGIN - PADDING
+    shift_x = low - min_x if min_x < low else min(high_x - max_x, 0)
+    shift_y = low - min_y if min_y < low else min(high_y - max_y, 0)
+    if shift_x != 0 or shift_y != 0:
+        design = design.with_slot(idx, translate(design.slots[idx], shift_x, shift_y))
+    if inside_canvas(design, canvas_width, canvas_height):
+        return design
+    return constrain_to_canvas(design, canvas_width, canvas_height)
+
 def constrain_to_canvas(design: Design, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT):
     """Ensure all slots are within the canvas bounds with margin WITHOUT scaling"""
     if not design.slots:
         return design
         
-    slots = design.slots.copy()
-    
     # Check the total bounds of the design
     bounds = design.bounding_box.bounds
     
@@ -73,55 +350,42 @@ def constrain_to_canvas(design: Design, canvas_width=CANVAS_WIDTH, canvas_height
         shift_y = (canvas_height - CANVAS_MARGIN) - bounds[3]
     
     # If we need to shift, translate all pieces
+    slots = design.slots
     if shift_x != 0 or shift_y != 0:
-        for i in range(len(slots)):
-            slots[i] = translate(slots[i], shift_x, shift_y)
+        slots = translate_slots(slots, (shift_x, shift_y))
     
-    # Check if design is still too large for canvas
-    design = Design(slots)
-    bounds = design.bounding_box.bounds
+    # Check if design is still too large for canvas (shifting doesn't change the size)
     width = bounds[2] - bounds[0]
     height = bounds[3] - bounds[1]
     
     # MODIFIED: Instead of scaling, we'll just ensure all slots are within the canvas bounds
     # If the design is still too large, we'll only translate pieces that are outside
     if width > canvas_width - 2*CANVAS_MARGIN or height > canvas_height - 2*CANVAS_MARGIN:
-        new_slots = []
-        for slot in slots:
-            slot_bounds = slot.bounds
-            
-            # Check if this slot is outside the canvas
-            adjust_x = 0
-            adjust_y = 0
-            
-            # Adjust position if outside left boundary
-            if slot_bounds[0] < CANVAS_MARGIN:
-                adjust_x = CANVAS_MARGIN - slot_bounds[0]
-            # Adjust position if outside right boundary
-            elif slot_bounds[2] > canvas_width - CANVAS_MARGIN:
-                adjust_x = (canvas_width - CANVAS_MARGIN) - slot_bounds[2]
-                
-            # Adjust position if outside top boundary
-            if slot_bounds[1] < CANVAS_MARGIN:
-                adjust_y = CANVAS_MARGIN - slot_bounds[1]
-            # Adjust position if outside bottom boundary
-            elif slot_bounds[3] > canvas_height - CANVAS_MARGIN:
-                adjust_y = (canvas_height - CANVAS_MARGIN) - slot_bounds[3]
-                
-            # Apply adjustments if needed
-            if adjust_x != 0 or adjust_y != 0:
-                new_slots.append(translate(slot, adjust_x, adjust_y))
-            else:
-                new_slots.append(slot)
-        
-        design = Design(new_slots)
+        slot_bounds = shapely.bounds(slot_array(slots))
+        min_x, min_y, max_x, max_y = slot_bounds.T
+        # Push slots back inside the left/top edges, else the right/bottom edges
+        adjust_x = np.where(min_x < CANVAS_MARGIN, CANVAS_MARGIN - min_x,
+                            np.where(max_x > canvas_width - CANVAS_MARGIN, (canvas_width - CANVAS_MARGIN) - max_x, 0.0))
+        adjust_y = np.where(min_y < CANVAS_MARGIN, CANVAS_MARGIN - min_y,
+                            np.where(max_y > canvas_height - CANVAS_MARGIN, (canvas_height - CANVAS_MARGIN) - max_y, 0.0))
+        if np.any(adjust_x) or np.any(adjust_y):
+            slots = translate_slots(slots, np.column_stack([adjust_x, adjust_y]))
     
-    return design
+    return Design(list(slots))
 
 def separate_overlapping_pieces(design: Design, min_distance=MIN_SPACING, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT) -> Design:
     """Move overlapping or too-close pieces apart to create a valid starting point"""
-    modified = False
     slots = design.slots.copy()
+    if not slots:
+        return constrain_to_canvas(Design(slots), canvas_width, canvas_height)
+    
+    # Bounds and centroids are tracked as plain lists and moved along with the
+    # slots, so far-apart pairs are skipped without touching any geometry
+    bounds = shapely.bounds(slot_array(slots)).tolist()
+    centroids = slot_centroids(slots).tolist()
+    # With Numba, distances come from the compiled kernel and moves only shift
+    # the packed coordinates; otherwise each close pair is one shapely call
+    packed = PackedPolygons.from_slots(slots) if NUMBA_AVAILABLE else None
     
     # Try up to 50 iterations to separate pieces
     for _ in range(50):
@@ -130,19 +394,21 @@ def separate_overlapping_pieces(design: Design, min_distance=MIN_SPACING, canvas
         # Check each pair of slots
         for i in range(len(slots)):
             for j in range(i + 1, len(slots)):
-                distance = slots[i].distance(slots[j])
+                bi, bj = bounds[i], bounds[j]
+                gap_x = max(bj[0] - bi[2], bi[0] - bj[2])
+                gap_y = max(bj[1] - bi[3], bi[1] - bj[3])
+                # Boxes at least min_distance apart can't hold pieces that are closer
+                if gap_x >= min_distance or gap_y >= min_distance:
+                    continue
+                distance = packed.distance(i, j) if packed is not None else slots[i].distance(slots[j])
                 
                 # If too close or overlapping
                 if distance < min_distance:
                     valid = False
                     
-                    # Get centroids
-                    c1 = slots[i].centroid
-                    c2 = slots[j].centroid
-                    
                     # Direction vector between centroids
-                    dx = c2.x - c1.x
-                    dy = c2.y - c1.y
+                    dx = centroids[j][0] - centroids[i][0]
+                    dy = centroids[j][1] - centroids[i][1]
                     
                     # Handle case where centroids are at the same spot
                     if abs(dx) < 0.001 and abs(dy) < 0.001:
@@ -158,14 +424,22 @@ def separate_overlapping_pieces(design: Design, min_distance=MIN_SPACING, canvas
                     move_amount = min_distance - distance + BUFFER_EXTRA
                     
                     # Move both pieces in opposite directions
-                    slots[i] = translate(slots[i], -dx * move_amount/2, -dy * move_amount/2)
-                    slots[j] = translate(slots[j], dx * move_amount/2, dy * move_amount/2)
-                    modified = True
+                    for idx, sign in ((i, -1), (j, 1)):
+                        offset_x, offset_y = sign * dx * move_amount/2, sign * dy * move_amount/2
+                        if packed is not None:
+                            packed.translate(idx, offset_x, offset_y)
+                        else:
+                            slots[idx] = translate(slots[idx], offset_x, offset_y)
+                        b = bounds[idx]
+                        bounds[idx] = [b[0] + offset_x, b[1] + offset_y, b[2] + offset_x, b[3] + offset_y]
+                        centroids[idx] = [centroids[idx][0] + offset_x, centroids[idx][1] + offset_y]
         
         # If all pieces are valid, we're done
         if valid:
             break
     
+    if packed is not None:
+        slots = packed.to_slots()
     # Ensure the design stays within canvas bounds
     return constrain_to_canvas(Design(slots), canvas_width, canvas_height)
 
@@ -175,9 +449,8 @@ def evaluate(design: Design) -> float:
     return design.bounding_box.area
 
 
-def apply_random_translation(design: Design, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT) -> Design:
-    """Move a random piece by a random amount"""
-    amount = 15  # Movement amount
+def apply_random_translation(design: Design, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT, amount=15) -> Design:
+    """Move a random piece by up to amount on each axis"""
     idx = random.randrange(len(design.slots))
     move_x = random.uniform(-amount, amount)
     move_y = random.uniform(-amount, amount)
@@ -199,8 +472,8 @@ def apply_random_translation(design: Design, canvas_width=CANVAS_WIDTH, canvas_h
     
     translated = translate(slot, move_x, move_y)
     
-    result = Design(design.slots[:idx] + [translated] + design.slots[idx + 1:])
-    return constrain_to_canvas(result, canvas_width, canvas_height)
+    result = design.with_slot(idx, translated)
+    return constrain_moved_slot(result, idx, canvas_width, canvas_height)
 
 
 def apply_directed_translation(design: Design, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT) -> Design:
@@ -230,8 +503,8 @@ def apply_directed_translation(design: Design, canvas_width=CANVAS_WIDTH, canvas
         move_x = dir_x * factor
         move_y = dir_y * factor
         translated = translate(design.slots[idx], move_x, move_y)
-        result = Design(design.slots[:idx] + [translated] + design.slots[idx + 1:])
-        return constrain_to_canvas(result, canvas_width, canvas_height)
+        result = design.with_slot(idx, translated)
+        return constrain_moved_slot(result, idx, canvas_width, canvas_height)
 
     return design
 
@@ -304,67 +577,60 @@ def arrange_in_compact_grid(design: Design, canvas_width=CANVAS_WIDTH, canvas_he
     if len(design.slots) < 2:
         return design
     
-    # Sort slots by their centroids (top to bottom, left to right)
-    slots = design.slots.copy()
-    slots_with_centroids = [(i, slot.centroid.x, slot.centroid.y) for i, slot in enumerate(slots)]
+    slots = design.slots
+    n = len(slots)
+    centroids = slot_centroids(slots)
     
     # Get actual dimensions of each piece without averaging
-    bounds = [slot.bounds for slot in slots]
-    widths = [b[2] - b[0] for b in bounds]
-    heights = [b[3] - b[1] for b in bounds]
+    bounds = shapely.bounds(slot_array(slots))
+    widths = bounds[:, 2] - bounds[:, 0]
+    heights = bounds[:, 3] - bounds[:, 1]
     
     # Sort by y first (row), then by x (column)
-    slots_with_centroids.sort(key=lambda item: (item[2], item[1]))
+    order = np.lexsort((centroids[:, 0], centroids[:, 1]))
     
-    # Create a new layout in grid formation
-    new_slots = [None] * len(slots)  # Preallocate list
     start_x, start_y = CANVAS_MARGIN, CANVAS_MARGIN  # Starting position with margin
     
     # Calculate optimal number of columns based on canvas width and the actual widths
     available_width = canvas_width - 2*CANVAS_MARGIN
-    max_width = max(widths) if widths else MIN_SPACING
-    cols = max(1, min(int(available_width / (max_width + MIN_SPACING)), int(np.sqrt(len(slots)))))
+    max_width = widths.max()
+    max_cols = max(1, int(available_width / (max_width + MIN_SPACING)))
+    cols = max(1, min(max_cols, int(np.sqrt(n))))
     
-    # Keep track of the width and height used in each row and column
-    col_widths = [0] * cols
-    row_heights = [0] * ((len(slots) + cols - 1) // cols)  # Ceiling division
-    
-    # First pass: determine widths and heights
-    for i, (idx, _, _) in enumerate(slots_with_centroids):
-        row = i // cols
-        col = i % cols
-        
-        slot_width = widths[idx]
-        slot_height = heights[idx]
+    def grid(cols):
+        # Grid cell of each slot, in sorted order
+        rows_of = np.empty(n, dtype=int)
+        cols_of = np.empty(n, dtype=int)
+        rows_of[order] = np.arange(n) // cols
+        cols_of[order] = np.arange(n) % cols
         
-        col_widths[col] = max(col_widths[col], slot_width)
-        row_heights[row] = max(row_heights[row], slot_height)
+        # Width of each column and height of each row
+        col_widths = np.zeros(cols)
+        row_heights = np.zeros((n + cols - 1) // cols)  # Ceiling division
+        np.maximum.at(col_widths, cols_of, widths)
+        np.maximum.at(row_heights, rows_of, heights)
+        return rows_of, cols_of, col_widths, row_heights
     
-    # Second pass: position pieces using determined dimensions
-    for i, (idx, _, _) in enumerate(slots_with_centroids):
-        row = i // cols
-        col = i % cols
-        
-        old_slot = slots[idx]
-        min_x, min_y, _, _ = old_slot.bounds
-        
-        # Calculate position based on column widths and row heights
-        target_x = start_x
-        for c in range(col):
-            target_x += col_widths[c] + MIN_SPACING
-            
-        target_y = start_y
-        for r in range(row):
-            target_y += row_heights[r] + MIN_SPACING
-        
-        # Calculate translation to new position
-        offset_x = target_x - min_x
-        offset_y = target_y - min_y
-        
-        # Translate to new position
-        new_slots[idx] = translate(old_slot, offset_x, offset_y)
+    def extent(sizes):
+        return sizes.sum() + MIN_SPACING * (len(sizes) - 1)
     
-    result = Design(new_slots)
+    rows_of, cols_of, col_widths, row_heights = grid(cols)
+    # Too tall for the canvas: add columns while they still fit across
+    fit_width, fit_height = canvas_width - 2 * (CANVAS_MARGIN + PADDING), canvas_height - 2 * (CANVAS_MARGIN + PADDING)
+    while extent(row_heights) > fit_height and cols < n:
+        wider = grid(cols + 1)
+        if extent(wider[2]) > fit_width:
+            break
+        cols += 1
+        rows_of, cols_of, col_widths, row_heights = wider
+    
+    # Left/top edge of each column/row
+    col_starts = start_x + np.concatenate([[0], np.cumsum(col_widths + MIN_SPACING)[:-1]])
+    row_starts = start_y + np.concatenate([[0], np.cumsum(row_heights + MIN_SPACING)[:-1]])
+    
+    # Translate every slot so its min corner lands on its cell's corner
+    offsets = np.column_stack([col_starts[cols_of] - bounds[:, 0], row_starts[rows_of] - bounds[:, 1]])
+    result = Design(translate_slots(slots, offsets))
     return constrain_to_canvas(result, canvas_width, canvas_height)
 
 
@@ -374,33 +640,22 @@ def apply_compact_arrangement(design: Design, canvas_width=CANVAS_WIDTH, canvas_
         return design
     
     # Find the center of all pieces (constrained to canvas)
-    all_centroids = [slot.centroid for slot in design.slots]
-    center_x = sum(c.x for c in all_centroids) / len(all_centroids)
-    center_y = sum(c.y for c in all_centroids) / len(all_centroids)
+    centroids = slot_centroids(design.slots)
+    center_x, center_y = centroids.mean(axis=0)
     
     # Ensure center is within canvas
     center_x = min(max(center_x, CANVAS_MARGIN), canvas_width - CANVAS_MARGIN)
     center_y = min(max(center_y, CANVAS_MARGIN), canvas_height - CANVAS_MARGIN)
     
-    # Create a new list of slots with each one moved slightly toward center
-    new_slots = []
-    for slot in design.slots:
-        c = slot.centroid
-        dir_x = center_x - c.x
-        dir_y = center_y - c.y
-        
-        # Normalize and scale
-        length = (dir_x ** 2 + dir_y ** 2) ** 0.5
-        if length > 0.001:  # Avoid division by zero
-            # Move only a small percentage toward center for more control
-            factor = random.uniform(0.05, 0.15)  # 5-15% movement
-            move_x = dir_x * factor
-            move_y = dir_y * factor
-            new_slots.append(translate(slot, move_x, move_y))
-        else:
-            new_slots.append(slot)
+    # Move each slot slightly toward the center
+    directions = np.array([center_x, center_y]) - centroids
+    lengths = np.hypot(directions[:, 0], directions[:, 1])
+    moving = lengths > 0.001  # Avoid moving pieces already at the center
+    # Move only a small percentage toward center for more control
+    factors = np.zeros(len(centroids))
+    factors[moving] = [random.uniform(0.05, 0.15) for _ in range(moving.sum())]  # 5-15% movement
     
-    result = Design(new_slots)
+    result = Design(translate_slots(design.slots, directions * factors[:, None]))
     return constrain_to_canvas(result, canvas_width, canvas_height)
 
 
@@ -410,35 +665,40 @@ def apply_full_rotation(design: Design, canvas_width=CANVAS_WIDTH, canvas_height
     angle = random.choice([np.pi / 2, np.pi, 3 * np.pi / 2])  # 90, 180, or 270 degrees
     rotated = rotate(design.slots[idx], angle, origin='centroid', use_radians=True)
     
-    result = Design(design.slots[:idx] + [rotated] + design.slots[idx + 1:])
-    return constrain_to_canvas(result, canvas_width, canvas_height)
+    result = design.with_slot(idx, rotated)
+    return constrain_moved_slot(result, idx, canvas_width, canvas_height)
 
 
-def apply_random_rotation(design: Design, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT) -> Design:
-    """Rotate a piece by a small random angle"""
-    amount = 1.5
+def apply_random_rotation(design: Design, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT, amount=1.5) -> Design:
+    """Rotate a piece by a small random angle, up to amount radians"""
     idx = random.randrange(len(design.slots))
     angle = random.uniform(-amount, amount)
     rotated = rotate(design.slots[idx], angle, origin='centroid', use_radians=True)
     
-    result = Design(design.slots[:idx] + [rotated] + design.slots[idx + 1:])
-    return constrain_to_canvas(result, canvas_width, canvas_height)
+    result = design.with_slot(idx, rotated)
+    return constrain_moved_slot(result, idx, canvas_width, canvas_height)
+
 
+def apply_random_action(design: Design, phase="explore", allow_rotation=True, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT,
+                        params: AnnealParams = DEFAULT_PARAMS, bandit: Optional[OperatorBandit] = None) -> Design:
+    """Apply a random transformation to the design based on the current phase.
+    With a bandit, the action is drawn from its learned probabilities and the
+    caller should report the outcome with bandit.reward()."""
+    def pick(context, weights):
+        return bandit.choose(context) if bandit is not None else choose(weights)
 
-def apply_random_action(design: Design, phase="explore", allow_rotation=True, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT) -> Design:
-    """Apply a random transformation to the design based on the current phase"""
     # Handle very large or outlier pieces by reorganizing
-    if random.random() < 0.05:  # 5% chance to do a full reorganization
+    if random.random() < params.regrid_chance:  # Occasionally do a full reorganization
         return arrange_in_compact_grid(design, canvas_width, canvas_height)
         
     if not allow_rotation:
         # If rotation is not allowed, only use translation actions
-        r = random.random()
-        if r < 0.4:
-            return apply_random_translation(design, canvas_width, canvas_height)
-        elif r < 0.7:
+        action = pick("fixed", params.fixed_weights)
+        if action == 0:
+            return apply_random_translation(design, canvas_width, canvas_height, params.translate_amount)
+        elif action == 1:
             return apply_directed_translation(design, canvas_width, canvas_height)
-        elif r < 0.9:
+        elif action == 2:
             return apply_compact_arrangement(design, canvas_width, canvas_height)
         else:
             return align_similar_shapes(design, canvas_width, canvas_height)
@@ -446,23 +706,23 @@ def apply_random_action(design: Design, phase="explore", allow_rotation=True, ca
     # Default behavior with rotation allowed
     if phase == "explore":
         # During exploration, try more dramatic moves
-        r = random.random()
-        if r < 0.3:
-            return apply_random_translation(design, canvas_width, canvas_height)
-        elif r < 0.6:
+        action = pick("explore", params.explore_weights)
+        if action == 0:
+            return apply_random_translation(design, canvas_width, canvas_height, params.translate_amount)
+        elif action == 1:
             return apply_directed_translation(design, canvas_width, canvas_height)
-        elif r < 0.7:
+        elif action == 2:
             return apply_compact_arrangement(design, canvas_width, canvas_height)
-        elif r < 0.85:
-            return apply_random_rotation(design, canvas_width, canvas_height)
+        elif action == 3:
+            return apply_random_rotation(design, canvas_width, canvas_height, params.rotate_amount)
         else:
             return apply_full_rotation(design, canvas_width, canvas_height)
     else:
         # phase == "refine"
         # During refinement, make smaller adjustments
-        r = random.random()
-        if r < 0.6:
-            amount_save = 1.5  # Smaller movements for refinement
+        action = pick("refine", params.refine_weights)
+        if action == 0:
+            amount_save = params.refine_translate_amount  # Smaller movements for refinement
             idx = random.randrange(len(design.slots))
             move_x = random.uniform(-amount_save, amount_save)
             move_y = random.uniform(-amount_save, amount_save)
@@ -483,78 +743,63 @@ def apply_random_action(design: Design, phase="explore", allow_rotation=True, ca
                 move_y = canvas_height - CANVAS_MARGIN - max_y
                 
             translated = translate(slot, move_x, move_y)
-            result = Design(design.slots[:idx] + [translated] + design.slots[idx + 1:])
-            return constrain_to_canvas(result, canvas_width, canvas_height)
-        elif r < 0.8:
+            result = design.with_slot(idx, translated)
+            return constrain_moved_slot(result, idx, canvas_width, canvas_height)
+        elif action == 1:
             return apply_directed_translation(design, canvas_width, canvas_height)
         else:
             if allow_rotation:
-                amount_save = 0.5
+                amount_save = params.refine_rotate_amount
                 idx = random.randrange(len(design.slots))
                 angle = random.uniform(-amount_save, amount_save)
                 rotated = rotate(design.slots[idx], angle, origin='centroid', use_radians=True)
-                result = Design(design.slots[:idx] + [rotated] + design.slots[idx + 1:])
-                return constrain_to_canvas(result, canvas_width, canvas_height)
+                result = design.with_slot(idx, rotated)
+                return constrain_moved_slot(result, idx, canvas_width, canvas_height)
             else:
                 return apply_directed_translation(design, canvas_width, canvas_height)
 
 
-def fix_isolated_piece(design: Design, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT) -> Design:
-    """Fix any piece that's positioned far away from the rest"""
+def fix_isolated_piece(design: Design, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT, threshold=200) -> Design:
+    """Fix any piece that's positioned more than threshold away from the rest"""
     if len(design.slots) < 2:
         return design
         
-    slots = design.slots.copy()
+    slots = design.slots
     
     # Calculate average position of all pieces
-    centroids = [slot.centroid for slot in slots]
-    avg_x = sum(c.x for c in centroids) / len(centroids)
-    avg_y = sum(c.y for c in centroids) / len(centroids)
+    centroids = slot_centroids(slots)
+    avg_x, avg_y = centroids.mean(axis=0)
     
     # Ensure center is within canvas
     avg_x = min(max(avg_x, CANVAS_MARGIN), canvas_width - CANVAS_MARGIN)
     avg_y = min(max(avg_y, CANVAS_MARGIN), canvas_height - CANVAS_MARGIN)
     
-    # Find any outliers (pieces far from the average position)
-    max_distance = 0
-    outlier_idx = -1
-    
-    for i, slot in enumerate(slots):
-        c = slot.centroid
-        distance = ((c.x - avg_x)**2 + (c.y - avg_y)**2)**0.5
-        
-        # Keep track of the piece furthest from center
-        if distance > max_distance:
-            max_distance = distance
-            outlier_idx = i
+    # Find the piece furthest from the average position
+    distances = np.hypot(centroids[:, 0] - avg_x, centroids[:, 1] - avg_y)
+    outlier_idx = int(np.argmax(distances))
+    max_distance = distances[outlier_idx]
     
     # If we found a significant outlier, move it closer to the group
-    if max_distance > 200 and outlier_idx >= 0:  # Threshold for "too far"
-        # Get the outlier piece
-        outlier = slots[outlier_idx]
-        c = outlier.centroid
-        
+    if max_distance > threshold:  # Threshold for "too far"
         # Calculate movement vector toward center
-        dir_x = avg_x - c.x
-        dir_y = avg_y - c.y
+        dir_x = avg_x - centroids[outlier_idx, 0]
+        dir_y = avg_y - centroids[outlier_idx, 1]
         
         # Move the piece 90% of the way to the average position
-        slots[outlier_idx] = translate(outlier, dir_x * 0.9, dir_y * 0.9)
+        moved = translate(slots[outlier_idx], dir_x * 0.9, dir_y * 0.9)
         
-        result = Design(slots)
-        return constrain_to_canvas(result, canvas_width, canvas_height)
+        result = design.with_slot(outlier_idx, moved)
+        return constrain_moved_slot(result, outlier_idx, canvas_width, canvas_height)
     
     return design
 
 
-def optimize(initial_design: Design, iterations=10000, alpha=0.99, allow_rotation=True, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT) -> Design:
-    """Optimize the design using simulated annealing, preserving original shapes"""
+def initial_layout(initial_design: Design, allow_rotation, canvas_width, canvas_height, original_areas,
+                   params: AnnealParams = DEFAULT_PARAMS) -> Design:
+    """Valid starting layout for annealing, within the canvas"""
     # Make a clean copy of the initial design
     design = Design([slot for slot in initial_design.slots])
     
-    # Store original shapes to verify no scaling occurs
-    original_areas = {i: slot.area for i, slot in enumerate(design.slots)}
-    
     # Ensure design is within canvas bounds to start with
     design = constrain_to_canvas(design, canvas_width, canvas_height)
     
@@ -568,7 +813,7 @@ def optimize(initial_design: Design, iterations=10000, alpha=0.99, allow_rotatio
             break
     
     # Check for outlier pieces and fix them first
-    design = fix_isolated_piece(design, canvas_width, canvas_height)
+    design = fix_isolated_piece(design, canvas_width, canvas_height, params.outlier_distance)
     
     # Apply different initial arrangements based on rotation preference
     if len(design.slots) > 3:
@@ -585,15 +830,108 @@ def optimize(initial_design: Design, iterations=10000, alpha=0.99, allow_rotatio
     # If design is not valid, separate pieces
     if not design.is_valid:
         design = separate_overlapping_pieces(design, MIN_SPACING, canvas_width, canvas_height)
-    
-    best_design = design
-    best_score = evaluate(best_design)
+    return design
 
-    explore_phase = int(iterations * 0.7)  # 70% exploration, 30% refinement
+def optimize(initial_design: Design, iterations=10000, alpha=None, allow_rotation=True, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT, objective=None, fast_rectangles=True, engine="anneal",
+             tiling=True, time_limit=None, target_score=None, checkpoint=None, resume=False, checkpoint_interval=CHECKPOINT_INTERVAL,
+             params: Optional[AnnealParams] = None, report: Optional[dict] = None) -> Design:
+    """Optimize the design using simulated annealing, preserving original shapes.
+    objective is a registered objective name, an Objective, or a {name: weight}
+    mapping (see objectives.get_objective); the default minimizes bounding box area.
+    Designs made only of axis-aligned rectangles are optimized for area by the
+    NumPy engine in rect_engine unless fast_rectangles is False, with its own
+    tuned params (rect_engine.RectParams) instead of params.
+    engine="genetic" searches with the genetic algorithm in genetic.py instead,
+    spending iterations as its budget of fitness evaluations.
+    With tiling, the annealer packs each large group of identical pieces into
+    a lattice block and moves it as one piece (see lattice.py), when the
+    objective only depends on the board's extents.
+    With time_limit (seconds) every engine runs until that much time has passed
+    instead of for a number of iterations, adapting its schedule to the time
+    left, and returns the best valid design found. Any engine also stops early
+    once the objective's score reaches target_score. The annealer raises
+    ValueError if it never reaches a valid design.
+    With a checkpoint path, the run's state is written there every
+    checkpoint_interval seconds, and with resume a run continues from the
+    checkpoint there if there is one (see checkpoint.py). A run bounded by
+    iterations then ends exactly as it would have without the interruption.
+    params are the annealer's settings. By default they are the profile tuned
+    for the board's class in PROFILES_PATH, if tune.py has written one, and
+    an explicit alpha overrides the profile's.
+    Pass a dict as report to have the annealer fill it in with its stats and,
+    with params.adaptive_operators, the learned operator weights."""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {', '.join(ENGINES)}")
+    objective = get_objective(objective)
+    explicit_alpha = alpha
+    if params is None:
+        params = load_params(initial_design)
+    if alpha is None:
+        alpha = params.alpha
+    if engine == "genetic":
+        from board_forge.genetic import optimize_genetic
+        return optimize_genetic(initial_design, iterations, allow_rotation, canvas_width, canvas_height, objective,
+                                time_limit=time_limit, target_score=target_score, checkpoint=checkpoint,
+                                resume=resume, checkpoint_interval=checkpoint_interval)
+    if fast_rectangles and type(objective) is BoundingBoxArea:
+        # Imported here, rect_engine builds on this module
+        from board_forge.rect_engine import optimize_rectangles
+        # With its own tuned params (see rect_engine.RectParams)
+        result = optimize_rectangles(initial_design, iterations, explicit_alpha, allow_rotation, canvas_width,
+                                     canvas_height, time_limit, target_score, checkpoint, resume, checkpoint_interval)
+        if result is not None:
+            return result
+    if tiling:
+        # Imported here, lattice builds on this module
+        from board_forge.lattice import TILING_OBJECTIVES, optimize_tiled
+        if type(objective) in TILING_OBJECTIVES:
+            result = optimize_tiled(initial_design, iterations, alpha, allow_rotation, canvas_width, canvas_height,
+                                    objective, time_limit=time_limit, target_score=target_score,
+                                    checkpoint=checkpoint, resume=resume, checkpoint_interval=checkpoint_interval,
+                                    params=params, report=report)
+            if result is not None:
+                return result
+    # Store original shapes to verify no scaling occurs
+    original_areas = {i: slot.area for i, slot in enumerate(initial_design.slots)}
+    saved = resume_from(checkpoint, resume, "anneal")
+    checkpointer = checkpointer_for(checkpoint, checkpoint_interval)
+    # Setup counts against the time limit too
+    budget = Budget(iterations, time_limit, target_score, saved.elapsed if saved else 0.0)
+    if saved is None:
+        design = initial_layout(initial_design, allow_rotation, canvas_width, canvas_height, original_areas, params)
+        score = objective.evaluate(design)
+        # Only valid designs count as the best; the starting layout may not be one
+        best_design, best_score = (design, score) if design.is_valid else (None, float("inf"))
+        no_improvement_count = 0
+        stats = {"accepted": 0, "invalid": 0, "repaired": 0}
+        start = 0
+    else:
+        design, best_design = Design(saved.slots("current")), Design(saved.slots("best"))
+        if saved.state["best_score"] == float("inf"):
+            best_design = None  # nothing valid yet, see make_checkpoint
+        if len(design.slots) != len(initial_design.slots):
+            raise ValueError(f"Checkpoint has {len(design.slots)} slots, the design has {len(initial_design.slots)}")
+        score, best_score = saved.state["score"], saved.state["best_score"]
+        no_improvement_count = saved.state["no_improvement_count"]
+        stats = saved.state["stats"]
+        start = saved.iteration
+        saved.restore_rng()
+    bandit = OperatorBandit(params) if params.adaptive_operators else None
+    vertices = shapely.get_num_coordinates(slot_array(initial_design.slots))
+    if saved is not None and bandit is not None:
+        bandit.load_arrays(saved.arrays)
+
+    def make_checkpoint():
+        state = {"score": score, "best_score": best_score, "no_improvement_count": no_improvement_count,
+                 "temperature": budget.temperature(alpha), "stats": stats}
+        result = Checkpoint("anneal", i, budget.elapsed(), state, bandit.to_arrays() if bandit is not None else {})
+        result.add_slots("current", design.slots)
+        result.add_slots("best", (best_design or design).slots)
+        return result
 
-    t = 1.0  # Starting temperature
-    no_improvement_count = 0
-    max_no_improvement = iterations * 0.3  # Allow 30% of iterations without improvement
+    explore_phase = params.explore_fraction  # Share of exploration, by progress through the budget
+
+    max_no_improvement = iterations * params.stagnation_fraction  # Iterations allowed without improvement
     
     # Verification function to ensure shapes don't change
     def verify_shapes(design, original_areas):
@@ -605,29 +943,40 @@ def optimize(initial_design: Design, iterations=10000, alpha=0.99, allow_rotatio
                 return False
         return True
     
-    for i in range(iterations):
-        if no_improvement_count > max_no_improvement:
+    for i in itertools.count(start):
+        if not budget.running(i, best_score):
+            break
+        # A time-limited run uses all its time, stuck or not
+        if not budget.timed and no_improvement_count > max_no_improvement:
             print("Optimization stopped early due to no improvement")
             break
+        if checkpointer is not None:
+            checkpointer.maybe_save(make_checkpoint)
             
-        phase = "explore" if i < explore_phase else "refine"
+        phase = "explore" if budget.progress < explore_phase else "refine"
+        t = budget.temperature(alpha)
 
         # Create a new design by applying a random action
-        design_new = apply_random_action(design, phase, allow_rotation, canvas_width, canvas_height)
+        credit = 0.0  # For the bandit, see OperatorBandit
+        design_new = apply_random_action(design, phase, allow_rotation, canvas_width, canvas_height, params, bandit)
         
         # Double-check the design is within canvas bounds
         design_new = constrain_to_canvas(design_new, canvas_width, canvas_height)
+        cost = proposal_cost(design, design_new, vertices) if bandit is not None else 0
         
         # IMPORTANT: Verify no scaling has occurred
         if not verify_shapes(design_new, original_areas):
+            if bandit is not None:
+                bandit.reward(credit, cost)
             continue  # Skip this iteration if shapes have changed
         
         # Check if the new design is valid and evaluate it
         valid_new = design_new.is_valid
         
         if valid_new:
-            score_old = evaluate(design)
-            score_new = evaluate(design_new)
+            # Single-slot moves are scored incrementally where the objective allows
+            score_old = score
+            score_new = objective.score_move(design, score, design_new)
 
             # Update best design if this is better
             if score_new < best_score:
@@ -640,41 +989,57 @@ def optimize(initial_design: Design, iterations=10000, alpha=0.99, allow_rotatio
             # Simulated annealing acceptance criterion
             if score_new < score_old or random.random() < np.exp(-(score_new - score_old) / t):
                 design = design_new
+                score = score_new
+                stats["accepted"] += 1
+                credit = 1.0 * (score_new < score_old) + 2.0 * (score_new <= best_score)
         else:
+            stats["invalid"] += 1
+            cost += vertices.sum()  # the repair pass works over the whole design
             # Try to fix invalid design
             fixed_design = separate_overlapping_pieces(design_new, MIN_SPACING, canvas_width, canvas_height)
             
             # Verify fixed design maintains original shapes
             if fixed_design.is_valid and verify_shapes(fixed_design, original_areas):
-                score_old = evaluate(design)
-                score_new = evaluate(fixed_design)
+                score_old = score
+                score_new = objective.evaluate(fixed_design)
                 
                 # Accept the fixed design if it's better
                 if score_new < score_old or random.random() < np.exp(-(score_new - score_old) / (t * 2)):
                     design = fixed_design
+                    score = score_new
+                    stats["repaired"] += 1
+                    credit = 1.0 * (score_new < score_old) + 2.0 * (score_new <= best_score)
                     if score_new < best_score:
                         best_design = fixed_design
                         best_score = score_new
                         no_improvement_count = 0  # Reset counter
             else:
                 no_improvement_count += 1  # Increment counter
-                
-        # Cool down the temperature
-        t *= alpha
+        if bandit is not None:
+            bandit.reward(credit, cost)
     
-    # Final check to ensure our best design is valid and within canvas
-    if not best_design.is_valid:
-        best_design = separate_overlapping_pieces(best_design, MIN_SPACING, canvas_width, canvas_height)
-    
-    # Final constraint check
-    best_design = constrain_to_canvas(best_design, canvas_width, canvas_height)
-    
-    # If there's a piece far away from others, bring it closer
-    best_design = fix_isolated_piece(best_design, canvas_width, canvas_height)
-    
-    # Final verification that shapes haven't changed
-    if not verify_shapes(best_design, original_areas):
-        print("Warning: Final design has scaled pieces. Restoring original design.")
-        return initial_design
+    if report is not None:
+        report["stats"] = stats
+        if bandit is not None:
+            report["operators"] = bandit.report()
+
+    # No valid design was reached: one last repair of where the search ended
+    # up, else the caller's own layout if that was valid
+    if best_design is None:
+        repaired = separate_overlapping_pieces(design, MIN_SPACING, canvas_width, canvas_height)
+        if not (repaired.is_valid and verify_shapes(repaired, original_areas)):
+            repaired = constrain_to_canvas(initial_design, canvas_width, canvas_height)
+        if not (repaired.is_valid and verify_shapes(repaired, original_areas)):
+            raise ValueError("Optimization found no valid layout: the pieces overlap or sit closer than "
+                             f"{MIN_SPACING}mm. Try more iterations, a longer time limit or a larger canvas.")
+        best_design = repaired
+
+    # Final touches, each kept only if the design stays valid
+    for finish in (lambda d: constrain_to_canvas(d, canvas_width, canvas_height),
+                   # If there's a piece far away from others, bring it closer
+                   lambda d: fix_isolated_piece(d, canvas_width, canvas_height, params.outlier_distance)):
+        finished = finish(best_design)
+        if finished.is_valid and verify_shapes(finished, original_areas):
+            best_design = finished
     
     return best_design
\ No newline at end of file
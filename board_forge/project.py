@@ -0,0 +1,134 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+from dataclasses import dataclass, field
+from typing import List
+import numpy as np
+import shapely
+from design import Design
+from piece import Piece
+
+# File layout:
+#   MAGIC | uint32 header length | JSON header | padding to 8 bytes | arrays
+# The header records dtype, shape and offset (from the start of the array
+# section) of each packed array, so arrays can be read straight out of a
+# memory map without copying.
+MAGIC = b"BFPJ"
+VERSION = 2  # 2 stores holes: polygons as shapely ragged arrays, not just exteriors
+ALIGN = 8
+
+@dataclass
+class Project:
+    pieces: List[Piece] = field(default_factory=list)
+    design: Design = field(default_factory=lambda: Design(slots=[]))
+    settings: dict = field(default_factory=dict)
+
+def pack_polygons(polygons):
+    """Pack polygons into shapely ragged arrays (coords, ring_offsets,
+    polygon_offsets): polygon i has rings polygon_offsets[i] up to
+    polygon_offsets[i + 1], exterior first, and ring r is the closed ring
+    coords[ring_offsets[r]:ring_offsets[r + 1]]"""
+    if not len(polygons):
+        return np.empty((0, 2)), np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    _, coords, (ring_offsets, polygon_offsets) = shapely.to_ragged_array(np.asarray(polygons, dtype=object))
+    return coords, ring_offsets, polygon_offsets
+
+def unpack_polygons(coords, ring_offsets, polygon_offsets):
+    """Inverse of pack_polygons, building all polygons in one vectorized call"""
+    if len(polygon_offsets) <= 1:
+        return []
+    return list(shapely.from_ragged_array(shapely.GeometryType.POLYGON, coords, (ring_offsets, polygon_offsets)))
+
+def unpack_exteriors(offsets, coords):
+    """Polygons from version 1 files, which stored only exteriors: polygon i's
+    ring is coords[offsets[i]:offsets[i + 1]] without the closing point"""
+    if len(offsets) <= 1:
+        return []
+    ring_index = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    rings = shapely.linearrings(coords, indices=ring_index)
+    return list(shapely.polygons(rings))
+
+def write_container(f, header: dict, arrays, magic=MAGIC):
+    """Write header (with the array specs added) and arrays to binary file f
+    in the layout above"""
+    array_specs = {}
+    offset = 0
+    for name, array in arrays.items():
+        array_specs[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    header = json.dumps({**header, "arrays": array_specs}).encode()
+    prefix = magic + struct.pack("<I", len(header)) + header
+    prefix += b"\0" * (-len(prefix) % ALIGN)
+
+    f.write(prefix)
+    for array in arrays.values():
+        data = np.ascontiguousarray(array).tobytes()
+        f.write(data)
+        f.write(b"\0" * (-len(data) % ALIGN))
+
+def save_container(path, header: dict, arrays, magic=MAGIC):
+    """Atomically replace the file at path with header and arrays: they are
+    written to a temporary file beside it that is then renamed over it, so a
+    crash mid-save leaves the old file intact"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".board-forge-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_container(f, header, arrays, magic)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def save_project(path, project: Project):
+    arrays = {}
+    for name, polygons in (("piece", [p.shape for p in project.pieces]), ("slot", project.design.slots)):
+        coords, ring_offsets, polygon_offsets = pack_polygons(polygons)
+        arrays[f"{name}_coords"] = coords
+        arrays[f"{name}_rings"] = ring_offsets
+        arrays[f"{name}_polygons"] = polygon_offsets
+    header = {
+        "version": VERSION,
+        "pieces": [p.name for p in project.pieces],
+        "settings": project.settings,
+    }
+    save_container(path, header, arrays)
+
+def read_header(buffer, magic=MAGIC, version=VERSION, kind="project"):
+    if buffer[:4] != magic:
+        raise ValueError(f"Not a Board Forge {kind} file")
+    (header_len,) = struct.unpack_from("<I", buffer, 4)
+    header = json.loads(bytes(buffer[8:8 + header_len]))
+    if header["version"] > version:
+        raise ValueError(f"{kind.capitalize()} file version {header['version']} is newer than supported ({version})")
+    data_start = 8 + header_len + (-(8 + header_len) % ALIGN)
+    return header, data_start
+
+def load_arrays(path, magic=MAGIC, version=VERSION, kind="project"):
+    """Return the file's header and its packed arrays as read-only views of a
+    memory map, for tools that want the raw coordinates without building geometry"""
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header, data_start = read_header(buffer, magic, version, kind)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                     offset=data_start + spec["offset"]).reshape(spec["shape"])
+    return header, arrays
+
+def load_project(path) -> Project:
+    header, arrays = load_arrays(path)
+    if header["version"] < 2:
+        piece_shapes = unpack_exteriors(arrays["piece_offsets"], arrays["piece_coords"])
+        slots = unpack_exteriors(arrays["slot_offsets"], arrays["slot_coords"])
+    else:
+        piece_shapes, slots = (unpack_polygons(arrays[f"{name}_coords"], arrays[f"{name}_rings"],
+                                               arrays[f"{name}_polygons"]) for name in ("piece", "slot"))
+    pieces = [Piece(name, shape) for name, shape in zip(header["pieces"], piece_shapes)]
+    return Project(pieces, Design(slots), header["settings"])
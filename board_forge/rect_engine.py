@@ -0,0 +1,339 @@
+"""NumPy-only optimizer for designs whose slots are all axis-aligned rectangles.
+
+Slots are held as (x0, y0, x1, y1) bound arrays, so the clearance test for a
+moved rectangle is interval arithmetic against every other rectangle at once
+(the distance between two rectangles is the hypot of their x and y gaps), and
+the bounding box is a min/max over the arrays. A skyline packing gives the
+starting layout, array-based annealing improves it, and polygons are only
+built again for the result.
+
+Rectangles stay rectangles, so only 90 degree rotations are used. Designs of
+up to EXACT_MAX_PIECES rectangles are handed to the exact solver afterwards,
+which usually improves on the annealed layout and proves it optimal for about
+6 rectangles or fewer.
+"""
+import itertools
+import random
+from dataclasses import asdict, dataclass, fields
+from typing import List, Optional, Tuple
+import numpy as np
+import shapely
+from board_forge.design import Design, PADDING
+from board_forge.exact import solve_rectangles
+from board_forge.checkpoint import CHECKPOINT_INTERVAL, Checkpoint, checkpointer_for, resume_from
+from board_forge.optimize import (Budget, MIN_SPACING, CANVAS_MARGIN, CANVAS_WIDTH, CANVAS_HEIGHT, PROFILES_PATH,
+                                  board_class, choose, load_profiles, slot_array)
+
+# Extra clearance on constructed positions so rounding can't leave pieces 9.99999mm apart
+CLEARANCE_EPS = 1e-6
+# Small designs also get an exact branch-and-bound search, for at most this long
+EXACT_MAX_PIECES = 8
+EXACT_TIME_LIMIT = 0.5
+EXACT_TIME_SHARE = 0.25  # of a given time_limit
+
+@dataclass(frozen=True)
+class RectParams:
+    """Tunable settings of RectangleAnnealer, the rectangle counterpart of
+    AnnealParams. tune.py stores them under "rect_params" in the profiles of
+    rect-* board classes."""
+    alpha: float = 0.99  # Cooling factor per iteration
+    explore_fraction: float = 0.7  # Share of the run spent exploring before refining
+    stagnation_fraction: float = 0.3  # Stop after this share of iterations without improvement
+    translate_amount: float = 15  # Largest random move while exploring
+    refine_translate_amount: float = 1.5
+    compact_amount: float = 0.15  # Largest share of the way to the middle a compaction moves a slot
+    repack_chance: float = 0.05  # Chance of a skyline repack per move
+    # Move probabilities while exploring: random translation, slide, compaction,
+    # quarter turn (a slide instead when rotation is off)
+    explore_weights: Tuple[float, ...] = (0.3, 0.3, 0.1, 0.3)
+    # While refining, same moves
+    refine_weights: Tuple[float, ...] = (0.5, 0.4, 0.0, 0.1)
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "RectParams":
+        """Params from a profile, ignoring keys this version doesn't know"""
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: tuple(v) if isinstance(v, list) else v for k, v in values.items() if k in known})
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+DEFAULT_RECT_PARAMS = RectParams()
+
+def load_rect_params(design: Design, path=PROFILES_PATH) -> RectParams:
+    """The tuned params for design's board class, or the defaults"""
+    if not design.slots:
+        return DEFAULT_RECT_PARAMS
+    profile = load_profiles(path).get(board_class(design.slots))
+    return RectParams.from_dict(profile["rect_params"]) if profile and "rect_params" in profile else DEFAULT_RECT_PARAMS
+
+def rectangle_bounds(slots) -> Optional[np.ndarray]:
+    """(n, 4) array of slot bounds if every slot is an axis-aligned rectangle, else None"""
+    if not slots:
+        return None
+    geoms = slot_array(slots)
+    if not np.all(shapely.get_type_id(geoms) == 3) or np.any(shapely.get_num_interior_rings(geoms)):
+        return None
+    bounds = shapely.bounds(geoms)
+    box_areas = (bounds[:, 2] - bounds[:, 0]) * (bounds[:, 3] - bounds[:, 1])
+    # A polygon filling its own bounding box is that box
+    if np.any(box_areas <= 0) or np.any(np.abs(shapely.area(geoms) - box_areas) > 1e-6 * box_areas):
+        return None
+    return bounds
+
+def skyline_pack(widths, heights, strip_width, allow_rotation=True, spacing=MIN_SPACING) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Bottom-left skyline packing of rectangles, in the given order, into a
+    strip strip_width wide. Returns x, y and whether each one was rotated.
+    Each rectangle reserves spacing to its right and top, which keeps every
+    pair at least spacing apart."""
+    gap = spacing + CLEARANCE_EPS
+    strip = strip_width + gap
+    skyline = [[0.0, 0.0, strip]]  # segments of [x, y, width]
+    n = len(widths)
+    xs, ys, rotated = np.zeros(n), np.zeros(n), np.zeros(n, dtype=bool)
+    for k in range(n):
+        orientations = [(widths[k] + gap, heights[k] + gap, False)]
+        if allow_rotation and widths[k] != heights[k]:
+            orientations.append((heights[k] + gap, widths[k] + gap, True))
+        best = None
+        for w, h, turned in orientations:
+            for start in range(len(skyline)):
+                x = skyline[start][0]
+                if x + w > strip + 1e-9 and x > 0:
+                    break
+                # Rest on the highest segment under [x, x + w)
+                y, end = 0.0, start
+                while end < len(skyline) and skyline[end][0] < x + w - 1e-9:
+                    y = max(y, skyline[end][1])
+                    end += 1
+                if best is None or (y + h, x) < (best[0] + best[3], best[1]):
+                    best = (y, x, w, h, turned, start)
+        y, x, w, h, turned, start = best
+        xs[k], ys[k], rotated[k] = x, y, turned
+        # Replace the covered part of the skyline with the new top edge
+        new_skyline = skyline[:start] + [[x, y + h, w]]
+        for seg_x, seg_y, seg_w in skyline[start:]:
+            seg_end = seg_x + seg_w
+            if seg_end <= x + w + 1e-9:
+                continue
+            cut = max(seg_x, x + w)
+            new_skyline.append([cut, seg_y, seg_end - cut])
+        skyline = new_skyline
+    return xs, ys, rotated
+
+def packed_bounds(sizes, order, strip_width, allow_rotation, origin) -> np.ndarray:
+    """Bounds of the skyline packing of the (n, 2) sizes in order, offset to origin"""
+    w, h = sizes[order, 0], sizes[order, 1]
+    xs, ys, rotated = skyline_pack(w, h, strip_width, allow_rotation)
+    w, h = np.where(rotated, h, w), np.where(rotated, w, h)
+    bounds = np.empty((len(order), 4))
+    bounds[order] = np.column_stack([xs, ys, xs + w, ys + h]) + origin
+    return bounds
+
+def bounds_area(bounds) -> float:
+    """Padded bounding box area, as scored by evaluate()"""
+    width = bounds[:, 2].max() - bounds[:, 0].min() + 2 * PADDING
+    height = bounds[:, 3].max() - bounds[:, 1].min() + 2 * PADDING
+    return width * height
+
+def clear_of_others(bounds, idx, rect, spacing=MIN_SPACING) -> bool:
+    """Whether rect (x0, y0, x1, y1) as slot idx keeps spacing to every other slot"""
+    gap_x = np.maximum(bounds[:, 0] - rect[2], rect[0] - bounds[:, 2])
+    gap_y = np.maximum(bounds[:, 1] - rect[3], rect[1] - bounds[:, 3])
+    distance = np.hypot(np.maximum(gap_x, 0), np.maximum(gap_y, 0))
+    distance[idx] = np.inf
+    return bool(distance.min() >= spacing)
+
+def all_clear(bounds, spacing=MIN_SPACING) -> bool:
+    """Pairwise clearance check over all slots"""
+    gap_x = np.maximum(bounds[:, None, 0] - bounds[None, :, 2], bounds[None, :, 0] - bounds[:, None, 2])
+    gap_y = np.maximum(bounds[:, None, 1] - bounds[None, :, 3], bounds[None, :, 1] - bounds[:, None, 3])
+    distance = np.hypot(np.maximum(gap_x, 0), np.maximum(gap_y, 0))
+    np.fill_diagonal(distance, np.inf)
+    return bool(distance.min() >= spacing)
+
+def slide(bounds, idx, axis, low, spacing=MIN_SPACING) -> np.ndarray:
+    """Slot idx pushed left (axis 0) or down (axis 1) until it meets another slot or low"""
+    rect = bounds[idx].copy()
+    other = 1 - axis
+    # Anything within spacing across the slide direction can block it
+    across = (bounds[:, other] < rect[other + 2] + spacing) & (rect[other] < bounds[:, other + 2] + spacing)
+    behind = across & (bounds[:, axis + 2] <= rect[axis] + 1e-9)
+    behind[idx] = False
+    stop = max(low, bounds[behind, axis + 2].max() + spacing + CLEARANCE_EPS) if behind.any() else low
+    # Diagonal neighbours can sit closer than spacing along the axis; don't move away
+    if stop < rect[axis]:
+        rect[[axis, axis + 2]] -= rect[axis] - stop
+    return rect
+
+class RectangleAnnealer:
+    """Simulated annealing over rectangle bound arrays.
+
+    Mirrors optimize()'s schedule (exploration, then refinement, stopping after
+    a share of the iterations without improvement) with moves suited to
+    rectangles, all set by params.
+    """
+
+    def __init__(self, bounds, allow_rotation=True, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT,
+                 params: RectParams = DEFAULT_RECT_PARAMS):
+        self.params = params
+        self.bounds = np.array(bounds, dtype=float)
+        self.sizes = np.column_stack([self.bounds[:, 2] - self.bounds[:, 0], self.bounds[:, 3] - self.bounds[:, 1]])
+        self.allow_rotation = allow_rotation
+        self.low = CANVAS_MARGIN + PADDING
+        self.high = np.array([canvas_width, canvas_height]) - CANVAS_MARGIN - PADDING
+
+    def clamp(self, rect) -> np.ndarray:
+        """Shift rect back inside the canvas margins where it fits"""
+        size = rect[2:] - rect[:2]
+        corner = np.maximum(np.minimum(rect[:2], self.high - size), self.low)
+        return np.concatenate([corner, corner + size])
+
+    def initial_layout(self) -> np.ndarray:
+        """Best of a few skyline packings over different orders and strip widths"""
+        n = len(self.sizes)
+        inflated = (self.sizes + MIN_SPACING).prod(axis=1).sum()
+        min_width = self.sizes.min(axis=1).max() if self.allow_rotation else self.sizes[:, 0].max()
+        max_width = max(self.high[0] - self.low, min_width)
+        orders = [
+            np.argsort(-self.sizes.max(axis=1), kind="stable"),
+            np.argsort(-self.sizes.prod(axis=1), kind="stable"),
+            np.argsort(-self.sizes[:, 1], kind="stable"),
+        ]
+        best, best_key = None, None
+        for factor in (0.8, 1.0, 1.15, 1.3, 1.5, 2.0):
+            strip = min(max(np.sqrt(inflated) * factor, min_width), max_width)
+            for order in orders:
+                bounds = packed_bounds(self.sizes, order, strip, self.allow_rotation, self.low)
+                # Prefer layouts that fit the canvas, then the smallest board
+                key = (bool(bounds[:, 3].max() > self.high[1]), bounds_area(bounds))
+                if best_key is None or key < best_key:
+                    best, best_key = bounds, key
+        return best if n else self.bounds
+
+    def repack(self, bounds) -> np.ndarray:
+        """Skyline repack of the current layout's reading order, lightly shuffled"""
+        order = np.lexsort((bounds[:, 0], bounds[:, 1]))
+        i, j = random.randrange(len(order)), random.randrange(len(order))
+        order[[i, j]] = order[[j, i]]
+        strip = max(bounds[:, 2].max() - bounds[:, 0].min(), self.sizes.min(axis=1).max())
+        strip *= random.uniform(0.9, 1.1)
+        return packed_bounds(self.sizes, order, min(strip, self.high[0] - self.low), self.allow_rotation, self.low)
+
+    def move(self, bounds, phase) -> Tuple[Optional[int], np.ndarray]:
+        """Propose a move: (idx, new rect) for a single slot, or (None, new bounds)"""
+        n = len(bounds)
+        params = self.params
+        if random.random() < params.repack_chance:
+            return None, self.repack(bounds)
+        idx = random.randrange(n)
+        rect = bounds[idx].copy()
+        action = choose(params.explore_weights if phase == "explore" else params.refine_weights)
+        if action == 0:
+            amount = params.translate_amount if phase == "explore" else params.refine_translate_amount
+            rect += np.tile([random.uniform(-amount, amount), random.uniform(-amount, amount)], 2)
+            return idx, self.clamp(rect)
+        if action == 1 or action == 3 and not self.allow_rotation:
+            return idx, slide(bounds, idx, random.randrange(2), self.low)
+        if action == 2:
+            # Everything a little toward the middle
+            centers = (bounds[:, :2] + bounds[:, 2:]) / 2
+            amount = params.compact_amount
+            offsets = (centers.mean(axis=0) - centers) * np.array([random.uniform(amount / 3, amount) for _ in range(n)])[:, None]
+            return None, bounds + np.tile(offsets, 2)
+        # Quarter turn about the slot's centre
+        center = (rect[:2] + rect[2:]) / 2
+        half = (rect[2:] - rect[:2])[::-1] / 2
+        return idx, self.clamp(np.concatenate([center - half, center + half]))
+
+    def run(self, iterations=10000, alpha=None, time_limit=None, target_score=None,
+            checkpoint=None, resume=False, checkpoint_interval=CHECKPOINT_INTERVAL) -> np.ndarray:
+        if alpha is None:
+            alpha = self.params.alpha
+        saved = resume_from(checkpoint, resume, "rectangles")
+        checkpointer = checkpointer_for(checkpoint, checkpoint_interval)
+        budget = Budget(iterations, time_limit, target_score, saved.elapsed if saved else 0.0)
+        if saved is None:
+            # Like optimize()'s compact grid, the starting layout ignores the current one
+            current = self.initial_layout()
+            score = bounds_area(current)
+            best, best_score = current, score
+            no_improvement_count = 0
+            start = 0
+        else:
+            current, best = saved.arrays["current"], saved.arrays["best"]
+            if current.shape != self.bounds.shape:
+                raise ValueError(f"Checkpoint has {len(current)} rectangles, the design has {len(self.bounds)}")
+            score, best_score = saved.state["score"], saved.state["best_score"]
+            no_improvement_count = saved.state["no_improvement_count"]
+            start = saved.iteration
+            saved.restore_rng()
+
+        def make_checkpoint():
+            state = {"score": score, "best_score": best_score, "no_improvement_count": no_improvement_count,
+                     "temperature": budget.temperature(alpha)}
+            return Checkpoint("rectangles", i, budget.elapsed(), state, {"current": current, "best": best})
+
+        max_no_improvement = iterations * self.params.stagnation_fraction
+        for i in itertools.count(start):
+            if not budget.running(i, best_score):
+                break
+            if not budget.timed and no_improvement_count > max_no_improvement:
+                break
+            if checkpointer is not None:
+                checkpointer.maybe_save(make_checkpoint)
+            phase = "explore" if budget.progress < self.params.explore_fraction else "refine"
+            t = budget.temperature(alpha)
+            idx, proposal = self.move(current, phase)
+            if idx is None:
+                new_bounds = proposal
+                valid = all_clear(new_bounds)
+            else:
+                valid = clear_of_others(current, idx, proposal)
+                if valid:
+                    new_bounds = current.copy()
+                    new_bounds[idx] = proposal
+            if valid:
+                score_new = bounds_area(new_bounds)
+                if score_new < best_score:
+                    best, best_score = new_bounds, score_new
+                    no_improvement_count = 0
+                else:
+                    no_improvement_count += 1
+                if score_new < score or random.random() < np.exp(-(score_new - score) / t):
+                    current, score = new_bounds, score_new
+            else:
+                no_improvement_count += 1
+        return best
+
+def bounds_to_slots(bounds) -> List:
+    return list(shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3]))
+
+def optimize_rectangles(design: Design, iterations=10000, alpha=None, allow_rotation=True,
+                        canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT,
+                        time_limit=None, target_score=None, checkpoint=None, resume=False,
+                        checkpoint_interval=CHECKPOINT_INTERVAL, params: Optional[RectParams] = None) -> Optional[Design]:
+    """Optimize an all-rectangle design by bounding box area without any
+    geometry operations. Returns None if the design has other shapes.
+    params default to the profile tuned for the board's class, if any, and
+    an explicit alpha overrides theirs.
+    Up to EXACT_MAX_PIECES rectangles, the annealed layout seeds an exact
+    search that replaces it with any smaller packing found."""
+    bounds = rectangle_bounds(design.slots)
+    if bounds is None:
+        return None
+    if params is None:
+        params = load_rect_params(design)
+    if alpha is None:
+        alpha = params.alpha
+    exact_time = 0.0
+    if len(bounds) <= EXACT_MAX_PIECES:
+        exact_time = EXACT_TIME_LIMIT if time_limit is None else min(EXACT_TIME_LIMIT, time_limit * EXACT_TIME_SHARE)
+    annealer = RectangleAnnealer(bounds, allow_rotation, canvas_width, canvas_height, params)
+    anneal_time = None if time_limit is None else time_limit - exact_time
+    best = Design(bounds_to_slots(annealer.run(iterations, alpha, anneal_time, target_score,
+                                                checkpoint, resume, checkpoint_interval)))
+    if exact_time > 0 and (target_score is None or best.bounding_box.area > target_score):
+        best = solve_rectangles(design, exact_time, allow_rotation=allow_rotation, canvas_width=canvas_width,
+                                canvas_height=canvas_height, incumbent=best).design
+    return best
@@ -0,0 +1,49 @@
+"""Break down the import time of the GUI entry point by top-level package.
+
+Usage: python startup_profile.py [--module main] [--budget-ms 400]
+
+Runs the import in a fresh interpreter with -X importtime, so nothing cached in
+this process skews the numbers. With --budget-ms the exit status is non-zero
+when the total exceeds the budget, so launch time can be checked as features
+are added.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+def import_times(module="main"):
+    """Return ([(package, self_us)], total_us) for importing module"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=here, capture_output=True, text=True, check=True
+    )
+    per_package = defaultdict(int)
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        per_package[name.strip().split(".")[0]] += int(self_us)
+        # Only top-level entries (no indentation) contribute to the total
+        if not name[1:].startswith(" "):
+            total += int(cumulative_us)
+    return sorted(per_package.items(), key=lambda item: item[1], reverse=True), total
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--module", default="main", help="module to import (default: main)")
+    ap.add_argument("--top", type=int, default=15, help="number of packages to list")
+    ap.add_argument("--budget-ms", type=float, help="fail if the total exceeds this")
+    args = ap.parse_args()
+
+    packages, total = import_times(args.module)
+    print(f"{'package':<30}{'ms':>8}{'share':>8}")
+    for name, self_us in packages[:args.top]:
+        print(f"{name:<30}{self_us / 1000:>8.1f}{self_us / total:>8.1%}")
+    print(f"{'total':<30}{total / 1000:>8.1f}")
+    if args.budget_ms is not None and total / 1000 > args.budget_ms:
+        print(f"Import time {total / 1000:.1f}ms exceeds budget of {args.budget_ms:.0f}ms")
+        sys.exit(1)
@@ -0,0 +1,228 @@
+"""Tune the annealers' params for each board class and save them as profiles
+that optimize() loads automatically: AnnealParams for convex and mixed
+boards, and rect_engine's RectParams for rectangle boards.
+
+Usage: python tune.py [--classes mixed-30 convex-10 ...] [--configs 27] [--eta 3]
+                      [--min-iterations 100] [--max-iterations 900] [--margin 0.02] [--workers N]
+
+For each class, benchmark boards are drawn from the sample pieces of that
+shape mix and scattered over the canvas. Random configurations (the defaults
+among them) are run with successive halving: every configuration gets a small
+iteration budget, the best 1/eta move on to eta times the budget, and so on
+up to --max-iterations (times RECT_ITERATION_SCALE for rectangle boards,
+whose moves are much cheaper). A configuration's score is its mean score
+relative to the defaults at the same budget, over all boards and seeds, so
+0.95 means boards 5% smaller. Runs are spread over a process pool.
+
+The winner's score is biased by picking the luckiest of many noisy runs, so
+it is then re-scored against the defaults on fresh boards and seeds. It is
+written to optimize.PROFILES_PATH, replacing only the classes that were
+tuned, only if that fresh score beats the defaults by --margin.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+import numpy as np
+from shapely.affinity import translate, rotate
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data.sample_pieces import SAMPLE_PIECES, CATAN_PIECES, CHESS_PIECES
+from board_forge.design import Design
+from board_forge.optimize import (AnnealParams, DEFAULT_PARAMS, COUNT_CLASSES, PROFILES_PATH, CANVAS_MARGIN,
+                                  CANVAS_WIDTH, CANVAS_HEIGHT, board_class, optimize, shape_mix)
+from board_forge.rect_engine import DEFAULT_RECT_PARAMS, RectParams, optimize_rectangles
+
+ALL_PIECES = {**SAMPLE_PIECES, **CATAN_PIECES, **CHESS_PIECES}
+# Pieces of each shape mix, by the class shape_mix() puts them in
+PIECES_BY_MIX = {
+    mix: [shape for shape in ALL_PIECES.values() if shape_mix([shape]) in allowed]
+    for mix, allowed in (("rect", ("rect",)), ("convex", ("rect", "convex")), ("mixed", ("rect", "convex", "mixed")))
+}
+# Ranges searched for each numeric parameter: (low, high, log scale)
+SEARCH_SPACE = {
+    "alpha": (0.95, 0.999, True),
+    "explore_fraction": (0.4, 0.9, False),
+    "stagnation_fraction": (0.15, 0.6, False),
+    "translate_amount": (5, 40, True),
+    "rotate_amount": (0.3, 3.0, True),
+    "refine_translate_amount": (0.3, 5, True),
+    "refine_rotate_amount": (0.1, 1.5, True),
+    "regrid_chance": (0.0, 0.15, False),
+    "outlier_distance": (100, 400, True),
+}
+WEIGHT_FIELDS = ("explore_weights", "refine_weights", "fixed_weights")
+# The same for RectParams, used for rect-* classes
+RECT_SEARCH_SPACE = {
+    "alpha": (0.95, 0.999, True),
+    "explore_fraction": (0.4, 0.9, False),
+    "stagnation_fraction": (0.15, 0.6, False),
+    "translate_amount": (5, 40, True),
+    "refine_translate_amount": (0.3, 5, True),
+    "compact_amount": (0.05, 0.4, True),
+    "repack_chance": (0.0, 0.15, False),
+}
+RECT_WEIGHT_FIELDS = ("explore_weights", "refine_weights")
+# Fraction the winner must beat the defaults by on fresh boards to be saved
+MIN_IMPROVEMENT = 0.02
+TUNABLE_MIXES = ("rect", "convex", "mixed")
+# rect_engine's moves are arithmetic on bounds, so rect-* classes are searched
+# at this many times the iteration budgets, where their layouts start to differ
+RECT_ITERATION_SCALE = 10
+
+def board_count(count_class: str) -> int:
+    """A typical piece count for a count class, such as "30" or "100+"."""
+    if count_class.endswith("+"):
+        return int(count_class[:-1]) * 3 // 2
+    bound = int(count_class)
+    lower = max([c for c in COUNT_CLASSES if c < bound], default=0)
+    return (lower + bound + 1) // 2
+
+def benchmark_boards(key: str, boards=3, seed=0) -> List[Design]:
+    """Random boards of board class key, with the pieces scattered over the canvas"""
+    mix, count_class = key.split("-", 1)
+    rng = random.Random(seed)
+    shapes = PIECES_BY_MIX[mix]
+    result = []
+    # Each board has at least one piece of its own mix, so it lands in the class
+    own = [shape for shape in shapes if shape_mix([shape]) == mix]
+    for _ in range(boards):
+        slots = []
+        for k in range(board_count(count_class)):
+            shape = rotate(rng.choice(own if k == 0 else shapes), rng.choice((0, 90)), origin="centroid")
+            slots.append(translate(shape, rng.uniform(CANVAS_MARGIN, CANVAS_WIDTH - 100),
+                                   rng.uniform(CANVAS_MARGIN, CANVAS_HEIGHT - 100)))
+        design = Design(slots)
+        assert board_class(design.slots) == key, (board_class(design.slots), key)
+        result.append(design)
+    return result
+
+def default_params(key: str):
+    """The untuned params of board class key: RectParams for rect-* classes,
+    which optimize() hands to rect_engine, else AnnealParams"""
+    return DEFAULT_RECT_PARAMS if key.split("-", 1)[0] == "rect" else DEFAULT_PARAMS
+
+def sample_params(rng: random.Random, defaults=DEFAULT_PARAMS):
+    """Random params of the same kind as defaults"""
+    rect = isinstance(defaults, RectParams)
+    values = {}
+    for name, (low, high, log) in (RECT_SEARCH_SPACE if rect else SEARCH_SPACE).items():
+        values[name] = math.exp(rng.uniform(math.log(low), math.log(high))) if log else rng.uniform(low, high)
+    for name in RECT_WEIGHT_FIELDS if rect else WEIGHT_FIELDS:
+        # Dirichlet(1) draws, every action keeps some chance
+        draws = [rng.expovariate(1.0) + 0.05 for _ in getattr(defaults, name)]
+        values[name] = tuple(d / sum(draws) for d in draws)
+    return type(defaults)(**values)
+
+def run_one(task) -> float:
+    """Score of one optimize() run, for the process pool"""
+    params, design, iterations, seed = task
+    random.seed(seed)
+    np.random.seed(seed)
+    if isinstance(params, RectParams):
+        # What optimize() does for rectangle boards, with these params
+        return optimize_rectangles(design, iterations, params=params).bounding_box.area
+    return optimize(design, iterations=iterations, params=params).bounding_box.area
+
+def successive_halving(key, configs=27, eta=3, min_iterations=100, max_iterations=900,
+                       boards=3, seeds=2, workers=None, rng=None, log=print) -> Tuple[object, float, int]:
+    """Tune one board class, returning the best params, their relative score
+    and the budget it was measured at"""
+    rng = rng or random.Random(0)
+    designs = benchmark_boards(key, boards)
+    defaults = default_params(key)
+    candidates = [defaults] + [sample_params(rng, defaults) for _ in range(configs - 1)]
+    iterations = min_iterations
+    with ProcessPoolExecutor(workers) as executor:
+        while True:
+            runs = [(design, seed) for design in designs for seed in range(seeds)]
+            # The defaults are always run so scores are relative to them at this budget
+            pool = candidates if candidates[0] is defaults else [defaults] + candidates
+            tasks = [(params, design, iterations, seed) for params in pool for design, seed in runs]
+            scores = np.array(list(executor.map(run_one, tasks, chunksize=max(1, len(tasks) // 64))))
+            scores = scores.reshape(len(pool), len(runs))
+            relative = (scores / scores[0]).mean(axis=1)
+            ranked = sorted(range(len(pool)), key=lambda k: relative[k])
+            log(f"{key}: {len(pool)} configs at {iterations} iterations, best {relative[ranked[0]]:.3f}")
+            if len(candidates) <= 1 or iterations >= max_iterations:
+                best = ranked[0]
+                return pool[best], float(relative[best]), iterations
+            candidates = [pool[k] for k in ranked[:max(1, len(candidates) // eta)]]
+            iterations = min(iterations * eta, max_iterations)
+
+def validate(key, params, iterations, boards=3, seeds=2, workers=None) -> float:
+    """Relative score of params against the defaults on boards and seeds that
+    successive_halving() never saw"""
+    designs = benchmark_boards(key, boards, seed=1)
+    runs = [(design, seed) for design in designs for seed in range(seeds, 2 * seeds)]
+    tasks = [(p, design, iterations, seed) for p in (default_params(key), params) for design, seed in runs]
+    with ProcessPoolExecutor(workers) as executor:
+        scores = np.array(list(executor.map(run_one, tasks))).reshape(2, len(runs))
+    return float((scores[1] / scores[0]).mean())
+
+def save_profiles(results: Dict[str, dict], path=PROFILES_PATH):
+    """Merge results into the profiles file, written atomically"""
+    profiles = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            profiles = json.load(f).get("profiles", {})
+    profiles.update(results)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"version": 1, "profiles": profiles}, f, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
+
+def main():
+    default_classes = [f"{mix}-{count}" for mix in TUNABLE_MIXES
+                       for count in [str(c) for c in COUNT_CLASSES[:2]]]
+    ap = argparse.ArgumentParser(description="Tune the annealers' parameters per board class")
+    ap.add_argument("--classes", nargs="+", default=default_classes,
+                    help=f"board classes to tune, as shape mix ({', '.join(TUNABLE_MIXES)}) and count class "
+                         f"({', '.join(map(str, COUNT_CLASSES))}, {COUNT_CLASSES[-1]}+)")
+    ap.add_argument("--configs", type=int, default=27)
+    ap.add_argument("--eta", type=int, default=3)
+    ap.add_argument("--min-iterations", type=int, default=100)
+    ap.add_argument("--max-iterations", type=int, default=900)
+    ap.add_argument("--boards", type=int, default=3)
+    ap.add_argument("--seeds", type=int, default=2)
+    ap.add_argument("--margin", type=float, default=MIN_IMPROVEMENT,
+                    help="fraction the winner must beat the defaults by on fresh boards")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output", default=PROFILES_PATH)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {}
+    for key in args.classes:
+        start = time.perf_counter()
+        scale = RECT_ITERATION_SCALE if isinstance(default_params(key), RectParams) else 1
+        params, score, iterations = successive_halving(
+            key, args.configs, args.eta, args.min_iterations * scale, args.max_iterations * scale,
+            args.boards, args.seeds, args.workers, rng)
+        print(f"{key}: relative score {score:.3f} in {time.perf_counter() - start:.0f}s")
+        if params is default_params(key) or score >= 1.0:
+            print(f"{key}: defaults not beaten, profile left as is")
+            continue
+        fresh = validate(key, params, iterations, args.boards, args.seeds, args.workers)
+        print(f"{key}: relative score {fresh:.3f} on fresh boards")
+        if fresh > 1.0 - args.margin:
+            print(f"{key}: not better than the defaults by {args.margin:.0%} on fresh boards, profile left as is")
+            continue
+        # optimize() reads AnnealParams from "params" and rect_engine reads "rect_params"
+        field = "rect_params" if isinstance(params, RectParams) else "params"
+        results[key] = {field: params.to_dict(), "relative_score": round(fresh, 4),
+                        "search_score": round(score, 4), "iterations": iterations,
+                        "boards": args.boards, "seeds": args.seeds}
+    if results:
+        save_profiles(results, args.output)
+        print(f"Wrote {', '.join(results)} to {args.output}")
+
+if __name__ == "__main__":
+    main()
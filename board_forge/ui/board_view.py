@@ -1,79 +1,238 @@
 import tkinter as tk
 from tkinter import ttk
-from shapely.geometry import Polygon
-from shapely.affinity import rotate as shapely_rotate
+import numpy as np
+import shapely
+from shapely.affinity import rotate as shapely_rotate, translate as shapely_translate
 import math
 
+# The view maps design millimetres to canvas pixels as x * scale + offset_x
+DEFAULT_OFFSET = 10  # pixels between the canvas edge and the design origin at the default view
+ZOOM_STEP = 1.2
+MIN_SCALE = 0.02
+MAX_SCALE = 50.0
+# Level of detail by the number of slots in view: full outlines up to
+# DETAIL_LIMIT, outlines simplified to SIMPLIFY_PIXELS up to OUTLINE_LIMIT,
+# and above that a bitmap rasterized with NumPy in one image item
+DETAIL_LIMIT = 800
+OUTLINE_LIMIT = 2500
+SIMPLIFY_PIXELS = 1.0
+HIT_TOLERANCE = 2  # pixels around a slot that still select it
+SLOT_FILL = "lightblue"
+SLOT_OUTLINE = "blue"
+SELECTED_FILL = "yellow"
+# The same colours as RGB, for the bitmap
+FILL_RGB = (173, 216, 230)
+OUTLINE_RGB = (0, 0, 255)
+BACKGROUND_RGB = (255, 255, 255)
+
+def slot_edges(coords, ring_offsets, polygon_offsets):
+    """Edges of every ring of shapely ragged polygon arrays, as (m, 4) array of
+    x0, y0, x1, y1 and the slot index of each"""
+    ring_slot = np.repeat(np.arange(len(polygon_offsets) - 1), np.diff(polygon_offsets))
+    point_slot = np.repeat(ring_slot, np.diff(ring_offsets))
+    # Rings are closed, so each point but a ring's last starts an edge
+    starts = np.ones(len(coords), dtype=bool)
+    starts[ring_offsets[1:] - 1] = False
+    starts = np.flatnonzero(starts)
+    edges = np.concatenate([coords[starts], coords[starts + 1]], axis=1)
+    return edges, point_slot[starts]
+
+def rasterize(edges, edge_slot, width, height):
+    """(height, width) boolean mask of the pixels whose centres lie inside the
+    polygons with the given edges (in pixel coordinates), by the even-odd rule
+    per slot so holes stay empty. Every edge is intersected with the pixel
+    rows it spans at once, and the spans between each slot's crossings on a
+    row are filled through a running sum."""
+    mask = np.zeros((height, width), dtype=bool)
+    x0, y0, x1, y1 = edges.T
+    low, high = np.minimum(y0, y1), np.maximum(y0, y1)
+    # Rows whose centre y + 0.5 the edge crosses, half-open so shared vertices count once
+    first = np.clip(np.ceil(low - 0.5), 0, height).astype(np.int64)
+    last = np.clip(np.ceil(high - 0.5), 0, height).astype(np.int64)
+    counts = last - first
+    crossing = counts > 0
+    if not crossing.any():
+        return mask
+    x0, y0, x1, y1, first, counts, slot = (a[crossing] for a in (x0, y0, x1, y1, first, counts, edge_slot))
+    edge = np.repeat(np.arange(len(counts)), counts)
+    row = first[edge] + np.arange(len(edge)) - np.repeat(np.cumsum(counts) - counts, counts)
+    t = (row + 0.5 - y0[edge]) / (y1[edge] - y0[edge])
+    x = x0[edge] + t * (x1[edge] - x0[edge])
+    order = np.lexsort((x, row, slot[edge]))
+    x, row = x[order], row[order]
+    # Crossings pair up along each slot's row: fill from each odd one to the next
+    start = np.clip(np.ceil(x[0::2] - 0.5), 0, width).astype(np.int64)
+    stop = np.clip(np.ceil(x[1::2] - 0.5), 0, width).astype(np.int64)
+    rows = row[0::2]
+    filled = stop > start
+    coverage = np.zeros((height, width + 1), dtype=np.int32)
+    np.add.at(coverage, (rows[filled], start[filled]), 1)
+    np.add.at(coverage, (rows[filled], stop[filled]), -1)
+    return np.cumsum(coverage, axis=1)[:, :width] > 0
+
+def ppm_image(mask):
+    """Binary PPM data of mask, filled pixels on its boundary drawn as outline"""
+    inside = np.zeros((mask.shape[0] + 2, mask.shape[1] + 2), dtype=bool)
+    inside[1:-1, 1:-1] = mask
+    interior = mask & inside[:-2, 1:-1] & inside[2:, 1:-1] & inside[1:-1, :-2] & inside[1:-1, 2:]
+    rgb = np.empty(mask.shape + (3,), dtype=np.uint8)
+    rgb[...] = BACKGROUND_RGB
+    rgb[mask] = OUTLINE_RGB
+    rgb[interior] = FILL_RGB
+    header = f"P6 {mask.shape[1]} {mask.shape[0]} 255\n".encode()
+    return header + rgb.tobytes()
+
 class BoardCanvas(tk.Canvas):
+    """Canvas showing the design, with zoom (mouse wheel) and pan (middle
+    button, or dragging empty space). Only slots in view are drawn, at a level
+    of detail that keeps redraws fast however many there are."""
+
     def __init__(self, parent, design=None, **kwargs):
         super().__init__(parent, bg="white", **kwargs)
         self.design = design
         self.selected_slot = None
         self.drag_start_x = 0
         self.drag_start_y = 0
+        self.drag_dx = 0  # pixels the selected slot has been dragged
+        self.drag_dy = 0
+        self.panning = False
         self.slot_objects = {}
         self.app = None  # Will be set from main.py
         self.slot_centers = {}  # Store centers of slots for rotation
-        
+        self.scale = 1.0
+        self.offset_x = DEFAULT_OFFSET
+        self.offset_y = DEFAULT_OFFSET
+        self.redraw_pending = False
+        self.image = None  # the bitmap must stay referenced while shown
+        self.slot_array = np.empty(0, dtype=object)
+        self.coords = np.empty((0, 2))
+        self.ring_offsets = np.zeros(1, dtype=np.int64)
+        self.polygon_offsets = np.zeros(1, dtype=np.int64)
+        self.edges = np.empty((0, 4))
+        self.edge_slot = np.empty(0, dtype=np.int64)
+
         self.bind("<Button-1>", self.on_click)
         self.bind("<B1-Motion>", self.on_drag)
         self.bind("<ButtonRelease-1>", self.on_release)
         self.bind("<KeyPress-r>", self.rotate_selected_slot)
-        
+        self.bind("<ButtonPress-2>", self.start_pan)
+        self.bind("<B2-Motion>", self.pan)
+        self.bind("<MouseWheel>", self.on_wheel)
+        # X11 reports the wheel as buttons 4 and 5
+        self.bind("<Button-4>", lambda event: self.zoom(ZOOM_STEP, event.x, event.y))
+        self.bind("<Button-5>", lambda event: self.zoom(1 / ZOOM_STEP, event.x, event.y))
+        self.bind("<KeyPress-f>", self.fit_view)
+        self.bind("<KeyPress-0>", self.reset_view)
+        self.bind("<Configure>", lambda event: self.request_redraw())
+
     def set_app(self, app):
         """Set the reference to the main application"""
         self.app = app
         if self.design:
             self.update_view()
-    
+
+    def to_world(self, x, y):
+        """Design coordinates of canvas pixel (x, y)"""
+        return (x - self.offset_x) / self.scale, (y - self.offset_y) / self.scale
+
+    def view_bounds(self):
+        """(min_x, min_y, max_x, max_y) of the design area in view"""
+        min_x, min_y = self.to_world(0, 0)
+        max_x, max_y = self.to_world(self.winfo_width(), self.winfo_height())
+        return min_x, min_y, max_x, max_y
+
     def update_view(self):
         """Update the canvas to reflect the current design state"""
-        self.delete("all")
-        
         if not self.design or not self.app:
+            self.delete("all")
             return
-        
-        # Draw each slot
-        self.slot_objects = {}
+        # Geometry is unpacked once per design change, zooming and panning reuse it
+        self.slot_array = np.array(self.design.slots, dtype=object)
         self.slot_centers = {}
-        
-        for i, slot in enumerate(self.design.slots):
-            # Calculate center for rotation
-            centroid = slot.centroid
-            self.slot_centers[i] = (centroid.x, centroid.y)
-            
-            coords = []
-            for x, y in slot.exterior.coords[:-1]:
-                coords.extend([x + 10, y + 10])
-            
-            polygon_id = self.create_polygon(
-                coords, 
-                fill="lightblue", 
-                outline="blue", 
-                tags=f"slot_{i}"
-            )
-            
-            self.slot_objects[polygon_id] = i
-        
-        # If slots exist, draw the calculated bounding box with NO? padding 
+        if len(self.slot_array):
+            _, self.coords, (self.ring_offsets, self.polygon_offsets) = shapely.to_ragged_array(self.slot_array)
+            self.edges, self.edge_slot = slot_edges(self.coords, self.ring_offsets, self.polygon_offsets)
+            centroids = shapely.get_coordinates(shapely.centroid(self.slot_array))
+            self.slot_centers = {i: (x, y) for i, (x, y) in enumerate(centroids)}
+        if self.selected_slot is not None and self.selected_slot >= len(self.slot_array):
+            self.selected_slot = None
+        self.redraw()
+
+    def request_redraw(self):
+        """Redraw once the pending events are handled, so a burst of wheel or
+        motion events costs one redraw"""
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.after_idle(self.redraw)
+
+    def visible_slots(self) -> np.ndarray:
+        """Indices of the slots whose bounds meet the view"""
+        if not len(self.slot_array):
+            return np.empty(0, dtype=np.int64)
+        bounds = self.design.slot_bounds()
+        min_x, min_y, max_x, max_y = self.view_bounds()
+        return np.flatnonzero((bounds[:, 2] >= min_x) & (bounds[:, 0] <= max_x)
+                              & (bounds[:, 3] >= min_y) & (bounds[:, 1] <= max_y))
+
+    def exterior_pixels(self, i) -> list:
+        """Flat canvas coordinates of slot i's exterior, for create_polygon"""
+        ring = self.polygon_offsets[i]
+        points = self.coords[self.ring_offsets[ring]:self.ring_offsets[ring + 1] - 1]
+        return (points * self.scale + (self.offset_x, self.offset_y)).ravel().tolist()
+
+    def redraw(self):
+        """Draw the slots in view at the current zoom and pan"""
+        self.redraw_pending = False
+        self.delete("all")
+        self.slot_objects = {}
+        self.image = None
+        if not self.design or not self.app:
+            return
+        visible = self.visible_slots()
+        if self.selected_slot is not None:
+            # The selection is drawn on top in full detail
+            visible = visible[visible != self.selected_slot]
+        if len(visible) <= DETAIL_LIMIT:
+            for i in visible:
+                polygon_id = self.create_polygon(self.exterior_pixels(i), fill=SLOT_FILL, outline=SLOT_OUTLINE,
+                                                 tags=f"slot_{i}")
+                self.slot_objects[polygon_id] = int(i)
+        elif len(visible) <= OUTLINE_LIMIT:
+            simplified = shapely.simplify(self.slot_array[visible], SIMPLIFY_PIXELS / self.scale)
+            for i, slot in zip(visible, simplified):
+                points = shapely.get_coordinates(slot.exterior)[:-1]
+                if len(points) < 3:
+                    continue
+                points = points * self.scale + (self.offset_x, self.offset_y)
+                polygon_id = self.create_polygon(points.ravel().tolist(), fill=SLOT_FILL, outline=SLOT_OUTLINE,
+                                                 tags=f"slot_{i}")
+                self.slot_objects[polygon_id] = int(i)
+        else:
+            self.draw_bitmap(visible)
+        if self.selected_slot is not None:
+            polygon_id = self.create_polygon(self.exterior_pixels(self.selected_slot), fill=SELECTED_FILL,
+                                             outline=SLOT_OUTLINE, tags=(f"slot_{self.selected_slot}", "selected"))
+            self.slot_objects[polygon_id] = self.selected_slot
+
+        # If slots exist, draw the calculated bounding box with NO? padding
         # since we need to have a border at edge of the actual svg
         if self.design.slots:
             try:
                 # Use the Design's bounding_box property which includes proper padding
                 bb = self.design.bounding_box
-                
+
                 min_x, min_y, max_x, max_y = bb.bounds
-                                
+
                 padded_box = [
-                        (min_x, min_y), (max_x, min_y), 
-                        (max_x, max_y), (min_x, max_y), 
+                        (min_x, min_y), (max_x, min_y),
+                        (max_x, max_y), (min_x, max_y),
                         (min_x, min_y)
                 ]
-                
+
                 coords = []
                 for x, y in padded_box:
-                    coords.extend([x + 10, y + 10])
-                
+                    coords.extend([x * self.scale + self.offset_x, y * self.scale + self.offset_y])
+
                 self.create_polygon(
                     coords,
                     outline="red",
@@ -83,121 +242,159 @@ class BoardCanvas(tk.Canvas):
                 )
             except Exception as e:
                 print(f"Error drawing bounding box: {e}")
-    
+
+    def draw_bitmap(self, visible):
+        """Draw the visible slots as one rasterized image covering the canvas"""
+        width, height = self.winfo_width(), self.winfo_height()
+        if width <= 1 or height <= 1:
+            return
+        edges = self.edges[np.isin(self.edge_slot, visible)]
+        slots = self.edge_slot[np.isin(self.edge_slot, visible)]
+        pixels = edges * self.scale + (self.offset_x, self.offset_y, self.offset_x, self.offset_y)
+        mask = rasterize(pixels, slots, width, height)
+        self.image = tk.PhotoImage(data=ppm_image(mask), format="PPM")
+        self.create_image(0, 0, image=self.image, anchor=tk.NW, tags="bitmap")
+
+    def zoom(self, factor, x, y):
+        """Zoom by factor, keeping the design point under pixel (x, y) in place"""
+        scale = min(max(self.scale * factor, MIN_SCALE), MAX_SCALE)
+        world_x, world_y = self.to_world(x, y)
+        self.scale = scale
+        self.offset_x = x - world_x * scale
+        self.offset_y = y - world_y * scale
+        self.request_redraw()
+        if self.app:
+            self.app.status_var.set(f"Zoom {self.scale:.0%}")
+
+    def on_wheel(self, event):
+        self.zoom(ZOOM_STEP if event.delta > 0 else 1 / ZOOM_STEP, event.x, event.y)
+
+    def start_pan(self, event):
+        self.panning = True
+        self.drag_start_x = event.x
+        self.drag_start_y = event.y
+
+    def pan(self, event):
+        """Move the view with the pointer. What is drawn moves at once, slots
+        coming into view are drawn when the events settle."""
+        dx = event.x - self.drag_start_x
+        dy = event.y - self.drag_start_y
+        self.offset_x += dx
+        self.offset_y += dy
+        self.move("all", dx, dy)
+        self.drag_start_x = event.x
+        self.drag_start_y = event.y
+        self.request_redraw()
+
+    def fit_view(self, event=None):
+        """Zoom and pan so the whole board fills the canvas"""
+        if not self.design or not self.design.slots:
+            return
+        min_x, min_y, max_x, max_y = self.design.bounding_box.bounds
+        width, height = self.winfo_width(), self.winfo_height()
+        scale = min((width - 2 * DEFAULT_OFFSET) / max(max_x - min_x, 1e-9),
+                    (height - 2 * DEFAULT_OFFSET) / max(max_y - min_y, 1e-9))
+        self.scale = min(max(scale, MIN_SCALE), MAX_SCALE)
+        self.offset_x = (width - (max_x - min_x) * self.scale) / 2 - min_x * self.scale
+        self.offset_y = (height - (max_y - min_y) * self.scale) / 2 - min_y * self.scale
+        self.redraw()
+
+    def reset_view(self, event=None):
+        """Back to one pixel per millimetre with the origin at the top left"""
+        self.scale = 1.0
+        self.offset_x = self.offset_y = DEFAULT_OFFSET
+        self.redraw()
+
+    def slot_at(self, x, y):
+        """Index of the topmost slot within HIT_TOLERANCE pixels of canvas
+        pixel (x, y), or None"""
+        if not self.design or not len(self.slot_array):
+            return None
+        world_x, world_y = self.to_world(x, y)
+        tolerance = HIT_TOLERANCE / self.scale
+        bounds = self.design.slot_bounds()
+        near = np.flatnonzero((bounds[:, 0] - tolerance <= world_x) & (bounds[:, 2] + tolerance >= world_x)
+                              & (bounds[:, 1] - tolerance <= world_y) & (bounds[:, 3] + tolerance >= world_y))
+        if not len(near):
+            return None
+        # Later slots are drawn over earlier ones
+        near = near[::-1]
+        distances = shapely.distance(self.slot_array[near], shapely.points(world_x, world_y))
+        k = int(np.argmin(distances))
+        return int(near[k]) if distances[k] <= tolerance else None
+
     def on_click(self, event):
         """Handle mouse click events to select slots"""
-        items = self.find_overlapping(event.x-2, event.y-2, event.x+2, event.y+2)
-        
-        print(f"Items at click point: {items}")
-        
-        for item_id in items:
-            tags = self.gettags(item_id)
-            print(f"Checking item: {item_id}, tags: {tags}")
-            
-            # Check if it's a slot by looking at the tags
-            for tag in tags:
-                if tag.startswith("slot_"):
-                    slot_index = int(tag.split("_")[1])
-                    print(f"Found slot: {slot_index}")
-                    
-                    if self.selected_slot is not None:
-                        self.itemconfig(f"slot_{self.selected_slot}", fill="lightblue")
-                    
-                    # Select this slot
-                    self.selected_slot = slot_index
-                    self.itemconfig(tag, fill="yellow")
-                    
-                    # Save drag start position
-                    self.drag_start_x = event.x
-                    self.drag_start_y = event.y
-                    
-                    if self.app:
-                        self.app.status_var.set(f"Selected slot {slot_index}")
-                    
-                    return
-        
+        self.focus_set()
+        self.drag_start_x = event.x
+        self.drag_start_y = event.y
+        self.drag_dx = self.drag_dy = 0
+        slot_index = self.slot_at(event.x, event.y)
+        self.panning = slot_index is None
+        if slot_index is not None:
+            print(f"Found slot: {slot_index}")
+            # Select this slot
+            self.selected_slot = slot_index
+            self.redraw()
+
+            if self.app:
+                self.app.status_var.set(f"Selected slot {slot_index}")
+            return
+
         # If we get here, no slot was found
         if self.selected_slot is not None:
-            self.itemconfig(f"slot_{self.selected_slot}", fill="lightblue")
             self.selected_slot = None
-            
+            self.redraw()
+
             if self.app:
                 self.app.status_var.set("No slot selected")
-            
-    def item_contains_point(self, item_id, x, y):
-        """Check if the given point is within a canvas item"""
-        bbox = self.bbox(item_id)
-        if not bbox:
-            return False
-            
-        # Simple bounding box check first
-        if not (bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]):
-            return False
-            
-        overlapping = self.find_overlapping(x, y, x, y)
-        return item_id in overlapping
-    
+
     def on_drag(self, event):
-        """Handle dragging of selected slots"""
+        """Handle dragging of selected slots, or panning from empty space"""
+        if self.panning:
+            self.pan(event)
+            return
         if self.selected_slot is not None:
             # movement delta
             dx = event.x - self.drag_start_x
             dy = event.y - self.drag_start_y
-            
+
             if dx == 0 and dy == 0:
                 return  # no movement
-                
-            self.move(f"slot_{self.selected_slot}", dx, dy)
-            
+
+            self.move("selected", dx, dy)
+            self.drag_dx += dx
+            self.drag_dy += dy
+
             self.drag_start_x = event.x
             self.drag_start_y = event.y
-            
-            # DEBUG
-            print(f"Dragging slot {self.selected_slot}: dx={dx}, dy={dy}")
-    
+
     def on_release(self, event):
         """Handle release of mouse to finalize slot movement"""
-        if self.selected_slot is not None:
+        if self.panning:
+            self.panning = False
+            return
+        if self.selected_slot is not None and (self.drag_dx or self.drag_dy):
             slot_index = self.selected_slot
-            
-            tag = f"slot_{slot_index}"
-            items = self.find_withtag(tag)
-            
-            if not items:
-                print(f"Warning: Couldn't find items with tag {tag}")
-                return
-                
-            coords = self.coords(items[0])
-            
-            points = []
-            for i in range(0, len(coords), 2):
-                points.append((coords[i] - 10, coords[i+1] - 10))
-            
+
             # Update the actual slot in the design
             if slot_index < len(self.design.slots):
-                self.design.slots[slot_index] = Polygon(points)
-                
-                centroid = self.design.slots[slot_index].centroid
-                self.slot_centers[slot_index] = (centroid.x, centroid.y)
-                
-                temp_selected = self.selected_slot
+                self.design.slots[slot_index] = shapely_translate(
+                    self.design.slots[slot_index], self.drag_dx / self.scale, self.drag_dy / self.scale)
+                self.drag_dx = self.drag_dy = 0
+                if self.app:
+                    self.app.record_history()
                 self.update_view()
-                
-                self.selected_slot = temp_selected
-                self.itemconfig(f"slot_{temp_selected}", fill="yellow")
-                
-                # DEBUG
-                print(f"Updated slot {slot_index} with new coordinates")
             else:
                 print(f"Error: Slot index {slot_index} out of range")
-    
+
     def rotate_selected_slot(self, event=None, angle=15):
         """Rotate the selected slot by the specified angle in degrees"""
         if self.selected_slot is None:
             return
-            
+
         slot_index = self.selected_slot
-        
+
         if slot_index < len(self.design.slots):
             try:
                 current_polygon = self.design.slots[slot_index]
@@ -206,26 +403,26 @@ class BoardCanvas(tk.Canvas):
 
                 # update the view
                 self.design.slots[slot_index] = rotated_shape
-                temp_selected = self.selected_slot
+                if self.app:
+                    self.app.record_history()
                 self.update_view()
-                
-                self.selected_slot = temp_selected
-                self.itemconfig(f"slot_{temp_selected}", fill="yellow")
-                
+
                 if self.app:
                     self.app.status_var.set(f"Rotated slot {slot_index} by {angle} degrees")
-                    
+
                 print(f"Rotated slot {slot_index} by {angle} degrees")
             except Exception as e:
                 print(f"Error rotating slot: {e}")
                 if self.app:
                     self.app.status_var.set(f"Error rotating slot: {e}")
-    
+
     def add_slot(self, polygon):
         """Add a new slot to the design"""
         if self.design:
             self.design.slots.append(polygon)
+            if self.app:
+                self.app.record_history()
             self.update_view()
-            
+
             # DEBUG
             print(f"Added new slot, total: {len(self.design.slots)}")